@@ -33,6 +33,9 @@ from app.db.base import Base  # import your Base
 import app.models.user
 import app.models.document
 import app.models.chat
+import app.models.ingest_job
+import app.models.embedding_cache
+import app.models.corpus_version
 
 # target metadata for 'autogenerate'
 target_metadata = Base.metadata
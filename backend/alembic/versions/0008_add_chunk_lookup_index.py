@@ -0,0 +1,26 @@
+"""add composite index for chunk hydration
+
+Revision ID: 0008_add_chunk_lookup_index
+Revises: 0007_add_org_to_usage_logs
+Create Date: 2026-10-18 09:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008_add_chunk_lookup_index'
+down_revision = '0007_add_org_to_usage_logs'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_document_chunks_org_doc_chunk',
+        'document_chunks',
+        ['organization_id', 'document_id', 'chunk_index'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_document_chunks_org_doc_chunk', table_name='document_chunks')
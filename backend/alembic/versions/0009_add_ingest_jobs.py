@@ -0,0 +1,38 @@
+"""add ingest_jobs queue table
+
+Revision ID: 0009_add_ingest_jobs
+Revises: 0008_add_chunk_lookup_index
+Create Date: 2026-10-18 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0009_add_ingest_jobs'
+down_revision = '0008_add_chunk_lookup_index'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ingest_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True, index=True),
+        sa.Column('organization_id', sa.Integer(), sa.ForeignKey('organizations.id'), nullable=True, index=True),
+        sa.Column('user_id', sa.Integer(), nullable=True, index=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='queued', index=True),
+        sa.Column('stage', sa.String(), nullable=True),
+        sa.Column('files', sa.Text(), nullable=False),
+        sa.Column('documents_done', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('chunks_done', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('worker', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('ingest_jobs')
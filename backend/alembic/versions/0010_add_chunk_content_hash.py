@@ -0,0 +1,34 @@
+"""add content_hash / is_duplicate to document_chunks
+
+Revision ID: 0010_add_chunk_content_hash
+Revises: 0009_add_ingest_jobs
+Create Date: 2026-10-18 14:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0010_add_chunk_content_hash'
+down_revision = '0009_add_ingest_jobs'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.add_column('document_chunks', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column(
+        'document_chunks',
+        sa.Column('is_duplicate', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+    op.create_index('ix_document_chunks_org_hash', 'document_chunks', ['organization_id', 'content_hash'])
+    # backfill existing rows; must match embedding_cache.content_hash (sha256 of UTF-8)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "UPDATE document_chunks SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')"
+        )
+
+
+def downgrade():
+    op.drop_index('ix_document_chunks_org_hash', table_name='document_chunks')
+    op.drop_column('document_chunks', 'is_duplicate')
+    op.drop_column('document_chunks', 'content_hash')
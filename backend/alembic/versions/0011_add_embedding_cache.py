@@ -0,0 +1,28 @@
+"""add embedding_cache table
+
+Revision ID: 0011_add_embedding_cache
+Revises: 0010_add_chunk_content_hash
+Create Date: 2026-10-18 15:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0011_add_embedding_cache'
+down_revision = '0010_add_chunk_content_hash'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.create_table(
+        'embedding_cache',
+        sa.Column('model_name', sa.String(), primary_key=True),
+        sa.Column('content_hash', sa.String(length=64), primary_key=True),
+        sa.Column('embedding', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_table('embedding_cache')
@@ -0,0 +1,24 @@
+"""add character offsets to document_chunks
+
+Revision ID: 0012_add_chunk_offsets
+Revises: 0011_add_embedding_cache
+Create Date: 2026-10-18 16:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0012_add_chunk_offsets'
+down_revision = '0011_add_embedding_cache'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.add_column('document_chunks', sa.Column('char_start', sa.Integer(), nullable=True))
+    op.add_column('document_chunks', sa.Column('char_end', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('document_chunks', 'char_end')
+    op.drop_column('document_chunks', 'char_start')
@@ -0,0 +1,34 @@
+"""add a full-text search vector to document_chunks
+
+Revision ID: 0013_add_chunk_fulltext
+Revises: 0012_add_chunk_offsets
+Create Date: 2026-10-18 18:00:00.000000
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0013_add_chunk_fulltext'
+down_revision = '0012_add_chunk_offsets'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    # PostgreSQL only: other backends fall back to vector-only retrieval.
+    # The text search config must match app.rag.hybrid.FTS_CONFIG.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(
+        "ALTER TABLE document_chunks ADD COLUMN content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+    )
+    op.execute(
+        "CREATE INDEX ix_document_chunks_content_tsv ON document_chunks USING GIN (content_tsv)"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_document_chunks_content_tsv")
+    op.execute("ALTER TABLE document_chunks DROP COLUMN IF EXISTS content_tsv")
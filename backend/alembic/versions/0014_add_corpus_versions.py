@@ -0,0 +1,27 @@
+"""add corpus_versions table
+
+Revision ID: 0014_add_corpus_versions
+Revises: 0013_add_chunk_fulltext
+Create Date: 2026-10-18 19:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0014_add_corpus_versions'
+down_revision = '0013_add_chunk_fulltext'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.create_table(
+        'corpus_versions',
+        sa.Column('organization_key', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_table('corpus_versions')
@@ -0,0 +1,24 @@
+"""add kind and document_id to ingest_jobs
+
+Revision ID: 0015_add_ingest_job_kind
+Revises: 0014_add_corpus_versions
+Create Date: 2026-10-18 21:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0015_add_ingest_job_kind'
+down_revision = '0014_add_corpus_versions'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.add_column('ingest_jobs', sa.Column('kind', sa.String(), nullable=False, server_default='ingest'))
+    op.add_column('ingest_jobs', sa.Column('document_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('ingest_jobs', 'document_id')
+    op.drop_column('ingest_jobs', 'kind')
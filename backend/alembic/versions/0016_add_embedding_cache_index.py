@@ -0,0 +1,21 @@
+"""index embedding_cache.created_at for pruning
+
+Revision ID: 0016_add_embedding_cache_index
+Revises: 0015_add_ingest_job_kind
+Create Date: 2026-10-18 22:00:00.000000
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0016_add_embedding_cache_index'
+down_revision = '0015_add_ingest_job_kind'
+branch_labels = None
+depend_on = None
+
+
+def upgrade():
+    op.create_index('ix_embedding_cache_created_at', 'embedding_cache', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_embedding_cache_created_at', table_name='embedding_cache')
@@ -1,14 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Request, Body
-from io import BytesIO
-
-# optional import for PDF support; will be None if library missing
-try:
-    from PyPDF2 import PdfReader
-except ImportError:
-    PdfReader = None
+from fastapi import APIRouter, Depends, HTTPException, Header, UploadFile, File, Form, Request, Body
 from pydantic import BaseModel, root_validator
 from typing import List, Optional, Tuple
-from app.services.ingestion_service import IngestionService
+from starlette.concurrency import run_in_threadpool
+from app.services.ingest_jobs import enqueue_job, job_status
 from app.core.security import decode_access_token
 from app.db.session import get_db
 from sqlalchemy.orm import Session
@@ -63,6 +57,7 @@ async def ingest(
     request: Request,
     files: Optional[List[UploadFile]] = File(None),
     user: User = Depends(admin_required),
+    db: Session = Depends(get_db),
 ):
     # read multipart/form-data for texts
     import logging, traceback
@@ -77,76 +72,39 @@ async def ingest(
                 if key == "texts":
                     values.append(val)
             texts = values or None
-        logger.info(f"parsed texts from form: {texts}")
-
-        # assemble structured documents list for ingestion service
-        docs: List[dict] = []
-        if texts:
-            for t in texts:
-                docs.append({"text": t, "source": None, "filename": None, "page": None})
-
-        # process files
-        if files:
-            for f in files:
-                filename = f.filename
-                lower = filename.lower()
-                data = await f.read()
-                if lower.endswith(".pdf") and PdfReader is not None:
-                    try:
-                        reader = PdfReader(BytesIO(data))
-                        for page_no, page in enumerate(reader.pages, start=1):
-                            txt = page.extract_text() or ""
-                            docs.append({"text": txt, "source": filename, "filename": filename, "page": page_no})
-                    except Exception as e:
-                        raise HTTPException(status_code=400, detail=f"PDF parsing failed: {e}")
-                else:
-                    try:
-                        txt = data.decode("utf-8")
-                    except Exception:
-                        txt = data.decode("latin-1", errors="ignore")
-                    docs.append({"text": txt, "source": filename, "filename": filename, "page": None})
-
-        if not docs:
+        logger.info(f"parsed texts: {len(texts or [])}")
+
+        if not texts and not files:
             raise HTTPException(status_code=400, detail="No content provided")
 
-        service = IngestionService()
+        # persist the upload and hand it to the background workers; the
+        # request returns before any parsing or embedding happens
         org_id = getattr(user, "organization_id", None)
-        service.ingest_documents(docs, organization_id=org_id)
-        return {"status": "ok", "ingested": len(docs)}
+        uploads = [(f.filename, f.file) for f in files or []]
+        try:
+            job = await run_in_threadpool(
+                enqueue_job, db, texts or [], uploads, organization_id=org_id, user_id=user.id
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        return {"status": "queued", "job_id": job.id}
 
     except Exception as exc:
         logger.error("ingest route failed: %s", traceback.format_exc())
         raise
 
-    # file uploads: support PDF, TXT, raw text
-    if files:
-        for f in files:
-            filename = f.filename
-            lower = filename.lower()
-            data = await f.read()
-            if lower.endswith(".pdf") and PdfReader is not None:
-                # extract text page by page
-                try:
-                    reader = PdfReader(BytesIO(data))
-                    for page_no, page in enumerate(reader.pages, start=1):
-                        txt = page.extract_text() or ""
-                        docs.append({"text": txt, "source": filename, "filename": filename, "page": page_no})
-                except Exception as e:
-                    raise HTTPException(status_code=400, detail=f"PDF parsing failed: {e}")
-            else:
-                # treat as simple text
-                try:
-                    txt = data.decode("utf-8")
-                except Exception:
-                    txt = data.decode("latin-1", errors="ignore")
-                docs.append({"text": txt, "source": filename, "filename": filename, "page": None})
-
-    if not docs:
-        raise HTTPException(status_code=400, detail="No content provided")
 
-    service = IngestionService()
-    service.ingest_documents(docs)
-    return {"status": "ok", "ingested": len(docs)}
+@router.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: int, user: User = Depends(admin_required), db: Session = Depends(get_db)):
+    """Stage, progress counters, throughput and error of an ingestion job."""
+    from app.models.ingest_job import IngestJob
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    org_id = getattr(user, "organization_id", None)
+    if org_id is not None and job.organization_id != org_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
 
 
 @router.get("/documents")
@@ -178,6 +136,65 @@ def list_documents(user: User = Depends(admin_required), db: Session = Depends(g
     return out
 
 
+def _get_owned_document(db: Session, doc_id: int, user: User):
+    """Load a document, enforcing that org-scoped admins only touch their own."""
+    from app.models.document import Document
+    doc = db.query(Document).filter(Document.id == doc_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    org_id = getattr(user, "organization_id", None)
+    if org_id is not None and doc.organization_id != org_id:
+        raise HTTPException(status_code=403, detail="Cannot modify document from another organization")
+    return doc
+
+
+@router.delete("/documents/{doc_id}")
+def delete_document(doc_id: int, user: User = Depends(admin_required), db: Session = Depends(get_db)):
+    """Queue the deletion of a document, its chunks and its vectors.
+
+    The ingest worker holding the FAISS writer does the work; poll
+    ``GET /ingest/jobs/{job_id}`` for the outcome.
+    """
+    doc = _get_owned_document(db, doc_id, user)
+    job = enqueue_job(
+        db, [], [], organization_id=doc.organization_id, user_id=user.id, kind="delete", document_id=doc.id
+    )
+    return {"status": "queued", "job_id": job.id, "document_id": doc.id}
+
+
+@router.put("/documents/{doc_id}")
+def replace_document(
+    doc_id: int,
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    user: User = Depends(admin_required),
+    db: Session = Depends(get_db),
+):
+    """Queue the re-ingestion of a document from new text or an uploaded file, keeping its id.
+
+    PDF pages are concatenated, since the document is replaced as a whole.
+    Like deletions, replacements run in the ingest worker holding the FAISS
+    writer.
+    """
+    doc = _get_owned_document(db, doc_id, user)
+    if file is None and not text:
+        raise HTTPException(status_code=400, detail="No content provided")
+    uploads = [(file.filename, file.file)] if file is not None else []
+    try:
+        job = enqueue_job(
+            db,
+            [text] if file is None else [],
+            uploads,
+            organization_id=doc.organization_id,
+            user_id=user.id,
+            kind="replace",
+            document_id=doc.id,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"status": "queued", "job_id": job.id, "document_id": doc.id}
+
+
 class UserOut(BaseModel):
     id: int
     email: str
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, Header, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 from app.core.security import decode_access_token
@@ -11,6 +12,10 @@ from app.models.document import Document
 from app.models.usage_log import UsageLog
 from app.services.openai_service import OpenAIService
 from app.services.rag_service import RAGService
+from app.services import corpus_version, registry
+from app.services.answer_cache import CachedAnswer
+from app.services.context_budget import pack_context
+import asyncio
 import json
 import time
 
@@ -70,17 +75,55 @@ def _parse_user_id(sub: str | None) -> int | None:
         return None
 
 
-@router.post("/stream")
-@limiter.limit("10/minute")
-def chat_stream(
-    request: Request,
-    payload: ChatIn,
-    db: Session = Depends(get_db),
-    user_payload: dict = Depends(get_current_user),
-):
-    # parse user id once
-    user_id = _parse_user_id(user_payload.get("sub")) if user_payload else None
-    org_id = user_payload.get("org_id") if user_payload else None
+def _record_usage(db: Session, user_id: int | None, org_id: int | None, tokens_used: int | None, model: str):
+    """Deduct credits and write a ``UsageLog`` row for one completion.
+
+    Credits are floored at zero since the tokens have already been spent by
+    the time a streamed completion finishes.  Failures are rolled back and
+    swallowed so bookkeeping never breaks the chat flow.
+    """
+    cost_per = settings.MODEL_PRICING.get(model, 0.0)
+    cost = (tokens_used or 0) * cost_per
+    if user_id:
+        try:
+            u = db.query(User).filter(User.id == user_id).first()
+            if u:
+                # deduct tokens and update aggregates
+                u.credits = max((u.credits or 0) - (tokens_used or 0), 0)
+                u.total_tokens_used = (u.total_tokens_used or 0) + (tokens_used or 0)
+                u.total_cost = (u.total_cost or 0) + cost
+                db.add(u)
+                db.commit()
+        except Exception:
+            db.rollback()
+    # log the usage event (anonymous usage is logged with no user_id)
+    try:
+        ul = UsageLog(
+            user_id=user_id or None,
+            tokens_used=tokens_used,
+            cost=cost,
+            model_name=model,
+            organization_id=org_id,
+        )
+        db.add(ul)
+        db.commit()
+    except Exception:
+        db.rollback()
+
+
+def _start_turn(db: Session, payload: ChatIn, user_id: int | None, org_id: int | None):
+    """Validate the conversation, load its history and store the user message.
+
+    Returns ``(conversation_id, history_texts)``; the history holds the
+    earlier messages only, not the one just stored.  This is plain blocking
+    SQLAlchemy work, so the async route runs it on the threadpool.
+    """
+    # the response is streamed, so credits can no longer be refused after
+    # generation; reject exhausted accounts up front instead.
+    if user_id:
+        u = db.query(User).filter(User.id == user_id).first()
+        if u and (u.credits or 0) <= 0:
+            raise HTTPException(status_code=402, detail="Insufficient credits")
     # Ensure conversation
     conv_id = payload.conversation_id
     if conv_id:
@@ -98,36 +141,131 @@ def chat_stream(
         db.refresh(conv)
         conv_id = conv.id
 
+    # gather the last 10 earlier messages for context, before this one is
+    # stored: the prompt carries the new message as the question
+    history_msgs = (
+        db.query(Message)
+        .filter(Message.conversation_id == conv_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(10)
+        .all()
+    )
+    history = [m.content for m in reversed(history_msgs)]
+
     # Save user message
     user_msg = Message(
         conversation_id=conv_id,
-        user_id=_parse_user_id(user_payload.get("sub")) if user_payload else None,
+        user_id=user_id,
         role="user",
         content=payload.message,
     )
     db.add(user_msg)
     db.commit()
+    return conv_id, history
 
-    # gather last 10 messages for context
-    history_msgs = (
-        db.query(Message)
-        .filter(Message.conversation_id == conv_id)
-        .order_by(Message.created_at.desc())
-        .limit(10)
-        .all()
+
+def _save_assistant_message(db: Session, conv_id: int, assistant_text: str):
+    assistant_msg = Message(
+        conversation_id=conv_id, user_id=0, role="assistant", content=assistant_text
     )
-    history_texts = [m.content for m in reversed(history_msgs)]
+    db.add(assistant_msg)
+    db.commit()
+
+
+def _finish_turn(
+    db: Session,
+    conv_id: int,
+    assistant_text: str,
+    user_id: int | None,
+    org_id: int | None,
+    tokens_used: int | None,
+    model: str,
+):
+    """Persist the assistant message and do credit bookkeeping."""
+    _save_assistant_message(db, conv_id, assistant_text)
+    # credit bookkeeping and usage logging happen only after generation succeeded
+    _record_usage(db, user_id, org_id, tokens_used, model)
+
+
+def _final_payload(assistant_text: str, citations: List[dict]) -> dict:
+    """Answer with numbered source footnotes appended, plus the citations."""
+    answer_text = assistant_text
+    if citations:
+        footnotes = []
+        for c in citations:
+            label = c.get('source') or c.get('filename') or 'unknown'
+            page = c.get('page')
+            if page is not None:
+                label = f"{label} Page {page}"
+            footnotes.append(f"[{c['id']}] {label}")
+        answer_text = answer_text + "\n\n" + "\n".join(footnotes)
+    return {"answer": answer_text, "sources": citations}
+
+
+async def _cached_answer(message: str, org_id: int | None):
+    """Look ``message`` up in the semantic answer cache.
+
+    Returns ``(entry_or_None, embedding, corpus_version)``; the embedding and
+    version are needed again to store a fresh answer.
+    """
+    cache = registry.get_answer_cache()
+    if cache is None:
+        return None, None, None
+    emb = await asyncio.wrap_future(registry.get_query_batcher().submit(message))
+    version = await run_in_threadpool(corpus_version.current, org_id)
+    if version is None:
+        return None, None, None
+    return cache.lookup(org_id, emb, version), emb, version
+
+
+@router.post("/stream")
+@limiter.limit("10/minute")
+async def chat_stream(
+    request: Request,
+    payload: ChatIn,
+    db: Session = Depends(get_db),
+    user_payload: dict = Depends(get_current_user),
+):
+    # parse user id once
+    user_id = _parse_user_id(user_payload.get("sub")) if user_payload else None
+    org_id = user_payload.get("org_id") if user_payload else None
+    conv_id, history = await run_in_threadpool(_start_turn, db, payload, user_id, org_id)
+
+    # only a conversation's first question is answered from (or added to)
+    # the answer cache: follow-ups depend on the earlier turns
+    cached, query_emb, version = None, None, None
+    if not history:
+        cached, query_emb, version = await _cached_answer(payload.message, org_id)
+    if cached is not None:
+
+        async def cached_stream():
+            yield f"data: {json.dumps({'conversation_id': conv_id})}\n\n"
+            yield f"data: {json.dumps({'context_meta': cached.context_meta})}\n\n"
+            # replay the original stream chunks so clients see the same framing
+            for chunk in cached.parts:
+                yield f"data: {chunk}\n\n"
+            # no completion was made, so there is no usage to record
+            await run_in_threadpool(_save_assistant_message, db, conv_id, cached.answer)
+            yield f"data: {json.dumps(_final_payload(cached.answer, cached.citations))}\n\n"
+
+        return StreamingResponse(cached_stream(), media_type="text/event-stream")
 
-    rag = RAGService()
-    hits = rag.search(payload.message, top_k=5, org_id=org_id)
+    openai = OpenAIService()
+    rag = RAGService(openai=openai)
+    # an answer built from a FAISS snapshot older than ``version`` must not
+    # be stored under it
+    cacheable = query_emb is not None and rag.vs.snapshot_version(org_id) == version
+    hits = await rag.asearch(payload.message, top_k=5, org_id=org_id, db=db, emb=query_emb)
     # hits -> list of dicts with content, document_id, chunk_index, score, source, filename, page
 
-    contexts: List[str] = []
-    if history_texts:
-        contexts.extend(history_texts)
+    packed = await run_in_threadpool(
+        pack_context, openai, payload.message, history, [h["content"] for h in hits]
+    )
+    contexts = packed.contexts
+    # only chunks that made it into the prompt are reported and cited
+    hits = [hits[i] for i in packed.chunk_indexes]
     chunk_meta = []
     for h in hits:
-        contexts.append(h["content"])
         chunk_meta.append(
             {
                 "document_id": h["document_id"],
@@ -154,95 +292,33 @@ def chat_stream(
                 }
             )
 
-    openai = OpenAIService()
-    # measure execution time for the generation
-    start_ts = time.time()
-    assistant_text, tokens_used = openai.chat_with_context(payload.message, contexts)
-    elapsed_ms = int((time.time() - start_ts) * 1000)
-
-    # persist assistant message
-    assistant_msg = Message(
-        conversation_id=conv_id, user_id=0, role="assistant", content=assistant_text
-    )
-    db.add(assistant_msg)
-    db.commit()
-
-    # credit bookkeeping and usage logging happen only after generation succeeded
-    if user_id:
-        try:
-            u = db.query(User).filter(User.id == user_id).first()
-            if u:
-                # compute cost based on pricing configuration
-                cost_per = settings.MODEL_PRICING.get(openai.chat_model, 0.0)
-                cost = (tokens_used or 0) * cost_per
-
-                # ensure enough credits remain
-                remaining = (u.credits or 0) - (tokens_used or 0)
-                if remaining < 0:
-                    return JSONResponse(status_code=402, content={"detail": "Insufficient credits"})
-
-                # deduct tokens and update aggregates
-                u.credits = remaining
-                u.total_tokens_used = (u.total_tokens_used or 0) + (tokens_used or 0)
-                u.total_cost = (u.total_cost or 0) + cost
-                db.add(u)
-                db.commit()
-
-                # log the usage event
-                try:
-                    ul = UsageLog(
-                        user_id=user_id,
-                        tokens_used=tokens_used,
-                        cost=cost,
-                        model_name=openai.chat_model,
-                        organization_id=org_id,
-                    )
-                    db.add(ul)
-                    db.commit()
-                except Exception:
-                    db.rollback()
-        except Exception:
-            # don't let bookkeeping failures break the chat flow
-            db.rollback()
-    else:
-        # log anonymous usage as well (no user_id)
-        try:
-            cost_per = settings.MODEL_PRICING.get(openai.chat_model, 0.0)
-            cost = (tokens_used or 0) * cost_per
-            ul = UsageLog(
-                user_id=None,
-                tokens_used=tokens_used,
-                cost=cost,
-                model_name=openai.chat_model,
-                organization_id=org_id,
-            )
-            db.add(ul)
-            db.commit()
-        except Exception:
-            db.rollback()
-
-    def event_stream():
+    async def event_stream():
         # send conversation id for client to associate
         yield f"data: {json.dumps({'conversation_id': conv_id})}\n\n"
         # also include context metadata for backward compatibility
         yield f"data: {json.dumps({'context_meta': chunk_meta})}\n\n"
-        for chunk in openai.stream_chat_with_context(payload.message, contexts):
+        # single generation call: tokens are forwarded as they arrive and
+        # accumulated for persistence once the stream completes
+        usage: dict = {}
+        parts: List[str] = []
+        async for chunk in openai.astream_chat_with_context(payload.message, contexts, usage=usage):
+            parts.append(chunk)
             yield f"data: {chunk}\n\n"
+        assistant_text = "".join(parts)
+        await run_in_threadpool(
+            _finish_turn, db, conv_id, assistant_text, user_id, org_id, usage.get("total_tokens"), openai.chat_model
+        )
+        if cacheable and assistant_text:
+            registry.get_answer_cache().store(
+                org_id,
+                query_emb,
+                version,
+                CachedAnswer(payload.message, assistant_text, parts, citations, chunk_meta),
+            )
 
         # final structured citation payload (kept at end)
         # append numbered footnotes to the answer text
-        answer_text = assistant_text
-        if citations:
-            footnotes = []
-            for c in citations:
-                label = c.get('source') or c.get('filename') or 'unknown'
-                page = c.get('page')
-                if page is not None:
-                    label = f"{label} Page {page}"
-                footnotes.append(f"[{c['id']}] {label}")
-            answer_text = answer_text + "\n\n" + "\n".join(footnotes)
-        final = {"answer": answer_text, "sources": citations}
-        yield f"data: {json.dumps(final)}\n\n"
+        yield f"data: {json.dumps(_final_payload(assistant_text, citations))}\n\n"
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
@@ -11,9 +11,136 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     SECRET_KEY: str
     FAISS_DIR: str = "./faiss_data"
+    # seconds between background snapshots of the in-memory FAISS index
+    FAISS_PERSIST_INTERVAL_SECONDS: float = 30.0
+    # FAISS index type per organization partition: flat, ivfflat, ivfpq or
+    # hnswflat.  Partitions stay flat until FAISS_TRAIN_MIN_VECTORS.
+    FAISS_INDEX_TYPE: str = "flat"
+    FAISS_TRAIN_MIN_VECTORS: int = 10000
+    FAISS_IVF_NLIST: int = 0  # 0 = derive from partition size
+    FAISS_NPROBE: int = 16
+    FAISS_PQ_M: int = 16
+    FAISS_PQ_NBITS: int = 8
+    FAISS_HNSW_M: int = 32
+    FAISS_EF_SEARCH: int = 64
+    # mmap IVF snapshots so gunicorn workers share one copy in page cache
+    FAISS_MMAP: bool = True
+    # how often (seconds) searches check for snapshots written by the FAISS
+    # writer process; 0 disables the check
+    FAISS_RELOAD_CHECK_SECONDS: float = 2.0
+    # rebuild a partition once this share of its vectors are deleted
+    FAISS_COMPACT_TOMBSTONE_RATIO: float = 0.2
     EMBEDDING_DIM: int = 384
+    # chunks per ingestion batch: embedded, inserted and indexed together
+    INGEST_BATCH_SIZE: int = 128
+    # batches buffered between ingestion pipeline stages
+    INGEST_QUEUE_SIZE: int = 4
+    # large text uploads are ingested as documents of about this many characters
+    INGEST_TEXT_SEGMENT_CHARS: int = 200000
+    # background ingestion: worker processes started per web worker (0 = run
+    # ``python -m app.services.ingest_jobs`` separately; only the one holding
+    # the FAISS writer lock runs jobs, the rest are standbys), upload spool
+    # dir, queue poll interval, how often a running job's heartbeat is
+    # written and the heartbeat timeout before a running job is failed
+    INGEST_WORKERS: int = 1
+    INGEST_UPLOAD_DIR: str = "./faiss_data/uploads"
+    INGEST_POLL_SECONDS: float = 1.0
+    INGEST_JOB_HEARTBEAT_SECONDS: float = 30.0
+    INGEST_JOB_STALE_SECONDS: int = 600
+    # uploads larger than this are rejected (0 = no limit)
+    INGEST_MAX_FILE_BYTES: int = 100 * 1024 * 1024
+    # PDF extraction: pool processes (0 = inline), pages per pool task and
+    # the largest page count accepted (0 = no limit)
+    PDF_EXTRACT_WORKERS: int = 2
+    PDF_PAGES_PER_TASK: int = 8
+    PDF_MAX_PAGES: int = 2000
+    # stream chunk rows with COPY when the driver is psycopg2
+    INGEST_USE_COPY: bool = True
+    # embedding cache keyed by (model, text hash): in-process LRU entries
+    # (0 disables), whether to back it with the embedding_cache table (chunk
+    # embeddings only) and the rows the ingest worker prunes that table to,
+    # oldest first (0 = no limit)
+    EMBEDDING_CACHE_SIZE: int = 50000
+    EMBEDDING_CACHE_PERSIST: bool = True
+    EMBEDDING_CACHE_MAX_ROWS: int = 1000000
+    # duplicate chunk handling per organization: "link" stores the row but
+    # indexes the text once, "skip" drops the row, "off" keeps everything
+    INGEST_DEDUP_MODE: str = "link"
+    # chunking: "tokens" sizes chunks with the embedder's tokenizer (keep
+    # CHUNK_MAX_TOKENS within the model's max_seq_length minus 2 special
+    # tokens); "words" is the legacy 700/100 whitespace-word window
+    CHUNK_STRATEGY: str = "tokens"
+    CHUNK_MAX_TOKENS: int = 200
+    CHUNK_OVERLAP_TOKENS: int = 40
+    # embedding: texts per encode batch (inputs are length-sorted first),
+    # torch intra-op threads (0 = torch default) and unit-normalization
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_TORCH_THREADS: int = 0
+    EMBEDDING_NORMALIZE: bool = True
+    # embedding backend: "torch" (sentence-transformers) or "onnx" (ONNX
+    # Runtime on a model exported under EMBEDDING_ONNX_DIR on first use,
+    # int8-quantized when EMBEDDING_ONNX_QUANTIZE); 0 threads = ORT default
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_DIR: str = "./faiss_data/onnx"
+    EMBEDDING_ONNX_QUANTIZE: bool = False
+    EMBEDDING_ONNX_THREADS: int = 0
+    # metric for new FAISS indexes: "ip" (inner product; needs normalized
+    # embeddings) or "l2".  Existing indexes keep theirs until rebuilt.
+    FAISS_METRIC: str = "ip"
+    # sentence-transformers model used for chunk and query embeddings
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
     PROJECT_NAME: str = "Aadya - Nexora AI"
     GROQ_API_KEY: str  # key for Groq chat provider
+    GROQ_BASE_URL: str = "https://api.groq.com/openai/v1"
+    # connection pool for the shared async Groq client
+    GROQ_MAX_CONNECTIONS: int = 100
+    GROQ_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    GROQ_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    # threads for embedding + FAISS work offloaded from async routes
+    RETRIEVAL_EXECUTOR_WORKERS: int = 4
+    # query embeddings of concurrent requests are encoded together: up to
+    # QUERY_BATCH_MAX_SIZE queries arriving within QUERY_BATCH_MAX_WAIT_MS
+    # of the first one (a max size of 1 disables batching)
+    QUERY_BATCH_MAX_SIZE: int = 32
+    QUERY_BATCH_MAX_WAIT_MS: float = 3.0
+    # hybrid retrieval (PostgreSQL only): a full-text query runs next to the
+    # FAISS search, each returning HYBRID_CANDIDATES hits (at least top_k),
+    # and the rankings are fused with 1 / (HYBRID_RRF_K + rank)
+    HYBRID_SEARCH: bool = True
+    HYBRID_CANDIDATES: int = 20
+    HYBRID_RRF_K: int = 60
+    # optional cross-encoder re-ranking: RERANK_CANDIDATES retrieved chunks
+    # are scored in one batch and the best RERANK_TOP_N (at most top_k) are
+    # kept; when the measured cost would exceed RERANK_BUDGET_MS (0 = no
+    # limit) only the top candidates that fit are scored
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 20
+    RERANK_TOP_N: int = 3
+    RERANK_BUDGET_MS: float = 150.0
+    RERANK_MAX_LENGTH: int = 256
+    # semantic answer cache for the first question of a conversation: an
+    # answer is reused when a cached question of the same organization has
+    # cosine similarity >= ANSWER_CACHE_THRESHOLD, is younger than the TTL
+    # and the corpus has not changed since (per organization, per process)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    # how long a process trusts its last read of an organization's corpus
+    # version (bumped by every ingest and deletion)
+    CORPUS_VERSION_CHECK_SECONDS: float = 1.0
+    # per-process cache of search results keyed by (org, normalized query,
+    # top_k) and valid only at the corpus version it was computed at
+    # (0 entries disables)
+    RESULT_CACHE_SIZE: int = 2048
+    RESULT_CACHE_TTL_SECONDS: float = 300.0
+    # prompt assembly: token budget (local tokenizer) for the whole prompt,
+    # the largest share of it conversation history may use, and the
+    # smallest truncated item worth keeping
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_HISTORY_SHARE: float = 0.3
+    CONTEXT_MIN_ITEM_TOKENS: int = 32
     # allowed CORS origins (comma-separated or list in env)
     ALLOWED_ORIGINS: str = "http://localhost:3000"
 
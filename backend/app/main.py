@@ -11,12 +11,13 @@ from app.routers import admin_auth
 # bring in centralized logging
 from app.core.logging import get_logger
 import time
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 import uuid
 import os
 
-# local vector store class for health/startup/shutdown
-from app.rag.vector_store import FaissVectorStore
+# shared embedder / LLM client / vector store, warmed up on startup
+from app.services import registry
+from app.services import ingest_jobs
 
 # rate limiting
 from app.core.limiter import limiter
@@ -26,6 +27,9 @@ logger = get_logger(__name__)
 # prometheus metrics
 REQUEST_COUNT = Counter("app_requests_total", "Total HTTP requests", ["method", "endpoint"])
 REQUEST_LATENCY = Histogram("app_request_latency_seconds", "Request latency", ["endpoint"])
+MODEL_WARMUP_SECONDS = Gauge(
+    "app_model_warmup_seconds", "Time spent loading shared models at startup", multiprocess_mode="max"
+)
 
 # limiter is already configured in core/limiter and imported above
 
@@ -143,6 +147,13 @@ async def log_failed_auth(request: Request, call_next):
 
 @app.get("/metrics")
 def metrics():
+    # ingest workers and gunicorn workers are separate processes; with
+    # PROMETHEUS_MULTIPROC_DIR set, report the samples of all of them
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry_ = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry_)
+        return Response(generate_latest(registry_), media_type=CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
@@ -166,10 +177,10 @@ def health():
         fdir = settings.FAISS_DIR
         details["faiss_dir_exists"] = os.path.exists(fdir)
         if details["faiss_dir_exists"]:
-            # try to instantiate the vector store; this will create an empty
-            # index if none is present.
-            store = FaissVectorStore()
-            details["faiss_index_size"] = store.index.ntotal
+            # report on the shared in-memory store rather than re-reading
+            # the index from disk on every probe.
+            store = registry.get_vector_store()
+            details["faiss_index_size"] = store.ntotal
         ok = ok and details["faiss_dir_exists"]
     except Exception as e:
         ok = False
@@ -262,35 +273,34 @@ def on_startup():
     finally:
         db.close()
 
-    # ==== FAISS cleanup ====
-    # if the database has been reset (no documents) but the index files remain,
-    # remove them so a fresh index will be built later. this avoids stale data
-    # persisting across resets.
-    from app.db.session import get_db
-    from app.models.document import Document
-
-    db2: Session = db_session.SessionLocal()
+    # load the embedding model and LLM client once per process so requests
+    # never pay the model load time themselves.
     try:
-        doc_count = db2.query(Document).count()
-        if doc_count == 0:
-            # no documents, delete any existing index files
-            idx_path = os.path.join(settings.FAISS_DIR, "index.faiss")
-            map_path = os.path.join(settings.FAISS_DIR, "mapping.pkl")
-            for p in (idx_path, map_path):
-                if os.path.exists(p):
-                    os.remove(p)
-                    logger.info(f"[startup] removed stale file {p}")
-    finally:
-        db2.close()
+        elapsed = registry.warmup()
+        MODEL_WARMUP_SECONDS.set(elapsed)
+        logger.info(f"[startup] models warmed up in {elapsed:.2f}s", extra={"request_id": ""})
+    except Exception as e:
+        logger.warning(f"unable to warm up models on startup: {e}")
 
     # load FAISS index now so that any errors surface immediately and the
-    # object can be re-used later; store on app state for shutdown persist.
+    # object can be re-used later.  the same instance serves every request
+    # in this process; it only reads, picking up the snapshots written by
+    # the ingest worker that holds the FAISS writer lock (which also removes
+    # stale snapshots and splits a legacy index).
     try:
-        app.state.vector_store = FaissVectorStore()
+        app.state.vector_store = registry.get_vector_store()
         logger.info("[startup] faiss index loaded", extra={"request_id": ""})
     except Exception as e:
         logger.warning(f"unable to load faiss index on startup: {e}")
 
+    # background ingestion workers (queue lives in the ingest_jobs table)
+    try:
+        started = ingest_jobs.start_workers()
+        if started:
+            logger.info(f"[startup] started {started} ingest workers", extra={"request_id": ""})
+    except Exception as e:
+        logger.warning(f"unable to start ingest workers: {e}")
+
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
@@ -302,13 +312,14 @@ app.include_router(admin_auth.router, prefix="/admin", tags=["admin"])
 
 @app.on_event("shutdown")
 def on_shutdown():
-    # persist FAISS index if we've loaded one
-    vs = getattr(app.state, "vector_store", None)
-    if vs:
-        try:
-            vs._persist()
-            logger.info("[shutdown] faiss index persisted", extra={"request_id": ""})
-        except Exception as e:
-            logger.warning(f"error persisting faiss index on shutdown: {e}")
+    # the ingest worker persists the FAISS index before it exits
+    ingest_jobs.stop_workers()
+    registry.close()
     # close DB connections if any (SQLAlchemy will handle teardown automatically)
 
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    # the pooled AsyncClient must be closed on the loop that owns it
+    await registry.aclose()
+
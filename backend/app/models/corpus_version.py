@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class CorpusVersion(Base):
+    """Counter bumped whenever an organization's chunks change.
+
+    ``organization_key`` is the organization id; row 0 changes with every
+    organization (and with documents that have none).  See
+    app.services.corpus_version.
+    """
+
+    __tablename__ = "corpus_versions"
+
+    organization_key = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, String, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, Text, String, ForeignKey, Index, false
 from app.db.base import Base
 
 
@@ -14,6 +14,12 @@ class Document(Base):
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
+    __table_args__ = (
+        # covers the batched (document_id, chunk_index) lookup in RAGService.search
+        Index("ix_document_chunks_org_doc_chunk", "organization_id", "document_id", "chunk_index"),
+        # per-organization duplicate detection at ingest
+        Index("ix_document_chunks_org_hash", "organization_id", "content_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, index=True)
@@ -25,3 +31,13 @@ class DocumentChunk(Base):
     filename = Column(String, nullable=True) # upload filename if any
     page = Column(Integer, nullable=True)    # page number in source document (if applicable)
     organization_id = Column(Integer, ForeignKey("organizations.id"), index=True, nullable=True)  # tenant association
+    # sha256 of ``content``; see app.services.embedding_cache.content_hash
+    content_hash = Column(String(64), nullable=True)
+    # same text is already indexed in this organization by another chunk, so
+    # this row has no vector of its own
+    is_duplicate = Column(Boolean, nullable=False, default=False, server_default=false())
+    # [char_start, char_end) of ``content`` within the source document/page text
+    char_start = Column(Integer, nullable=True)
+    char_end = Column(Integer, nullable=True)
+    # on PostgreSQL, migration 0013 also adds a generated ``content_tsv``
+    # tsvector (GIN-indexed) used by app.rag.hybrid; it is not mapped here
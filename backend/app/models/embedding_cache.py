@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, LargeBinary, DateTime
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class EmbeddingCacheEntry(Base):
+    """Persistent tier of the embedding cache: raw float32 bytes per (model, text hash)."""
+
+    __tablename__ = "embedding_cache"
+
+    model_name = Column(String, primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    embedding = Column(LargeBinary, nullable=False)
+    # pruning (EmbeddingCache.prune) evicts the oldest rows first
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
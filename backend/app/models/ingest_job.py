@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class IngestJob(Base):
+    """A queued/running ingestion, deletion or replacement; claimed by the worker pool in ``app.services.ingest_jobs``."""
+
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), index=True, nullable=True)  # tenant association
+    user_id = Column(Integer, index=True, nullable=True)
+    # ingest (new documents), delete or replace (of ``document_id``)
+    kind = Column(String, nullable=False, default="ingest", server_default="ingest")
+    document_id = Column(Integer, nullable=True)
+    # queued -> running -> succeeded | failed
+    status = Column(String, nullable=False, default="queued", index=True)
+    # finer-grained progress within a run (extracting, ingesting, indexing, ...)
+    stage = Column(String, nullable=True)
+    # JSON manifest of the persisted upload files
+    files = Column(Text, nullable=False)
+    documents_done = Column(Integer, nullable=False, default=0)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    worker = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    # heartbeat: bumped on every progress update
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
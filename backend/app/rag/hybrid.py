@@ -0,0 +1,59 @@
+"""Lexical retrieval and rank fusion for hybrid search.
+
+Embeddings miss exact identifiers (SKUs, error codes, ticket numbers), so
+``RAGService`` also runs a PostgreSQL full-text query over the GIN-indexed
+``document_chunks.content_tsv`` column (migration 0013) and merges both
+rankings with reciprocal rank fusion.  Other databases have no such column
+and get vector-only results.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# text search configuration of the generated content_tsv column
+FTS_CONFIG = "english"
+
+Hit = Tuple[int, int, float]
+
+
+def fulltext_available(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def fulltext_search(db: Session, query: str, limit: int, org_id: int | None = None) -> List[Hit]:
+    """Best ``limit`` ``(document_id, chunk_index, rank)`` matches for ``query``.
+
+    Query terms are OR-ed (a chat question rarely has every word in one
+    chunk) and ranked by ``ts_rank_cd``, higher is better.  Duplicate rows
+    are skipped, as they are absent from FAISS too; ``org_id`` restricts
+    the search to that tenant's chunks.
+    """
+    tenant = "AND c.organization_id = :org" if org_id is not None else ""
+    rows = db.execute(
+        text(
+            "WITH q AS (SELECT CAST(replace(CAST(plainto_tsquery(:cfg, :query) AS text), '&', '|') "
+            "AS tsquery) AS query) "
+            "SELECT c.document_id, c.chunk_index, ts_rank_cd(c.content_tsv, q.query) AS rank "
+            "FROM document_chunks c, q "
+            f"WHERE c.content_tsv @@ q.query AND NOT c.is_duplicate {tenant} "
+            "ORDER BY rank DESC LIMIT :limit"
+        ),
+        {"cfg": FTS_CONFIG, "query": query, "limit": limit, "org": org_id},
+    )
+    return [(int(d), int(ci), float(r)) for d, ci, r in rows]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hit]], k: int = 60) -> List[Tuple[Tuple[int, int], float]]:
+    """Fuse ranked hit lists: ``score = sum(1 / (k + rank))`` over the lists.
+
+    Only ranks matter, so FAISS distances and ``ts_rank_cd`` values need no
+    calibration against each other.  Returns ``((document_id, chunk_index),
+    score)`` pairs, best first; ties keep first-seen order.
+    """
+    scores: Dict[Tuple[int, int], float] = {}
+    for hits in rankings:
+        for rank, (doc_id, chunk_idx, _) in enumerate(hits, start=1):
+            key = (doc_id, chunk_idx)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Rebuild FAISS partitions into another index type without re-embedding.
+
+Run from the backend container, e.g. to move every partition to HNSW:
+
+    python -m app.rag.rebuild_index --type hnswflat
+
+The rebuild needs the FAISS writer lock, so stop the ingest workers first.
+API workers pick the rebuilt partitions up on their next reload check.
+"""
+
+import argparse
+import sys
+
+from app.rag.vector_store import FaissVectorStore, INDEX_TYPES, partition_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--type", choices=INDEX_TYPES, required=True, help="target index type")
+    parser.add_argument("--org", type=int, default=None, help="only rebuild this organization's partition")
+    args = parser.parse_args()
+
+    store = FaissVectorStore()
+    if not store.acquire_writer():
+        sys.exit("another process (an ingest worker?) holds the faiss writer lock")
+    keys = [partition_key(args.org)] if args.org is not None else store.partition_keys
+    for key in keys:
+        store.rebuild(key, args.type)
+        print(f"rebuilt {key} as {args.type}")
+    store.flush()
+    store.release_writer()
+
+
+if __name__ == "__main__":
+    main()
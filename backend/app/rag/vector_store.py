@@ -1,71 +1,924 @@
 import faiss
+import fcntl
+import json
 import numpy as np
 import os
 import pickle
+import re
+import threading
+import time
+import logging
+from contextlib import contextmanager
 from typing import List, Tuple, Union, Dict
 from app.core.config import settings
 
 
+logger = logging.getLogger(__name__)
+
+
+class _RWLock:
+    """Minimal readers/writer lock.
+
+    Any number of searches (and snapshot serialization) may run
+    concurrently; ``add`` takes the lock exclusively.  Waiting writers
+    block new readers so a busy read path cannot starve ingestion.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class IdMap:
+    """FAISS label -> (document_id, chunk_index), as a contiguous int64 array.
+
+    Row ``i`` holds the ids for label ``i``, so a whole result batch is
+    resolved with one fancy-indexing operation.  Snapshots are plain
+    ``.npy`` files opened with ``mmap_mode="r"``: loading is near-instant and
+    pages are only touched when looked up.  The first append copies the
+    mapped data into a growable in-memory buffer.
+    """
+
+    def __init__(self, data: np.ndarray | None = None):
+        self._data = data if data is not None else np.empty((0, 2), dtype=np.int64)
+        self._n = len(self._data)
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def array(self) -> np.ndarray:
+        return self._data[: self._n]
+
+    def append(self, meta) -> None:
+        rows = np.asarray(meta, dtype=np.int64).reshape(-1, 2)
+        needed = self._n + len(rows)
+        if needed > len(self._data) or not self._data.flags.writeable:
+            # amortized doubling, which also detaches from a read-only mmap
+            self._grow(max(needed, 2 * len(self._data), 1024))
+        self._data[self._n : needed] = rows
+        self._n = needed
+
+    def clear(self, labels: np.ndarray) -> None:
+        """Tombstone ``labels``: their rows become -1 and never resolve again."""
+        if not self._data.flags.writeable:
+            self._grow(len(self._data))
+        self._data[labels] = -1
+
+    def dead_labels(self) -> np.ndarray:
+        return np.flatnonzero(self.array[:, 0] < 0)
+
+    def _grow(self, capacity: int) -> None:
+        grown = np.empty((capacity, 2), dtype=np.int64)
+        grown[: self._n] = self._data[: self._n]
+        self._data = grown
+
+    def lookup(self, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(valid_mask, rows)`` for an array of FAISS labels."""
+        labels = np.asarray(labels, dtype=np.int64)
+        valid = (labels >= 0) & (labels < self._n)
+        rows = self._data[labels[valid]]
+        # rows for labels that were never mapped are stored as -1
+        mapped = rows[:, 0] >= 0
+        valid[valid] = mapped
+        return valid, rows[mapped]
+
+    @classmethod
+    def from_dict(cls, mapping: Dict[int, Tuple[int, int]], n: int) -> "IdMap":
+        """Convert a legacy pickled ``{label: (document_id, chunk_index)}`` dict."""
+        data = np.full((n, 2), -1, dtype=np.int64)
+        for label, meta in mapping.items():
+            if 0 <= label < n:
+                data[label] = meta
+        return cls(data)
+
+    @classmethod
+    def load(cls, path: str) -> "IdMap":
+        return cls(np.load(path, mmap_mode="r"))
+
+
+class _Partition:
+    """One organization's slice of the store: an index plus its id map.
+
+    The organization itself is implied by the partition, so the map only
+    stores ``(document_id, chunk_index)``.
+    """
+
+    def __init__(self, key: str, index, ids: IdMap, generation: int = 0, stamp=None):
+        self.key = key
+        self.index = index
+        self.ids = ids
+        # snapshot generation this copy was read from or last written as
+        # (0: never snapshotted, or read from the unversioned layout)
+        self.generation = generation
+        # identity of an unversioned snapshot file, compared against disk
+        # until the writer has converted the directory to the manifest
+        self.stamp = stamp
+        self.update_tombstones()
+
+    def update_tombstones(self):
+        """Recount tombstoned labels and rebuild the selector excluding them."""
+        dead = self.ids.dead_labels()
+        self.dead = len(dead)
+        self.selector = None
+        if self.dead:
+            # IDSelectorBatch copies the ids, so ``dead`` may be freed
+            self._dead_batch = faiss.IDSelectorBatch(len(dead), faiss.swig_ptr(dead))
+            self.selector = faiss.IDSelectorNot(self._dead_batch)
+
+    def next_labels(self, n: int) -> np.ndarray:
+        return np.arange(len(self.ids), len(self.ids) + n, dtype=np.int64)
+
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # os.replace gives every snapshot a new inode
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+MANIFEST_FILE = "manifest.json"
+# ``<key>.<generation>.faiss`` / ``<key>.<generation>.ids.npy``
+_SNAPSHOT_FILE = re.compile(r"^(?P<key>[^.]+)\.(?P<generation>\d+)\.(?:faiss|ids\.npy)$")
+# ``<key>.faiss`` / ``<key>.ids.npy`` / ``<key>.pkl``, written before the manifest
+_UNVERSIONED_FILE = re.compile(r"^[^.]+\.(?:faiss|ids\.npy|pkl)$")
+
+
+# index types selectable through ``settings.FAISS_INDEX_TYPE``
+INDEX_TYPES = ("flat", "ivfflat", "ivfpq", "hnswflat")
+
+
+def index_kind(index) -> str:
+    """Return which of :data:`INDEX_TYPES` ``index`` is."""
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return "hnswflat"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivfflat"
+    return "flat"
+
+
+def faiss_metric(name: str | None = None) -> int:
+    """FAISS metric constant for ``settings.FAISS_METRIC`` (``ip`` or ``l2``)."""
+    name = name or settings.FAISS_METRIC
+    if name == "ip":
+        return faiss.METRIC_INNER_PRODUCT
+    if name == "l2":
+        return faiss.METRIC_L2
+    raise ValueError(f"unknown FAISS_METRIC {name!r}; expected 'ip' or 'l2'")
+
+
+def is_inner_product(index) -> bool:
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def build_index(kind: str, dim: int, n_vectors: int = 0, metric: int | None = None):
+    """Create an empty (untrained) index of ``kind`` sized for ``n_vectors``.
+
+    ``metric`` defaults to ``settings.FAISS_METRIC``.
+    """
+    metric = faiss_metric() if metric is None else metric
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(dim)
+    if kind == "hnswflat":
+        return faiss.index_factory(dim, f"HNSW{settings.FAISS_HNSW_M},Flat", metric)
+    # IVF: default to ~4*sqrt(n) lists, keeping >= 39 training points per list
+    nlist = settings.FAISS_IVF_NLIST or int(4 * np.sqrt(max(n_vectors, 1)))
+    nlist = max(1, min(nlist, max(n_vectors // 39, 1)))
+    if kind == "ivfflat":
+        return faiss.index_factory(dim, f"IVF{nlist},Flat", metric)
+    if kind == "ivfpq":
+        return faiss.index_factory(dim, f"IVF{nlist},PQ{settings.FAISS_PQ_M}x{settings.FAISS_PQ_NBITS}", metric)
+    raise ValueError(f"unknown faiss index type {kind!r}; expected one of {INDEX_TYPES}")
+
+
+def is_ivf(index) -> bool:
+    return index_kind(index) in ("ivfflat", "ivfpq")
+
+
+def reconstruct_vectors(index, labels: np.ndarray) -> np.ndarray:
+    """Return the stored vectors for ``labels`` without re-embedding.
+
+    IVF indexes need a direct map for this; a hashtable map is built on
+    demand (labels may be sparse after ``remove_ids``) and dropped again
+    afterwards.  PQ reconstruction is lossy, which is fine for re-encoding
+    into another PQ index.
+    """
+    labels = np.ascontiguousarray(labels, dtype=np.int64)
+    if len(labels) == 0:
+        return np.empty((0, index.d), dtype="float32")
+    ivf = None
+    if is_ivf(index):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        return index.reconstruct_batch(labels)
+    finally:
+        if ivf is not None:
+            ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def search_params(index, nprobe: int | None = None, ef_search: int | None = None, sel=None):
+    """Per-query tuning knobs for ``index``; ``None`` when nothing applies.
+
+    ``sel`` is an optional ``IDSelector`` restricting which labels may be
+    returned (used to hide tombstoned vectors).
+    """
+    kind = index_kind(index)
+    if kind in ("ivfflat", "ivfpq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or settings.FAISS_NPROBE, sel=sel)
+    if kind == "hnswflat":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or settings.FAISS_EF_SEARCH, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def partition_key(organization_id: int | None) -> str:
+    """File-safe key for an organization's partition (``global`` for None)."""
+    return "global" if organization_id is None else f"org_{int(organization_id)}"
+
+
 class FaissVectorStore:
+    """Per-organization FAISS indexes plus label -> (document_id, chunk_index) id maps.
+
+    Every tenant gets its own partition, so a query only scans that tenant's
+    vectors and always receives up to ``top_k`` in-tenant hits.  Documents
+    ingested without an organization live in the ``global`` partition.
+
+    One instance is shared per process (see ``registry.get_vector_store``).
+    Only one process changes the store: the writer, which holds an ``flock``
+    on ``FAISS_DIR/writer.lock`` (see :meth:`acquire_writer`; the ingest
+    worker takes it).  Its updates happen in memory and only mark partitions
+    dirty; snapshots on disk are refreshed by :meth:`start_persister` on an
+    interval, or by an explicit :meth:`flush`.  Every other process only
+    reads, reloading partitions when a newer snapshot appears.
+
+    A snapshot writes each changed partition as ``<key>.<generation>.faiss``
+    plus ``<key>.<generation>.ids.npy`` and then atomically replaces
+    ``manifest.json``, which names the generation of every partition.
+    Readers only open files the manifest names, so an index and its id map
+    always come from the same snapshot.  The manifest also carries the
+    corpus versions (:mod:`app.services.corpus_version`) the snapshot
+    reflects, so readers can tell whether their copy is as new as the
+    database (see :meth:`snapshot_version`).
+    """
+
     def __init__(self, dim: int = None):
         self.dim = dim or settings.EMBEDDING_DIM
-        self.index_path = os.path.join(settings.FAISS_DIR, "index.faiss")
-        self.map_path = os.path.join(settings.FAISS_DIR, "mapping.pkl")
-        self._load()
+        self.partition_dir = os.path.join(settings.FAISS_DIR, "partitions")
+        self.manifest_path = os.path.join(self.partition_dir, MANIFEST_FILE)
+        self.lock_path = os.path.join(settings.FAISS_DIR, "writer.lock")
+        # single-index layout used before partitioning; see migrate_legacy
+        self.legacy_index_path = os.path.join(settings.FAISS_DIR, "index.faiss")
+        self.legacy_map_path = os.path.join(settings.FAISS_DIR, "mapping.pkl")
+        self._lock = _RWLock()
+        self._partitions: Dict[str, _Partition] = {}
+        self._dirty: set = set()
+        # generation of the manifest the partitions were read from or last
+        # written as (0: no manifest yet)
+        self._generation = 0
+        # partition key -> corpus version the vectors reflect; the
+        # ``global`` key doubles as the version of unscoped searches
+        self._corpus_versions: Dict[str, int] = {}
+        self._versions_dirty = False
+        # open, flock'ed writer.lock while this process is the writer
+        self._writer_fd: int | None = None
+        self._writer_lock = threading.Lock()
+        # serializes snapshot writers (persister thread vs. shutdown flush)
+        self._persist_lock = threading.Lock()
+        # one partition rebuild (training) at a time
+        self._rebuild_lock = threading.Lock()
+        # one reload at a time; concurrent searches skip rather than wait
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._persister: threading.Thread | None = None
+        self._last_refresh = time.monotonic()
+        self._reload(mmap=settings.FAISS_MMAP)
+
+    def _paths(self, key: str, generation: int) -> Tuple[str, str]:
+        return (
+            os.path.join(self.partition_dir, f"{key}.{generation}.faiss"),
+            os.path.join(self.partition_dir, f"{key}.{generation}.ids.npy"),
+        )
+
+    def _new_index(self):
+        # partitions start flat; see _maybe_upgrade for the ANN switch
+        return build_index("flat", self.dim)
+
+    def _read_index(self, path: str, mmap: bool = False, missing_ok: bool = True):
+        # validate dimension and recreate if mismatch or unreadable
+        if not missing_ok and not os.path.exists(path):
+            raise FileNotFoundError(path)
+        try:
+            if mmap:
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+            else:
+                index = faiss.read_index(path)
+        except Exception:
+            return self._new_index()
+        if index.d != self.dim:
+            return self._new_index()
+        return index
 
-    def _load(self):
-        # if existing index present, validate dimension and recreate if mismatch
-        if os.path.exists(self.index_path):
+    def _read_partition(self, key: str, generation: int, mmap: bool) -> _Partition:
+        """Read generation ``generation`` of partition ``key``.
+
+        With ``mmap`` the inverted lists of IVF indexes are mapped straight
+        from the file, so every worker shares the page cache instead of
+        holding a private copy.  Other index types cannot be mapped by FAISS
+        and are read into memory.  Raises ``FileNotFoundError`` if the
+        writer has already removed that generation.
+        """
+        index_path, ids_path = self._paths(key, generation)
+        ids = IdMap.load(ids_path)
+        index = self._read_index(index_path, mmap=mmap, missing_ok=False)
+        return _Partition(key, index, ids, generation=generation)
+
+    def _read_unversioned(self, key: str, mmap: bool) -> _Partition:
+        """Read a partition saved before snapshots had a manifest."""
+        index_path = os.path.join(self.partition_dir, f"{key}.faiss")
+        ids_path = os.path.join(self.partition_dir, f"{key}.ids.npy")
+        # partitions written before the array id map used a pickled dict
+        pkl_path = os.path.join(self.partition_dir, f"{key}.pkl")
+        stamp = _file_stamp(index_path)
+        index = self._read_index(index_path, mmap=mmap)
+        ids = IdMap()
+        if index.ntotal > 0 and os.path.exists(ids_path):
+            ids = IdMap.load(ids_path)
+        elif index.ntotal > 0 and os.path.exists(pkl_path):
+            with open(pkl_path, "rb") as f:
+                ids = IdMap.from_dict(pickle.load(f), index.ntotal)
+        elif index.ntotal > 0:
+            # vectors without a mapping can never be resolved
+            index = self._new_index()
+        return _Partition(key, index, ids, stamp=stamp)
+
+    def _unversioned_keys(self) -> List[str]:
+        if not os.path.isdir(self.partition_dir):
+            return []
+        return [
+            n[: -len(".faiss")] for n in os.listdir(self.partition_dir)
+            if n.endswith(".faiss") and "." not in n[: -len(".faiss")]
+        ]
+
+    def _read_manifest(self) -> dict | None:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _reload(self, mmap: bool, reuse: bool = True) -> List[str]:
+        """Bring the in-memory partitions up to date with the snapshot on disk.
+
+        Partitions whose generation (or, before the first manifest, whose
+        file) is unchanged are kept when ``reuse`` is set; the others are
+        read and swapped in together, and partitions no longer on disk are
+        dropped.  Returns the keys that were read.
+        """
+        for _ in range(3):
+            manifest = self._read_manifest()
+            current = self._partitions if reuse else {}
+            updates: Dict[str, _Partition] = {}
             try:
-                self.index = faiss.read_index(self.index_path)
-                # verify dim
-                if self.index.ntotal > 0:
-                    idx_dim = self.index.d
+                if manifest is not None:
+                    generation = manifest["generation"]
+                    versions = manifest.get("corpus_versions", {})
+                    keys = set(manifest["partitions"])
+                    for key, entry in manifest["partitions"].items():
+                        part = current.get(key)
+                        if part is None or part.generation != entry["generation"]:
+                            updates[key] = self._read_partition(key, entry["generation"], mmap)
                 else:
-                    # for empty IndexFlatL2, d attribute exists
-                    idx_dim = self.index.d
-                if idx_dim != self.dim:
-                    # recreate index with correct dim
-                    self.index = faiss.IndexFlatL2(self.dim)
-            except Exception:
-                # on any error, recreate fresh index
-                self.index = faiss.IndexFlatL2(self.dim)
+                    generation, versions = 0, {}
+                    keys = set(self._unversioned_keys())
+                    for key in keys:
+                        part = current.get(key)
+                        if part is None or part.stamp != _file_stamp(os.path.join(self.partition_dir, f"{key}.faiss")):
+                            updates[key] = self._read_unversioned(key, mmap)
+                break
+            except FileNotFoundError:
+                # the writer replaced that generation meanwhile; reread the manifest
+                continue
         else:
-            self.index = faiss.IndexFlatL2(self.dim)
+            raise RuntimeError("faiss snapshot kept changing while it was being read")
+        with self._lock.write():
+            for key in set(self._partitions) - keys:
+                del self._partitions[key]
+            self._partitions.update(updates)
+            self._generation = generation
+            self._corpus_versions = dict(versions)
+        return sorted(updates)
 
-        if os.path.exists(self.map_path):
-            with open(self.map_path, "rb") as f:
-                self.mapping = pickle.load(f)
-        else:
-            # mapping maps index -> (document_id, chunk_index)
-            self.mapping: Dict[int, Tuple[int, int]] = {}
-
-    def add(self, vectors: List[List[float]], meta: List[Tuple[int, int]]):
-        """`meta` is a list of (document_id, chunk_index) corresponding to each vector."""
-        arr = np.array(vectors).astype("float32")
-        start = self.index.ntotal
-        self.index.add(arr)
-        for i, m in enumerate(meta):
-            self.mapping[start + i] = m
-        self._persist()
+    def refresh(self) -> int:
+        """Reload partitions whose snapshot the writer replaced.
+
+        The writer's own copy is the newest there is, so it never reloads.
+        Returns the number of partitions (re)loaded.
+        """
+        self._last_refresh = time.monotonic()
+        if self.is_writer or not self._refresh_lock.acquire(blocking=False):
+            return 0
+        try:
+            keys = self._reload(mmap=settings.FAISS_MMAP)
+        finally:
+            self._refresh_lock.release()
+        if keys:
+            logger.info(f"reloaded faiss partitions {keys} from newer snapshots")
+        return len(keys)
+
+    def _maybe_refresh(self):
+        interval = settings.FAISS_RELOAD_CHECK_SECONDS
+        if interval <= 0 or time.monotonic() - self._last_refresh < interval:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"faiss snapshot reload failed: {e}")
+
+    @property
+    def is_writer(self) -> bool:
+        return self._writer_fd is not None
+
+    def acquire_writer(self, blocking: bool = False) -> bool:
+        """Become the one process that changes the store; returns whether it did.
+
+        The lock is an ``flock`` on ``FAISS_DIR/writer.lock``.  It is held
+        until :meth:`release_writer` or process exit, so a standby process
+        can take over from a writer that died.  The partitions are then
+        reread from disk, unmapped since the writer mutates them, to pick up
+        everything the previous writer saved.
+        """
+        with self._writer_lock:
+            if self._writer_fd is not None:
+                return True
+            os.makedirs(settings.FAISS_DIR, exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            try:
+                self._reload(mmap=False, reuse=False)
+            except BaseException:
+                os.close(fd)
+                raise
+            if self._generation == 0:
+                # unversioned layout: the first flush writes the manifest
+                self._dirty.update(self._partitions)
+            self._writer_fd = fd
+        logger.info(f"acquired the faiss writer lock (snapshot generation {self._generation})")
+        return True
+
+    def release_writer(self):
+        """Give up the writer lock; unsaved changes are not flushed."""
+        with self._writer_lock:
+            if self._writer_fd is None:
+                return
+            fcntl.flock(self._writer_fd, fcntl.LOCK_UN)
+            os.close(self._writer_fd)
+            self._writer_fd = None
+
+    def _require_writer(self):
+        """Take the writer lock on the first change, or refuse if another process has it."""
+        if not self.acquire_writer():
+            raise RuntimeError(
+                "another process holds the faiss writer lock; route changes through the ingest worker"
+            )
+
+    @property
+    def has_legacy_snapshot(self) -> bool:
+        return os.path.exists(self.legacy_index_path)
+
+    def migrate_legacy(self, document_orgs: Dict[int, int | None]):
+        """Split a pre-partitioning ``index.faiss`` into per-org partitions.
+
+        ``document_orgs`` maps document ids to their organization (looked up
+        by the caller, since the store has no database access).  Vectors are
+        reconstructed from the flat index, so nothing is re-embedded; entries
+        whose document no longer exists are dropped.
+        """
+        if not self.has_legacy_snapshot:
+            return
+        self._require_writer()
+        index = self._read_index(self.legacy_index_path)
+        mapping: Dict[int, Tuple[int, int]] = {}
+        if os.path.exists(self.legacy_map_path):
+            with open(self.legacy_map_path, "rb") as f:
+                mapping = pickle.load(f)
+        groups: Dict[int | None, Tuple[list, list]] = {}
+        if index.ntotal > 0:
+            vectors = reconstruct_vectors(index, np.arange(index.ntotal))
+            if faiss_metric() == faiss.METRIC_INNER_PRODUCT:
+                faiss.normalize_L2(vectors)
+            for pos in range(index.ntotal):
+                meta = mapping.get(pos)
+                if not meta or meta[0] not in document_orgs:
+                    continue
+                vecs, metas = groups.setdefault(document_orgs[meta[0]], ([], []))
+                vecs.append(vectors[pos])
+                metas.append(meta)
+        for org_id, (vecs, metas) in groups.items():
+            self.add(np.vstack(vecs), metas, organization_id=org_id)
+        self.flush()
+        for p in (self.legacy_index_path, self.legacy_map_path):
+            if os.path.exists(p):
+                os.remove(p)
+        logger.info(f"migrated legacy faiss index into {len(groups)} partitions")
+
+    def clear(self):
+        """Drop every partition and snapshot, e.g. after the database was reset.
+
+        An empty manifest is written, so readers drop their copies too.
+        """
+        self._require_writer()
+        with self._persist_lock:
+            with self._lock.write():
+                self._partitions.clear()
+                self._dirty.clear()
+                self._corpus_versions.clear()
+                self._versions_dirty = False
+            for p in (self.legacy_index_path, self.legacy_map_path):
+                if os.path.exists(p):
+                    os.remove(p)
+            os.makedirs(self.partition_dir, exist_ok=True)
+            self._write_manifest(self._generation + 1, {}, {})
+            self._remove_stale({})
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty) or self._versions_dirty
+
+    def stamp_corpus_version(self, organization_id: int | None, version: int, global_version: int):
+        """Record the corpus versions a change moved ``organization_id`` to.
+
+        Call once the vectors of that change are added or removed, with the
+        versions :func:`app.services.corpus_version.bump` returned; the next
+        snapshot publishes them together with the vectors.
+        """
+        self._require_writer()
+        with self._lock.write():
+            self._corpus_versions[partition_key(organization_id)] = version
+            self._corpus_versions[partition_key(None)] = global_version
+            self._versions_dirty = True
+
+    def snapshot_version(self, organization_id: int | None) -> int:
+        """Corpus version the searchable vectors of ``organization_id`` reflect.
+
+        ``None`` covers every partition, like an unscoped search.  A reader
+        whose snapshot lags the database reports an older version than
+        :func:`app.services.corpus_version.current`, so caches compare the
+        two before storing results.  0 if no change was ever stamped.
+        """
+        with self._lock.read():
+            return self._corpus_versions.get(partition_key(organization_id), 0)
 
-    def search(self, vector: List[float], top_k: int = 3) -> List[Tuple[int, int, float]]:
-        if self.index.ntotal == 0:
+    @property
+    def ntotal(self) -> int:
+        """Number of live (not tombstoned) vectors across all partitions."""
+        with self._lock.read():
+            return sum(len(p.ids) - p.dead for p in self._partitions.values())
+
+    def add(
+        self,
+        vectors: Union[List[List[float]], np.ndarray],
+        meta: List[Tuple[int, int]],
+        organization_id: int | None = None,
+    ):
+        """`meta` is a list of (document_id, chunk_index) corresponding to each vector.
+
+        Vectors go into ``organization_id``'s partition.  They are searchable
+        as soon as this returns; persisting them to disk is left to the
+        background persister.
+        """
+        # get_embeddings already returns float32, so this is normally no copy
+        arr = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        key = partition_key(organization_id)
+        self._require_writer()
+        with self._lock.write():
+            part = self._partitions.get(key)
+            if part is None:
+                part = self._partitions[key] = _Partition(key, self._new_index(), IdMap())
+            # labels are rows of the id map, so both grow in lockstep.  IVF
+            # keeps explicit ids (and may have had some removed), so the
+            # label is passed rather than derived from ntotal.
+            if is_ivf(part.index):
+                part.index.add_with_ids(arr, part.next_labels(len(arr)))
+            else:
+                part.index.add(arr)
+            part.ids.append(meta)
+            self._dirty.add(key)
+        self._maybe_upgrade(key)
+
+    def remove_documents(self, document_ids, organization_id: int | None = None) -> int:
+        """Tombstone every vector of ``document_ids`` in ``organization_id``'s partition.
+
+        The id map rows are cleared so the labels never resolve again and
+        searches exclude them through an ``IDSelector``.  IVF indexes also
+        drop the entries with ``remove_ids`` (their labels are explicit, so
+        nothing is renumbered); flat and HNSW indexes keep the dead vectors
+        until :meth:`compact` rebuilds the partition.  Returns the number of
+        vectors removed.
+        """
+        doc_ids = np.asarray(list(document_ids), dtype=np.int64)
+        key = partition_key(organization_id)
+        self._require_writer()
+        # a concurrent rebuild would resurrect labels tombstoned mid-training
+        with self._rebuild_lock:
+            with self._lock.write():
+                part = self._partitions.get(key)
+                if part is None or len(doc_ids) == 0:
+                    return 0
+                labels = np.flatnonzero(np.isin(part.ids.array[:, 0], doc_ids))
+                if len(labels) == 0:
+                    return 0
+                if is_ivf(part.index):
+                    part.index.remove_ids(np.ascontiguousarray(labels, dtype=np.int64))
+                part.ids.clear(labels)
+                part.update_tombstones()
+                self._dirty.add(key)
+        return len(labels)
+
+    def compact(self) -> List[str]:
+        """Rebuild partitions whose tombstone share exceeds the threshold.
+
+        Returns the keys that were rebuilt.
+        """
+        if not self.is_writer:
             return []
-        xq = np.array([vector]).astype("float32")
-        D, I = self.index.search(xq, top_k)
-        results: List[Tuple[int, int, float]] = []
-        for score, idx in zip(D[0], I[0]):
-            if idx == -1:
-                continue
-            meta = self.mapping.get(int(idx))
-            if not meta:
-                continue
-            doc_id, chunk_idx = meta
-            results.append((doc_id, chunk_idx, float(score)))
+        ratio = settings.FAISS_COMPACT_TOMBSTONE_RATIO
+        with self._lock.read():
+            keys = [
+                key for key, part in self._partitions.items()
+                if part.dead and part.dead >= ratio * len(part.ids)
+            ]
+        for key in keys:
+            self.rebuild(key, index_kind(self._partitions[key].index))
+        return keys
+
+    def _maybe_upgrade(self, key: str):
+        """Switch a partition to ``FAISS_INDEX_TYPE`` once it is large enough.
+
+        Small partitions stay flat: exhaustive search is exact and fast below
+        a few thousand vectors, and IVF needs enough points to train on.
+        """
+        target = settings.FAISS_INDEX_TYPE
+        part = self._partitions.get(key)
+        if part is None or target == "flat" or index_kind(part.index) == target:
+            return
+        if part.index.ntotal < settings.FAISS_TRAIN_MIN_VECTORS:
+            return
+        self.rebuild(key, target)
+
+    def rebuild(self, key: str, kind: str | None = None):
+        """Rebuild partition ``key`` as an index of ``kind`` from its live vectors.
+
+        Vectors are reconstructed from the current index, so nothing is
+        re-embedded.  Tombstoned labels are dropped and the survivors are
+        renumbered densely, which is how deletions are compacted.  Training
+        runs without holding the write lock; vectors added meanwhile are
+        copied over before the swap.
+        """
+        kind = kind or settings.FAISS_INDEX_TYPE
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"unknown faiss index type {kind!r}; expected one of {INDEX_TYPES}")
+        self._require_writer()
+        with self._rebuild_lock:
+            with self._lock.read():
+                part = self._partitions.get(key)
+                if part is None:
+                    return
+                n = len(part.ids)
+                rows = part.ids.array.copy()
+                live = np.flatnonzero(rows[:, 0] >= 0)
+                vectors = reconstruct_vectors(part.index, live)
+            start = time.time()
+            if len(live) == 0:
+                kind = "flat"
+            new_index = build_index(kind, self.dim, len(live))
+            # converting an L2 partition: IP ranking needs unit vectors
+            to_ip = is_inner_product(new_index) and not is_inner_product(part.index)
+            if to_ip:
+                faiss.normalize_L2(vectors)
+            if not new_index.is_trained:
+                new_index.train(vectors)
+            new_index.add(vectors)
+            new_ids = IdMap(rows[live])
+            with self._lock.write():
+                current = part.ids.array
+                tail = np.flatnonzero(current[n:, 0] >= 0) + n
+                if len(tail):
+                    tail_vectors = reconstruct_vectors(part.index, tail)
+                    if to_ip:
+                        faiss.normalize_L2(tail_vectors)
+                    new_index.add(tail_vectors)
+                    new_ids.append(current[tail])
+                part.index = new_index
+                part.ids = new_ids
+                part.update_tombstones()
+                self._dirty.add(key)
+            logger.info(
+                f"rebuilt faiss partition {key} as {kind} ({len(new_ids)} live of {n} vectors) "
+                f"in {time.time() - start:.2f}s"
+            )
+
+    @property
+    def partition_keys(self) -> List[str]:
+        with self._lock.read():
+            return list(self._partitions)
+
+    def search(
+        self,
+        vector: List[float],
+        top_k: int = 3,
+        organization_id: int | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+    ) -> List[Tuple[int, int, float]]:
+        """Return up to ``top_k`` ``(document_id, chunk_index, distance)`` hits.
+
+        ``distance`` is squared L2 (lower is better); inner-product
+        partitions report the equivalent ``2 - 2 * similarity``.
+
+        With an ``organization_id`` only that tenant's partition is scanned.
+        Without one every partition is searched and the results are merged,
+        matching the unscoped behaviour of the single-index store.
+        ``nprobe`` / ``ef_search`` override the configured recall/speed
+        trade-off for IVF / HNSW partitions.
+        """
+        xq = np.ascontiguousarray(vector, dtype=np.float32).reshape(1, -1)
+        self._maybe_refresh()
+        with self._lock.read():
+            if organization_id is not None:
+                part = self._partitions.get(partition_key(organization_id))
+                parts = [part] if part is not None else []
+            else:
+                parts = list(self._partitions.values())
+            results: List[Tuple[int, int, float]] = []
+            for part in parts:
+                results.extend(self._search_partition(part, xq, top_k, nprobe, ef_search))
+        if len(parts) > 1:
+            results.sort(key=lambda r: r[2])
+            results = results[:top_k]
         return results
 
+    @staticmethod
+    def _search_partition(
+        part: _Partition, xq: np.ndarray, top_k: int, nprobe: int | None, ef_search: int | None
+    ) -> List[Tuple[int, int, float]]:
+        if part.index.ntotal == 0:
+            return []
+        params = search_params(part.index, nprobe, ef_search, sel=part.selector)
+        if params is not None:
+            D, I = part.index.search(xq, top_k, params=params)
+        else:
+            D, I = part.index.search(xq, top_k)
+        valid, rows = part.ids.lookup(I[0])
+        scores = D[0][valid]
+        if is_inner_product(part.index):
+            # report squared-L2 distance (exact for unit vectors) so scores
+            # stay lower-is-better and comparable across partitions
+            scores = 2.0 - 2.0 * scores
+        return [
+            (int(doc_id), int(chunk_idx), float(score))
+            for (doc_id, chunk_idx), score in zip(rows.tolist(), scores.tolist())
+        ]
+
+    def flush(self) -> bool:
+        """Write snapshots of partitions changed since the last flush.
+
+        Returns ``True`` when anything was written.
+        """
+        if not self.dirty:
+            return False
+        self._persist()
+        return True
+
     def _persist(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.map_path, "wb") as f:
-            pickle.dump(self.mapping, f)
+        with self._persist_lock:
+            # serialize under the read lock so searches continue; only
+            # writers are held off while the snapshot is taken.
+            with self._lock.read():
+                keys = set(self._dirty)
+                snapshots = {
+                    key: (faiss.serialize_index(self._partitions[key].index), self._partitions[key].ids.array.copy())
+                    for key in keys
+                }
+                parts = {key: self._partitions[key] for key in keys}
+                previous = {key: part.generation for key, part in self._partitions.items()}
+                versions = dict(self._corpus_versions)
+                self._dirty.clear()
+                self._versions_dirty = False
+            generation = self._generation + 1
+            os.makedirs(self.partition_dir, exist_ok=True)
+            for key, (data, ids) in snapshots.items():
+                # files of a new generation are invisible to readers until
+                # the manifest names them, so they are written in place
+                index_path, ids_path = self._paths(key, generation)
+                with open(index_path, "wb") as f:
+                    f.write(data.tobytes())
+                with open(ids_path, "wb") as f:
+                    np.save(f, ids)
+            entries = {key: generation if key in keys else g for key, g in previous.items()}
+            self._write_manifest(generation, entries, versions)
+            for part in parts.values():
+                part.generation = generation
+            self._remove_stale({key: {g, previous[key]} for key, g in entries.items()})
+
+    def _write_manifest(self, generation: int, entries: Dict[str, int], versions: Dict[str, int]):
+        """Atomically publish snapshot ``generation`` naming ``{key: partition generation}``."""
+        manifest = {
+            "generation": generation,
+            "partitions": {key: {"generation": g} for key, g in entries.items()},
+            "corpus_versions": versions,
+        }
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+        self._generation = generation
+
+    def _remove_stale(self, keep: Dict[str, set]):
+        """Delete snapshot files not in ``keep`` (``{key: generations}``).
+
+        Callers keep each partition's previous generation as well: a reader
+        may have read the old manifest and not yet opened its files.  Files
+        of the unversioned layout are superseded by the first manifest.
+        """
+        for name in os.listdir(self.partition_dir):
+            m = _SNAPSHOT_FILE.match(name)
+            if m:
+                stale = int(m["generation"]) not in keep.get(m["key"], ())
+            else:
+                stale = _UNVERSIONED_FILE.match(name) is not None
+            if stale:
+                try:
+                    os.remove(os.path.join(self.partition_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def start_persister(self, interval: float | None = None):
+        """Start a daemon thread that compacts and flushes every ``interval`` seconds."""
+        if self._persister is not None:
+            return
+        interval = interval or settings.FAISS_PERSIST_INTERVAL_SECONDS
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.warning(f"faiss compaction failed: {e}")
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"faiss snapshot failed: {e}")
+
+        self._persister = threading.Thread(target=_run, name="faiss-persister", daemon=True)
+        self._persister.start()
+
+    def stop_persister(self):
+        """Stop the persister thread, write any pending changes and release the writer lock."""
+        if self._persister is not None:
+            self._stop.set()
+            self._persister.join()
+            self._persister = None
+        self.flush()
+        self.release_writer()
@@ -0,0 +1,120 @@
+"""Per-organization semantic cache of chat answers.
+
+Users of one tenant often ask the same question in slightly different
+words.  Answers to first questions of a conversation are kept in a small
+in-process FAISS inner-product index per organization, keyed by the
+unit-normalized query embedding.  A later question whose cosine similarity
+to a cached one reaches ``settings.ANSWER_CACHE_THRESHOLD`` gets the stored
+answer and citations back without retrieval or a completion, provided the
+entry is younger than ``ANSWER_CACHE_TTL_SECONDS`` and the organization's
+corpus version (see :mod:`app.services.corpus_version`) is unchanged since
+it was stored; any ingest or deletion empties that organization's cache.
+Answers are only stored when the process's FAISS snapshot had reached that
+version at retrieval time.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from prometheus_client import Counter
+
+ANSWER_CACHE_LOOKUPS = Counter("app_answer_cache_lookups_total", "Semantic answer cache lookups", ["result"])
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    # the streamed chunks, replayed as-is on a hit
+    parts: List[str]
+    citations: List[dict]
+    context_meta: List[dict]
+    created_at: float = field(default_factory=time.time)
+
+
+class _OrgCache:
+    def __init__(self, dim: int, version: int):
+        self.version = version
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self.entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self.next_id = 0
+
+
+class AnswerCache:
+    """Thread-safe semantic answer cache; one per process via the registry."""
+
+    def __init__(self, dim: int, threshold: float, ttl_seconds: float, max_entries: int):
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._orgs: Dict[int | None, _OrgCache] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, org_id: int | None, emb: np.ndarray, version: int) -> CachedAnswer | None:
+        """Best fresh entry similar enough to ``emb``, or None."""
+        xq = self._normalize(emb)
+        now = time.time()
+        with self._lock:
+            org = self._org(org_id, version)
+            while org.index.ntotal:
+                sims, ids = org.index.search(xq, 1)
+                entry_id = int(ids[0, 0])
+                entry = org.entries.get(entry_id)
+                if entry is not None and now - entry.created_at > self.ttl_seconds:
+                    # expired: drop it and look again
+                    self._remove(org, [entry_id])
+                    continue
+                if entry is not None and sims[0, 0] >= self.threshold:
+                    org.entries.move_to_end(entry_id)
+                    ANSWER_CACHE_LOOKUPS.labels("hit").inc()
+                    return entry
+                break
+        ANSWER_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def store(self, org_id: int | None, emb: np.ndarray, version: int, entry: CachedAnswer):
+        """Remember ``entry`` for questions close to ``emb`` under ``version``."""
+        if self.max_entries <= 0:
+            return
+        xq = self._normalize(emb)
+        with self._lock:
+            org = self._org(org_id, version)
+            if org.version != version:
+                # built against an older corpus than the cache now holds
+                return
+            entry_id = org.next_id
+            org.next_id += 1
+            org.index.add_with_ids(xq, np.array([entry_id], dtype=np.int64))
+            org.entries[entry_id] = entry
+            if len(org.entries) > self.max_entries:
+                self._remove(org, [next(iter(org.entries))])
+
+    def clear(self, org_id: int | None = None):
+        with self._lock:
+            if org_id is None:
+                self._orgs.clear()
+            else:
+                self._orgs.pop(org_id, None)
+
+    def _org(self, org_id: int | None, version: int) -> _OrgCache:
+        org = self._orgs.get(org_id)
+        if org is None or org.version < version:
+            # first use, or the corpus changed: start over
+            org = self._orgs[org_id] = _OrgCache(self.dim, version)
+        return org
+
+    @staticmethod
+    def _remove(org: _OrgCache, entry_ids: List[int]):
+        org.index.remove_ids(np.asarray(entry_ids, dtype=np.int64))
+        for i in entry_ids:
+            org.entries.pop(i, None)
+
+    def _normalize(self, emb: np.ndarray) -> np.ndarray:
+        xq = np.array(emb, dtype=np.float32).reshape(1, self.dim)
+        faiss.normalize_L2(xq)
+        return xq
@@ -0,0 +1,159 @@
+"""Split document text into embedding-sized chunks.
+
+The default ``tokens`` strategy measures chunks with the embedder's own
+tokenizer, so every chunk fits the model's sequence limit instead of being
+silently truncated at encode time.  Paragraphs are tokenized in one batched
+call and the resulting character offsets are kept in numpy arrays; window
+ends are then snapped back to the last paragraph or sentence boundary with
+``searchsorted`` rather than per-token Python loops.  Chunks are slices of
+the original text, so paragraph breaks survive and no strings are rebuilt.
+
+``words`` reproduces the original 700/100 whitespace-word windows.
+"""
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+Span = Tuple[int, int]
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+# sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r"[.!?…][\"'”’)\]]*(?=\s)")
+_WORD = re.compile(r"\S+")
+_WHITESPACE = np.array([ord(c) for c in " \t\n\r\f\v\xa0\u2028\u2029"], dtype=np.uint32)
+
+
+def chunk_text(
+    text: str, chunk_size: int | None = None, overlap: int | None = None, strategy: str | None = None
+) -> List[str]:
+    """Chunk ``text``; see :func:`chunk_spans` for the parameters."""
+    return [text[s:e] for s, e in chunk_spans(text, chunk_size, overlap, strategy)]
+
+
+def chunk_spans(
+    text: str,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    strategy: str | None = None,
+) -> List[Span]:
+    """Return ``(char_start, char_end)`` of each chunk of ``text``.
+
+    Sizes are in tokens for the ``tokens`` strategy and in whitespace words
+    for ``words``; they default to ``settings.CHUNK_MAX_TOKENS`` /
+    ``CHUNK_OVERLAP_TOKENS`` and 700 / 100 respectively.
+    """
+    strategy = strategy or settings.CHUNK_STRATEGY
+    if strategy == "words":
+        return _word_spans(text, chunk_size or 700, 100 if overlap is None else overlap)
+    if strategy != "tokens":
+        raise ValueError(f"unknown CHUNK_STRATEGY {strategy!r}")
+    return _token_spans(
+        text,
+        chunk_size or settings.CHUNK_MAX_TOKENS,
+        settings.CHUNK_OVERLAP_TOKENS if overlap is None else overlap,
+    )
+
+
+def _word_spans(text: str, chunk_size: int, overlap: int) -> List[Span]:
+    bounds = np.array([m.span() for m in _WORD.finditer(text)], dtype=np.int64).reshape(-1, 2)
+    n = len(bounds)
+    if n == 0:
+        return []
+    first = np.arange(0, n, max(chunk_size - overlap, 1))
+    last = np.minimum(first + chunk_size, n) - 1
+    return list(zip(bounds[first, 0].tolist(), bounds[last, 1].tolist()))
+
+
+def _paragraphs(text: str) -> List[Span]:
+    out = []
+    pos = 0
+    for m in _PARAGRAPH_BREAK.finditer(text):
+        out.append((pos, m.start()))
+        pos = m.end()
+    out.append((pos, len(text)))
+    return [(s, e) for s, e in out if text[s:e].strip()]
+
+
+def _tokenize(text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Token char offsets of ``text`` plus the token indices that end a paragraph."""
+    from app.services import registry
+
+    paras = _paragraphs(text)
+    if not paras:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    enc = registry.get_embedder().tokenizer(
+        [text[s:e] for s, e in paras],
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+        verbose=False,
+    )
+    offsets = [
+        np.asarray(o, dtype=np.int64).reshape(-1, 2) + s
+        for o, (s, _) in zip(enc["offset_mapping"], paras)
+    ]
+    lengths = np.array([len(o) for o in offsets], dtype=np.int64)
+    offsets = np.concatenate(offsets)
+    return offsets[:, 0], offsets[:, 1], np.cumsum(lengths)
+
+
+def _last_in(cuts: np.ndarray, lo: int, hi: int) -> int | None:
+    """Largest cut position ``c`` with ``lo < c <= hi``."""
+    i = np.searchsorted(cuts, hi, side="right") - 1
+    if i >= 0 and cuts[i] > lo:
+        return int(cuts[i])
+    return None
+
+
+def _first_in(cuts: np.ndarray, lo: int, hi: int) -> int | None:
+    """Smallest cut position ``c`` with ``lo <= c < hi``."""
+    i = np.searchsorted(cuts, lo, side="left")
+    if i < len(cuts) and cuts[i] < hi:
+        return int(cuts[i])
+    return None
+
+
+def _token_spans(text: str, max_tokens: int, overlap: int) -> List[Span]:
+    starts, ends, para_cuts = _tokenize(text)
+    n = len(starts)
+    if n == 0:
+        return []
+    max_tokens = max(max_tokens, 1)
+    overlap = min(max(overlap, 0), max_tokens - 1)
+    # a cut at position i means "chunk ends after token i-1"
+    sentence_ends = np.array([m.end() for m in _SENTENCE_END.finditer(text)], dtype=np.int64)
+    sentence_cuts = np.searchsorted(ends, sentence_ends, side="left") + 1
+    all_cuts = np.union1d(sentence_cuts, para_cuts)
+    # last resort: never split inside a word (between word-piece tokens);
+    # a token starts a word if the character before it is whitespace
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    after_space = np.isin(codepoints[np.maximum(starts - 1, 0)], _WHITESPACE) | (starts == 0)
+    word_cuts = np.flatnonzero(after_space)
+
+    spans: List[Span] = []
+    s = 0
+    while s < n:
+        e = min(s + max_tokens, n)
+        cut = e
+        if e < n:
+            # prefer a paragraph break, then a sentence end, in the back half
+            lo = s + max_tokens // 2
+            cut = (
+                _last_in(para_cuts, lo, e)
+                or _last_in(sentence_cuts, lo, e)
+                or _last_in(word_cuts, s, e)
+                or e
+            )
+        spans.append((int(starts[s]), int(ends[cut - 1])))
+        if cut >= n:
+            break
+        # overlap the previous window, starting on a sentence (or at least a
+        # word) if one begins there
+        nxt = max(cut - overlap, s + 1)
+        s = _first_in(all_cuts, nxt, cut) or _first_in(word_cuts, nxt, cut) or nxt
+    return spans
@@ -0,0 +1,111 @@
+"""Fit conversation history and retrieved chunks into a prompt token budget.
+
+``chat_stream`` used to send the last ten messages and every retrieved
+chunk whatever their size.  :func:`pack_context` counts tokens with the
+local tokenizer (:meth:`OpenAIService.count_tokens_many`) and fills
+``settings.CONTEXT_TOKEN_BUDGET`` minus the fixed prompt text.  History
+is reserved up to ``CONTEXT_HISTORY_SHARE`` of it and chunks get the rest;
+space one side leaves unused goes to the other.  Chunks are taken in
+retrieval order and history newest first.  The first item that does not
+fit is cut to the remaining space, unless that leaves fewer than
+``CONTEXT_MIN_ITEM_TOKENS``, and everything after it is dropped.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from prometheus_client import Histogram
+
+from app.core.config import settings
+
+PROMPT_TOKENS = Histogram(
+    "app_prompt_tokens",
+    "Locally counted prompt tokens per chat request",
+    ["part"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+
+_SEPARATOR = "\n---\n"
+
+
+@dataclass
+class PackedContext:
+    history: List[str] = field(default_factory=list)
+    chunks: List[str] = field(default_factory=list)
+    # positions in the input ``chunks`` of the kept (possibly truncated) ones
+    chunk_indexes: List[int] = field(default_factory=list)
+    history_tokens: int = 0
+    chunk_tokens: int = 0
+    prompt_tokens: int = 0
+    dropped: int = 0
+    truncated: int = 0
+
+    @property
+    def contexts(self) -> List[str]:
+        return self.history + self.chunks
+
+
+def _fill(openai, texts: List[str], counts: List[int], limit: int, per_item: int, min_tokens: int):
+    """Greedy prefix of ``texts`` within ``limit``; returns ``(kept, used, truncated)``."""
+    kept: List[Tuple[int, str]] = []
+    used = 0
+    truncated = 0
+    for i, (t, n) in enumerate(zip(texts, counts)):
+        room = limit - used - per_item
+        if n <= room:
+            kept.append((i, t))
+            used += n + per_item
+            continue
+        if room >= min_tokens:
+            kept.append((i, openai.truncate_tokens(t, room)))
+            used += room + per_item
+            truncated += 1
+        break
+    return kept, used, truncated
+
+
+def pack_context(
+    openai,
+    message: str,
+    history: List[str],
+    chunks: List[str],
+    budget: int | None = None,
+    history_share: float | None = None,
+) -> PackedContext:
+    """Choose (and trim) the history and chunks that fit the prompt budget.
+
+    ``history`` is oldest first and ``chunks`` best first; the result keeps
+    those orders.  ``openai`` is an :class:`OpenAIService`, whose tokenizer
+    does the counting.
+    """
+    budget = settings.CONTEXT_TOKEN_BUDGET if budget is None else budget
+    share = settings.CONTEXT_HISTORY_SHARE if history_share is None else history_share
+    min_tokens = settings.CONTEXT_MIN_ITEM_TOKENS
+    per_item = openai.count_tokens(_SEPARATOR)
+    available = max(budget - openai.prompt_tokens(message, []), 0)
+
+    counts = openai.count_tokens_many(list(history) + list(chunks))
+    history_counts, chunk_counts = counts[: len(history)], counts[len(history):]
+    history_need = sum(history_counts) + per_item * len(history)
+    # history never takes more than its share; chunks get everything else
+    history_cap = min(history_need, int(available * min(max(share, 0.0), 1.0)))
+
+    packed = PackedContext()
+    kept_chunks, packed.chunk_tokens, truncated = _fill(
+        openai, chunks, chunk_counts, available - history_cap, per_item, min_tokens
+    )
+    packed.truncated += truncated
+    recent = list(reversed(history))
+    kept_history, packed.history_tokens, truncated = _fill(
+        openai, recent, list(reversed(history_counts)), available - packed.chunk_tokens, per_item, min_tokens
+    )
+    packed.truncated += truncated
+
+    packed.chunks = [t for _, t in kept_chunks]
+    packed.chunk_indexes = [i for i, _ in kept_chunks]
+    packed.history = [t for _, t in reversed(kept_history)]
+    packed.dropped = len(history) + len(chunks) - len(kept_history) - len(kept_chunks)
+    packed.prompt_tokens = openai.prompt_tokens(message, packed.contexts)
+    PROMPT_TOKENS.labels("total").observe(packed.prompt_tokens)
+    PROMPT_TOKENS.labels("history").observe(packed.history_tokens)
+    PROMPT_TOKENS.labels("chunks").observe(packed.chunk_tokens)
+    return packed
@@ -0,0 +1,98 @@
+"""Per-organization corpus version numbers for cache invalidation.
+
+Every transaction that adds, replaces or deletes chunks calls :func:`bump`
+just before committing, so the organization's row in ``corpus_versions``
+moves forward atomically with the chunks.  Row 0 is bumped by every change:
+it is the version of unscoped searches (``organization_id=None``), which
+span all partitions.  Caches derived from retrieval store the version
+they were built against and treat any other value as stale.  The FAISS
+writer stamps the versions a change produced into its snapshot, so a
+process can also tell whether its copy of the index has caught up
+(``FaissVectorStore.snapshot_version``).
+Reads go through a short per-process memo (``CORPUS_VERSION_CHECK_SECONDS``)
+so hot paths do not hit the database on every request; bumps made in this
+process are seen immediately, those from other processes within that
+interval.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+_GLOBAL = 0
+_memo: Dict[int, Tuple[int, float]] = {}
+_memo_lock = threading.Lock()
+
+
+def _key(organization_id: int | None) -> int:
+    return _GLOBAL if organization_id is None else int(organization_id)
+
+
+def bump(db: Session, organization_id: int | None) -> Tuple[int, int]:
+    """Advance the versions in ``db``'s transaction; the caller commits.
+
+    The rows stay locked until that commit, so call this last.  Returns
+    the new ``(organization version, global version)``.
+    """
+    # always the organization's row first, then the global one, so
+    # concurrent transactions lock in the same order
+    keys = [_GLOBAL] if organization_id is None else [_key(organization_id), _GLOBAL]
+    versions = []
+    for k in keys:
+        versions.append(
+            db.execute(
+                text(
+                    "INSERT INTO corpus_versions (organization_key, version) VALUES (:k, 1) "
+                    "ON CONFLICT (organization_key) DO UPDATE SET version = corpus_versions.version + 1 "
+                    "RETURNING version"
+                ),
+                {"k": k},
+            ).scalar_one()
+        )
+    with _memo_lock:
+        for k in keys:
+            _memo.pop(k, None)
+    return versions[0], versions[-1]
+
+
+def peek(organization_id: int | None) -> int | None:
+    """The memoized version if still fresh, without touching the database."""
+    with _memo_lock:
+        hit = _memo.get(_key(organization_id))
+    if hit is not None and time.monotonic() - hit[1] < settings.CORPUS_VERSION_CHECK_SECONDS:
+        return hit[0]
+    return None
+
+
+def current(organization_id: int | None) -> int | None:
+    """The organization's version, or None if it cannot be read.
+
+    Callers should bypass their cache on None rather than fail the request.
+    """
+    version = peek(organization_id)
+    if version is not None:
+        return version
+    k = _key(organization_id)
+    now = time.monotonic()
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            text("SELECT version FROM corpus_versions WHERE organization_key = :k"), {"k": k}
+        ).fetchone()
+    except Exception as e:
+        logger.warning(f"corpus version lookup failed: {e}")
+        return None
+    finally:
+        db.close()
+    version = row[0] if row else 0
+    with _memo_lock:
+        _memo[k] = (version, now)
+    return version
@@ -0,0 +1,154 @@
+"""Content-addressed, two-tier embedding cache.
+
+Embeddings are a pure function of the model and the text, so they are
+keyed by ``(model_name, content_hash(text))`` (the same SHA-256 stored in
+``document_chunks.content_hash``).  Lookups go to a bounded in-process LRU
+first, then to the ``embedding_cache`` table, which survives restarts and
+is shared by every web and ingest worker.  Only ingested chunk embeddings
+are written to the table (query embeddings stay in the LRU), and the ingest
+worker prunes it to ``settings.EMBEDDING_CACHE_MAX_ROWS`` rows, oldest
+first (:meth:`EmbeddingCache.prune`).  One instance per process is handed
+out by :func:`app.services.registry.get_embedding_cache`.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+import numpy as np
+from prometheus_client import Counter
+from sqlalchemy import bindparam, text
+
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_HITS = Counter("app_embedding_cache_hits_total", "Embedding cache hits", ["tier"])
+EMBEDDING_CACHE_MISSES = Counter("app_embedding_cache_misses_total", "Embeddings that had to be computed")
+
+
+def content_hash(text: str) -> str:
+    """Hex SHA-256 of ``text`` (UTF-8); matches the backfill in migration 0010."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of float32 vectors, backed by Postgres when ``persist``."""
+
+    def __init__(self, max_entries: int, model_name: str, persist: bool = True):
+        self.max_entries = max_entries
+        self.model_name = model_name
+        self.persist = persist
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for whichever of ``keys`` are known."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for k in keys:
+                v = self._data.get(k)
+                if v is not None:
+                    self._data.move_to_end(k)
+                    found[k] = v
+        if found:
+            EMBEDDING_CACHE_HITS.labels("memory").inc(len(found))
+        missing = [k for k in keys if k not in found]
+        if missing and self.persist:
+            stored = self._load(missing)
+            if stored:
+                EMBEDDING_CACHE_HITS.labels("db").inc(len(stored))
+                self._remember(stored)
+                found.update(stored)
+        n_missing = len(keys) - len(found)
+        if n_missing:
+            EMBEDDING_CACHE_MISSES.inc(n_missing)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray], persist: bool = True):
+        """Add freshly computed vectors to the LRU and, if ``persist``, the table."""
+        items = {k: np.asarray(v, dtype=np.float32) for k, v in items.items()}
+        self._remember(items)
+        if items and persist and self.persist:
+            self._store(items)
+
+    def prune(self, max_rows: int) -> int:
+        """Delete the oldest table rows beyond ``max_rows`` (0: no limit).
+
+        Evicted vectors are simply recomputed when next needed.  Returns
+        the number of rows deleted.
+        """
+        if not self.persist or max_rows <= 0:
+            return 0
+        db = SessionLocal()
+        try:
+            cutoff = db.execute(
+                text("SELECT created_at FROM embedding_cache ORDER BY created_at DESC LIMIT 1 OFFSET :n"),
+                {"n": max_rows},
+            ).scalar()
+            if cutoff is None:
+                return 0
+            res = db.execute(text("DELETE FROM embedding_cache WHERE created_at <= :cutoff"), {"cutoff": cutoff})
+            db.commit()
+            return res.rowcount
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"embedding cache pruning failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def clear(self):
+        """Drop the in-process tier (the table is left alone)."""
+        with self._lock:
+            self._data.clear()
+
+    def _remember(self, items: Dict[str, np.ndarray]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for k, v in items.items():
+                self._data[k] = v
+                self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _load(self, keys) -> Dict[str, np.ndarray]:
+        # the cache must never break embedding: on DB errors just recompute
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                text(
+                    "SELECT content_hash, embedding FROM embedding_cache "
+                    "WHERE model_name = :m AND content_hash IN :keys"
+                ).bindparams(bindparam("keys", expanding=True)),
+                {"m": self.model_name, "keys": keys},
+            )
+            return {h: np.frombuffer(bytes(blob), dtype=np.float32) for h, blob in rows}
+        except Exception as e:
+            logger.warning(f"embedding cache lookup failed: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def _store(self, items: Dict[str, np.ndarray]):
+        db = SessionLocal()
+        try:
+            db.execute(
+                text(
+                    "INSERT INTO embedding_cache (model_name, content_hash, embedding) "
+                    "VALUES (:m, :h, :e) ON CONFLICT DO NOTHING"
+                ),
+                [{"m": self.model_name, "h": k, "e": v.tobytes()} for k, v in items.items()],
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"embedding cache write failed: {e}")
+        finally:
+            db.close()
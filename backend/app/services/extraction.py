@@ -0,0 +1,159 @@
+"""Turn uploaded files into ingestion documents.
+
+PDF text extraction is CPU-bound pure Python, so pages are split into
+ranges of ``settings.PDF_PAGES_PER_TASK`` and extracted in the shared
+process pool (``registry.get_process_pool``); workers reopen the file from
+its path, so only page numbers and text cross the process boundary.  This
+module is imported by those pool processes and must stay free of heavy
+imports (models, FAISS, DB).
+"""
+import io
+import os
+import time
+from collections import deque
+from typing import IO, Iterator, List, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from app.core.config import settings
+
+# optional PDF extraction library
+try:
+    from PyPDF2 import PdfReader
+except ImportError:
+    PdfReader = None
+
+PDF_PAGE_EXTRACT_SECONDS = Histogram(
+    "app_pdf_page_extract_seconds", "Time spent extracting text from one PDF page"
+)
+PDF_PAGES_EXTRACTED = Counter("app_pdf_pages_extracted_total", "PDF pages extracted during ingestion")
+
+
+def iter_upload_documents(path: str, filename: str) -> Iterator[dict]:
+    """Lazily turn a stored upload into ingestion documents.
+
+    PDFs yield one document per page; other files are decoded as text and
+    yielded in segments of about ``settings.INGEST_TEXT_SEGMENT_CHARS``
+    characters (split on whitespace, numbered through ``page``) so a large
+    text file is never held in memory at once.
+
+    Size and page caps are checked, and the PDF is opened, eagerly: a file
+    that is too large or malformed raises ``ValueError`` from this call
+    rather than halfway through ingestion.
+    """
+    size = os.path.getsize(path)
+    if settings.INGEST_MAX_FILE_BYTES and size > settings.INGEST_MAX_FILE_BYTES:
+        raise ValueError(f"{filename} is {size} bytes; the limit is {settings.INGEST_MAX_FILE_BYTES}")
+    if filename.lower().endswith(".pdf") and PdfReader is not None:
+        try:
+            n_pages = len(PdfReader(path).pages)
+        except Exception as e:
+            raise ValueError(f"PDF parsing failed: {e}")
+        if settings.PDF_MAX_PAGES and n_pages > settings.PDF_MAX_PAGES:
+            raise ValueError(f"{filename} has {n_pages} pages; the limit is {settings.PDF_MAX_PAGES}")
+        return _iter_pdf_pages(path, filename, n_pages)
+    return _iter_text_segments(path, filename)
+
+
+def extract_text(path: str, filename: str) -> str:
+    """Whole-file text, PDF pages joined by newlines."""
+    return "\n".join(d["text"] for d in iter_upload_documents(path, filename))
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[Tuple[str, float]]:
+    """Pool task: ``(text, seconds)`` for pages ``start..stop-1`` of ``path``."""
+    reader = PdfReader(path)
+    out = []
+    for i in range(start, stop):
+        t0 = time.perf_counter()
+        txt = reader.pages[i].extract_text() or ""
+        out.append((txt, time.perf_counter() - t0))
+    return out
+
+
+def _iter_pdf_pages(path: str, filename: str, n_pages: int) -> Iterator[dict]:
+    from app.services import registry
+
+    step = max(settings.PDF_PAGES_PER_TASK, 1)
+    ranges = deque((s, min(s + step, n_pages)) for s in range(0, n_pages, step))
+    pool = registry.get_process_pool()
+    if pool is None:
+        # extraction pool disabled: same work, in the calling thread
+        tasks = (_extract_page_range(path, s, e) for s, e in ranges)
+    else:
+        tasks = _ordered_results(pool, path, ranges, window=2 * max(settings.PDF_EXTRACT_WORKERS, 1))
+    page_no = 0
+    for pages in tasks:
+        for txt, seconds in pages:
+            page_no += 1
+            PDF_PAGE_EXTRACT_SECONDS.observe(seconds)
+            PDF_PAGES_EXTRACTED.inc()
+            yield {"text": txt, "source": filename, "filename": filename, "page": page_no}
+
+
+def _ordered_results(pool, path: str, ranges: deque, window: int):
+    """Keep at most ``window`` page ranges in flight; yield results in page order."""
+    pending = deque()
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < window:
+                s, e = ranges.popleft()
+                pending.append(pool.submit(_extract_page_range, path, s, e))
+            yield pending.popleft().result()
+    finally:
+        for f in pending:
+            f.cancel()
+
+
+def _iter_text_segments(path: str, filename: str) -> Iterator[dict]:
+    # the file is only opened once iteration starts, and closed when it
+    # ends or the generator is discarded
+    segment_chars = max(settings.INGEST_TEXT_SEGMENT_CHARS, 1)
+    pending = ""
+    segments: List[str] = []
+    page = 0
+
+    def doc(text_: str, page_: int | None) -> dict:
+        return {"text": text_, "source": filename, "filename": filename, "page": page_}
+
+    with open(path, "rb") as fh, _decode_stream(fh) as reader:
+        while True:
+            block = reader.read(segment_chars)
+            if not block:
+                break
+            pending += block
+            if len(pending) < segment_chars:
+                continue
+            # cut at the last whitespace so no word is split across segments
+            cut = max(pending.rfind(" "), pending.rfind("\n"))
+            if cut <= 0:
+                cut = len(pending)
+            segments.append(pending[:cut])
+            pending = pending[cut:]
+            # hold one segment back so a single-segment file keeps page=None
+            if len(segments) > 1:
+                page += 1
+                yield doc(segments.pop(0), page)
+        if pending.strip() or not segments:
+            segments.append(pending)
+        if page == 0 and len(segments) == 1:
+            yield doc(segments[0], None)
+            return
+        for seg in segments:
+            page += 1
+            yield doc(seg, page)
+
+
+def _decode_stream(fileobj: IO[bytes]):
+    """Wrap a binary upload in a text reader: UTF-8 if it decodes, else latin-1."""
+    sample = 65536
+    head = fileobj.read(sample)
+    fileobj.seek(0)
+    encoding = "utf-8"
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # a multi-byte character cut at the end of a full sample is still utf-8
+        if len(head) < sample or e.start < len(head) - 3:
+            encoding = "latin-1"
+    return io.TextIOWrapper(fileobj, encoding=encoding, errors="ignore")
@@ -0,0 +1,433 @@
+"""Background ingestion jobs backed by the ``ingest_jobs`` table.
+
+``POST /api/admin/ingest`` only persists the upload under
+``settings.INGEST_UPLOAD_DIR`` and inserts a ``queued`` row.  A small pool
+of worker processes (:func:`start_workers`, launched from
+``main.on_startup``) polls the table, claims jobs with a conditional
+``UPDATE`` so that no two workers take the same job, and runs them through
+``IngestionService.ingest_documents``.  No external broker is needed: every
+web worker may start its own pool and they coordinate through the database.
+
+Only the worker holding the FAISS writer lock (see
+``FaissVectorStore.acquire_writer``) claims jobs, so every change to the
+vector store is made by that one process and published to the web workers
+through snapshots.  The other workers are standbys that take over when it
+exits.
+
+Workers can also run on their own (with ``INGEST_WORKERS=0`` on the web
+tier)::
+
+    python -m app.services.ingest_jobs
+"""
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import IO, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.ingest_job import IngestJob
+# worker processes do not import app.main: register the FK targets of the
+# tables they write to
+import app.models.organization  # noqa: F401
+import app.models.user  # noqa: F401
+from app.services.extraction import extract_text, iter_upload_documents
+
+logger = logging.getLogger(__name__)
+
+_processes: List[multiprocessing.Process] = []
+_stop_event = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _job_dir(job_id: int) -> str:
+    return os.path.join(settings.INGEST_UPLOAD_DIR, f"job_{job_id}")
+
+
+def enqueue_job(
+    db: Session,
+    texts: List[str],
+    files: List[Tuple[str, IO[bytes]]],
+    organization_id: int | None = None,
+    user_id: int | None = None,
+    kind: str = "ingest",
+    document_id: int | None = None,
+) -> IngestJob:
+    """Persist raw texts and uploaded files to disk and queue a job for them.
+
+    ``files`` is a list of ``(filename, fileobj)``; the file objects are
+    copied in blocks, never read into memory whole.  Raises ``ValueError``
+    if a file exceeds ``settings.INGEST_MAX_FILE_BYTES``.
+
+    ``kind="delete"`` / ``"replace"`` jobs act on ``document_id`` (a
+    replacement takes its content from the first text or file), so that
+    these changes, too, reach FAISS through the writer process.
+    """
+    job = IngestJob(
+        organization_id=organization_id,
+        user_id=user_id,
+        kind=kind,
+        document_id=document_id,
+        status="queued",
+        stage="queued",
+        files="[]",
+    )
+    db.add(job)
+    db.flush()  # assigns job.id for the upload directory
+    job_dir = _job_dir(job.id)
+    os.makedirs(job_dir, exist_ok=True)
+    manifest = []
+    try:
+        for i, t in enumerate(texts):
+            path = os.path.join(job_dir, f"text_{i}.txt")
+            with open(path, "w", encoding="utf-8") as out:
+                out.write(t)
+            manifest.append({"kind": "text", "path": path, "filename": None})
+        for i, (filename, fileobj) in enumerate(files):
+            # never trust the client-supplied name as a path component
+            path = os.path.join(job_dir, f"file_{i}")
+            _copy_capped(fileobj, path, filename)
+            manifest.append({"kind": "file", "path": path, "filename": filename})
+        job.files = json.dumps(manifest)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    db.refresh(job)
+    logger.info(f"queued ingest job {job.id} ({len(manifest)} inputs)")
+    return job
+
+
+def _copy_capped(fileobj: IO[bytes], path: str, filename: str):
+    limit = settings.INGEST_MAX_FILE_BYTES
+    written = 0
+    with open(path, "wb") as out:
+        while True:
+            block = fileobj.read(1024 * 1024)
+            if not block:
+                break
+            written += len(block)
+            if limit and written > limit:
+                raise ValueError(f"{filename} exceeds the upload limit of {limit} bytes")
+            out.write(block)
+
+
+def job_status(job: IngestJob) -> dict:
+    """Public view of a job, including chunk throughput so far."""
+    elapsed = None
+    throughput = None
+    if job.started_at is not None:
+        started = job.started_at if job.started_at.tzinfo else job.started_at.replace(tzinfo=timezone.utc)
+        end = job.finished_at or _now()
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        elapsed = max((end - started).total_seconds(), 0.0)
+        if elapsed > 0:
+            throughput = round((job.chunks_done or 0) / elapsed, 2)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "document_id": job.document_id,
+        "status": job.status,
+        "stage": job.stage,
+        "documents_done": job.documents_done or 0,
+        "chunks_done": job.chunks_done or 0,
+        "elapsed_seconds": round(elapsed, 2) if elapsed is not None else None,
+        "chunks_per_second": throughput,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def claim_next_job(db: Session, worker: str) -> Optional[int]:
+    """Atomically move the oldest queued job to ``running``; returns its id.
+
+    The ``status = 'queued'`` guard on the UPDATE makes the claim safe when
+    several workers race for the same row: only one sees ``rowcount == 1``.
+    """
+    while True:
+        row = db.execute(
+            text("SELECT id FROM ingest_jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+        ).fetchone()
+        if not row:
+            db.rollback()
+            return None
+        now = _now()
+        res = db.execute(
+            text(
+                "UPDATE ingest_jobs SET status = 'running', stage = 'extracting', worker = :w, "
+                "started_at = :now, updated_at = :now WHERE id = :id AND status = 'queued'"
+            ),
+            {"w": worker, "now": now, "id": row[0]},
+        )
+        db.commit()
+        if res.rowcount == 1:
+            return row[0]
+
+
+def fail_stale_jobs(db: Session) -> int:
+    """Mark running jobs whose worker stopped heart-beating as failed.
+
+    A running job's ``updated_at`` is refreshed by :func:`_heartbeat` even
+    while no batch commits (e.g. during a long PDF extraction), so only jobs
+    whose worker died go stale.  Their committed batches stay ingested, so
+    they are not retried blindly.
+    """
+    cutoff = _now() - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+    res = db.execute(
+        text(
+            "UPDATE ingest_jobs SET status = 'failed', stage = 'failed', "
+            "error = 'worker stopped responding', finished_at = :now "
+            "WHERE status = 'running' AND updated_at < :cutoff"
+        ),
+        {"now": _now(), "cutoff": cutoff},
+    )
+    db.commit()
+    return res.rowcount
+
+
+def _update_job(db: Session, job_id: int, **fields):
+    fields["updated_at"] = _now()
+    assignments = ", ".join(f"{k} = :{k}" for k in fields)
+    db.execute(text(f"UPDATE ingest_jobs SET {assignments} WHERE id = :id"), {**fields, "id": job_id})
+    db.commit()
+
+
+@contextmanager
+def _heartbeat(job_id: int):
+    """Refresh the job's ``updated_at`` every ``INGEST_JOB_HEARTBEAT_SECONDS`` until exit.
+
+    Runs on its own thread and session, independent of progress updates.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(settings.INGEST_JOB_HEARTBEAT_SECONDS):
+            db = SessionLocal()
+            try:
+                _update_job(db, job_id)
+            except Exception as e:
+                logger.warning(f"could not record the heartbeat of ingest job {job_id}: {e}")
+            finally:
+                db.close()
+
+    thread = threading.Thread(target=beat, name=f"ingest-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _iter_job_documents(manifest: List[dict]) -> Iterator[dict]:
+    for entry in manifest:
+        if entry["kind"] == "text":
+            with open(entry["path"], encoding="utf-8") as fh:
+                yield {"text": fh.read(), "source": None, "filename": None, "page": None}
+        else:
+            yield from iter_upload_documents(entry["path"], entry["filename"])
+
+
+def _replacement(manifest: List[dict]) -> Tuple[str, str | None]:
+    """New content of a replace job (PDF pages joined) and the file it came from."""
+    entry = manifest[0]
+    if entry["kind"] == "text":
+        with open(entry["path"], encoding="utf-8") as fh:
+            return fh.read(), None
+    return extract_text(entry["path"], entry["filename"]), entry["filename"]
+
+
+def run_job(job_id: int, service=None):
+    """Process one claimed job, recording progress and the outcome on its row.
+
+    The row's heartbeat is kept fresh while the job runs, even when no batch
+    commits for a while (a long PDF extraction, a large delete).
+    """
+    with _heartbeat(job_id):
+        _run_job(job_id, service)
+
+
+def _run_job(job_id: int, service=None):
+    from app.services.ingestion_service import IngestionService
+
+    db = SessionLocal()
+    kind = "ingest"
+    try:
+        start = time.time()
+        try:
+            job = db.get(IngestJob, job_id)
+            if job is None:
+                # deleted after it was claimed; there is no row to record on
+                logger.warning(f"ingest job {job_id} no longer exists, skipping it")
+                return
+            kind, document_id = job.kind, job.document_id
+            organization_id = job.organization_id
+            manifest = json.loads(job.files)
+            db.rollback()
+            service = service or IngestionService()
+            if kind == "delete":
+                _update_job(db, job_id, stage="deleting")
+                chunks = service.delete_document(document_id, organization_id=organization_id)
+                _update_job(db, job_id, documents_done=1, chunks_done=chunks)
+            elif kind == "replace":
+                content, source = _replacement(manifest)
+                _update_job(db, job_id, stage="ingesting")
+                chunks = service.replace_document(document_id, content, organization_id=organization_id, source=source)
+                _update_job(db, job_id, documents_done=1, chunks_done=chunks)
+            else:
+                def progress(documents: int, chunks: int):
+                    _update_job(db, job_id, stage="ingesting", documents_done=documents, chunks_done=chunks)
+
+                service.ingest_documents(
+                    _iter_job_documents(manifest), organization_id=organization_id, progress=progress
+                )
+            _update_job(db, job_id, stage="indexing")
+            # publish the new vectors to the web workers right away
+            service.rag.vs.flush()
+        except Exception as e:
+            db.rollback()
+            logger.exception(f"{kind} job {job_id} failed")
+            _update_job(db, job_id, status="failed", stage="failed", error=str(e) or type(e).__name__, finished_at=_now())
+            return
+        finally:
+            shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+        _update_job(db, job_id, status="succeeded", stage="done", finished_at=_now())
+        logger.info(f"{kind} job {job_id} finished in {time.time() - start:.2f}s")
+    finally:
+        db.close()
+
+
+def _prepare_store(vs):
+    """Writer start-up: drop the snapshots of a reset database, split a legacy index."""
+    from app.models.document import Document
+
+    db = SessionLocal()
+    try:
+        if db.query(Document.id).first() is None:
+            if vs.partition_keys or vs.has_legacy_snapshot:
+                vs.clear()
+                logger.info("removed stale faiss snapshots")
+        elif vs.has_legacy_snapshot:
+            vs.migrate_legacy(dict(db.query(Document.id, Document.organization_id).all()))
+    finally:
+        db.close()
+
+
+def _stopping(stop_event, parent_pid: int | None) -> bool:
+    if stop_event is not None and stop_event.is_set():
+        return True
+    # workers are not daemonic (they own the PDF process pool), so a web
+    # worker that died without stop_workers() would leave them running
+    return parent_pid is not None and os.getppid() != parent_pid
+
+
+def _wait(stop_event, seconds: float):
+    if stop_event is not None:
+        stop_event.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def worker_loop(name: str, stop_event=None, parent_pid: int | None = None):
+    """Claim and run jobs until ``stop_event`` is set or process ``parent_pid`` exits.
+
+    Jobs are only claimed while this process is the FAISS writer; until
+    then it waits as a standby.
+    """
+    from app.services import registry
+
+    logger.info(f"ingest worker {name} started")
+    service = None
+    vs = registry.get_vector_store()
+    try:
+        while not _stopping(stop_event, parent_pid):
+            if not vs.is_writer:
+                if not vs.acquire_writer():
+                    _wait(stop_event, settings.INGEST_POLL_SECONDS)
+                    continue
+                _prepare_store(vs)
+                vs.start_persister()
+                logger.info(f"ingest worker {name} is the faiss writer")
+            db = SessionLocal()
+            try:
+                if fail_stale_jobs(db):
+                    logger.warning("marked stale ingest jobs as failed")
+                job_id = claim_next_job(db, name)
+            except Exception:
+                logger.exception("could not poll ingest_jobs")
+                job_id = None
+            finally:
+                db.close()
+            if job_id is None:
+                _wait(stop_event, settings.INGEST_POLL_SECONDS)
+                continue
+            if service is None:
+                from app.services.ingestion_service import IngestionService
+
+                service = IngestionService()
+            run_job(job_id, service=service)
+            # chunk embeddings are only written here, so this keeps the table bounded
+            service.openai.cache.prune(settings.EMBEDDING_CACHE_MAX_ROWS)
+    finally:
+        # flushes pending vectors and hands the writer lock to a standby
+        vs.stop_persister()
+        registry.close(wait=True)
+        logger.info(f"ingest worker {name} stopped")
+
+
+def start_workers(n: int | None = None) -> int:
+    """Spawn ``n`` (default ``settings.INGEST_WORKERS``) worker processes.
+
+    They are not daemonic, since a daemonic process may not start the PDF
+    extraction pool; :func:`stop_workers` must be called on shutdown.
+    """
+    global _stop_event
+    n = settings.INGEST_WORKERS if n is None else n
+    if n <= 0 or _processes:
+        return 0
+    # spawn, not fork: the parent holds threads, DB connections and models
+    ctx = multiprocessing.get_context("spawn")
+    _stop_event = ctx.Event()
+    host = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(n):
+        p = ctx.Process(
+            target=worker_loop, args=(f"{host}/{i}", _stop_event, os.getpid()), name=f"ingest-worker-{i}"
+        )
+        p.start()
+        _processes.append(p)
+    return n
+
+
+def stop_workers(timeout: float = 10.0):
+    """Ask workers to finish their current job and exit; kill stragglers."""
+    global _stop_event
+    if _stop_event is not None:
+        _stop_event.set()
+    for p in _processes:
+        p.join(timeout)
+        if p.is_alive():
+            p.terminate()
+    _processes.clear()
+    _stop_event = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    worker_loop(f"{socket.gethostname()}:{os.getpid()}")
@@ -1,32 +1,105 @@
-from typing import List, Tuple, Optional
+from typing import Callable, Iterable, Iterator, List, Tuple, Optional
 from app.services.openai_service import OpenAIService
 from app.services.rag_service import RAGService
 from app.db.session import SessionLocal
-from sqlalchemy import text
+from app.core.config import settings
+from app.models.document import Document, DocumentChunk
+from app.services.embedding_cache import content_hash
+from app.services import corpus_version
+from sqlalchemy import bindparam, insert, select, text
+import io
+import queue
+import threading
 import time
 
-# optional PDF extraction library; will be imported lazily in helper
-try:
-    from PyPDF2 import PdfReader
-except ImportError:
-    PdfReader = None
+# upload -> documents helpers live in a light module so the PDF process
+# pool does not import models; re-exported for existing callers
+from app.services.extraction import iter_upload_documents  # noqa: F401
 
 
-# simple whitespace-based chunker; approximates token count
-# chunk size and overlap can be adjusted via settings if desired
+# chunkers live in app.services.chunking; re-exported for existing callers
+from app.services.chunking import chunk_spans, chunk_text  # noqa: F401
 
-def chunk_text(text: str, chunk_size: int = 700, overlap: int = 100) -> List[str]:
-    tokens = text.split()
-    if not tokens:
-        return []
-    chunks = []
-    start = 0
-    while start < len(tokens):
-        end = min(start + chunk_size, len(tokens))
-        chunk = " ".join(tokens[start:end])
-        chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
+
+# column order for the COPY fast path
+_CHUNK_COPY_COLUMNS = (
+    "document_id", "chunk_index", "content", "source", "filename", "page", "organization_id",
+    "content_hash", "is_duplicate", "char_start", "char_end",
+)
+
+
+def _copy_value(value) -> str:
+    """Encode one field for PostgreSQL's COPY text format.
+
+    ``text`` columns cannot hold NUL characters (PDF extraction sometimes
+    yields them), so they are dropped rather than failing the whole COPY.
+    """
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\x00", "")
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class _Stage(threading.Thread):
+    """Pipeline stage: runs ``target`` and always closes its output queue."""
+
+    def __init__(self, name: str, target, out: "queue.Queue", stop: threading.Event):
+        super().__init__(name=name, daemon=True)
+        self._target_fn = target
+        self._out = out
+        self._stop_event = stop
+        self.error: BaseException | None = None
+
+    def run(self):
+        try:
+            self._target_fn()
+        except BaseException as e:
+            self.error = e
+            self._stop_event.set()
+        finally:
+            _put(self._out, _DONE, self._stop_event, force=True)
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+
+_DONE = object()
+
+
+def _put(q: "queue.Queue", item, stop: threading.Event, force: bool = False) -> bool:
+    """Blocking put that gives up once ``stop`` is set (unless ``force``)."""
+    while True:
+        if stop.is_set() and not force:
+            return False
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if force and stop.is_set():
+                # consumer is gone; make room for the end marker
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+def _drain(q: "queue.Queue", stop: threading.Event) -> Iterator:
+    """Yield items from ``q`` until the end marker or ``stop``."""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
 
 
 import logging
@@ -34,7 +107,7 @@ import logging
 class IngestionService:
     def __init__(self):
         self.openai = OpenAIService()
-        self.rag = RAGService()
+        self.rag = RAGService(openai=self.openai)
         self.logger = logging.getLogger(__name__)
 
     def ingest_texts(self, texts: List[str], names: Optional[List[str]] = None, organization_id: int | None = None):
@@ -53,51 +126,371 @@ class IngestionService:
             })
         return self.ingest_documents(docs, organization_id=organization_id)
 
-    def ingest_documents(self, docs: List[dict], organization_id: int | None = None):
-        """Process a list of documents with metadata.
+    def ingest_documents(
+        self,
+        docs: Iterable[dict],
+        organization_id: int | None = None,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> int:
+        """Stream documents through chunk -> embed -> insert -> index.
 
-        Each entry in ``docs`` should be a dict containing at least:
+        ``docs`` may be a list or any iterable (e.g. :func:`iter_upload_documents`);
+        each entry is a dict containing at least:
             - text: the raw string to ingest
         Optional keys are ``source`` (identifier), ``filename`` and ``page``.
+
+        Chunking and embedding run in their own threads, connected by queues
+        of at most ``settings.INGEST_QUEUE_SIZE`` batches of
+        ``settings.INGEST_BATCH_SIZE`` chunks, so peak memory does not depend
+        on the size of the input.  Every batch is committed and indexed as
+        soon as it is embedded, which makes early chunks searchable before
+        the rest of the upload is processed.  If a stage fails, batches
+        already committed stay ingested.
+
+        Chunks whose text is already indexed in the organization (or earlier
+        in this run) are neither embedded nor added to FAISS; depending on
+        ``settings.INGEST_DEDUP_MODE`` their rows are stored as duplicates
+        (``link``) or dropped (``skip``).
+
+        ``progress``, if given, is called after each committed batch with the
+        running totals of documents and chunks.
+
+        Returns the number of documents ingested.
         """
         self.logger.info("starting ingestion", extra={})
+        batch_size = max(settings.INGEST_BATCH_SIZE, 1)
+        queue_size = max(settings.INGEST_QUEUE_SIZE, 1)
+        chunk_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        embed_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+
+        def produce():
+            batch: List[tuple] = []
+            for seq, doc in enumerate(docs):
+                body = doc.get("text", "")
+                spans = chunk_spans(body)
+                # empty documents still get a row; they carry no chunk
+                items = [
+                    (seq, doc, ci, body[a:b], content_hash(body[a:b]), False, (a, b))
+                    for ci, (a, b) in enumerate(spans)
+                ] or [(seq, doc, None, None, None, False, None)]
+                for item in items:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        if not _put(chunk_q, batch, stop):
+                            return
+                        batch = []
+            if batch:
+                _put(chunk_q, batch, stop)
+
+        def embed():
+            seen: set = set()  # hashes indexed earlier in this run
+            lookup_db = SessionLocal()
+            try:
+                for batch in _drain(chunk_q, stop):
+                    batch = self._mark_duplicates(lookup_db, batch, seen, organization_id)
+                    texts = [it[3] for it in batch if it[2] is not None and not it[5]]
+                    embs = self.openai.get_embeddings(texts, persist=True)
+                    if not _put(embed_q, (batch, embs), stop):
+                        return
+            finally:
+                lookup_db.close()
+
+        stages = [
+            _Stage("ingest-chunk", produce, chunk_q, stop),
+            _Stage("ingest-embed", embed, embed_q, stop),
+        ]
+        for stage in stages:
+            stage.start()
+
+        db = SessionLocal()
+        doc_ids: dict = {}  # document sequence number -> documents.id
+        n_chunks = 0
+        try:
+            for batch, embs in _drain(embed_q, stop):
+                n_chunks += self._persist_batch(db, batch, embs, doc_ids, organization_id)
+                if progress is not None:
+                    progress(len(doc_ids), n_chunks)
+            # surface a failure in any stage to the caller
+            for stage in stages:
+                stage.join()
+                stage.raise_error()
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            for stage in stages:
+                stage.join()
+            db.close()
+            self.logger.info(f"finished ingestion: {len(doc_ids)} documents / {n_chunks} chunks")
+        return len(doc_ids)
+
+    def _persist_batch(
+        self, db, batch: List[tuple], embs, doc_ids: dict, organization_id: int | None
+    ) -> int:
+        """Insert one embedded batch, commit it and add its vectors to FAISS."""
+        start = time.time()
+        new_docs = []
+        for seq, doc, *_ in batch:
+            if seq not in doc_ids:
+                doc_ids[seq] = None
+                new_docs.append((seq, doc))
+        ids = self._insert_documents(db, [doc for _, doc in new_docs], organization_id)
+        for (seq, _), doc_id in zip(new_docs, ids):
+            doc_ids[seq] = doc_id
+
+        rows: List[dict] = []
+        meta: List[Tuple[int, int]] = []
+        skip_duplicates = settings.INGEST_DEDUP_MODE == "skip"
+        for seq, doc, ci, chunk, h, dup, span in batch:
+            if ci is None or (dup and skip_duplicates):
+                continue
+            rows.append(
+                {
+                    "document_id": doc_ids[seq],
+                    "chunk_index": ci,
+                    "content": chunk,
+                    "source": doc.get("source"),
+                    "filename": doc.get("filename"),
+                    "page": doc.get("page"),
+                    "organization_id": organization_id,
+                    "content_hash": h,
+                    "is_duplicate": dup,
+                    "char_start": span[0],
+                    "char_end": span[1],
+                }
+            )
+            if not dup:
+                meta.append((doc_ids[seq], ci))
+        self._insert_chunk_rows(db, rows)
+        versions = corpus_version.bump(db, organization_id)
+        db.commit()
+        if meta:
+            self.rag.vs.add(embs, meta, organization_id=organization_id)
+        self.rag.vs.stamp_corpus_version(organization_id, *versions)
+        self.logger.info(
+            f"persisted {len(new_docs)} documents / {len(rows)} chunks in {time.time() - start:.2f}s"
+        )
+        return len(rows)
+
+    @staticmethod
+    def _indexed_hashes(db, hashes, organization_id: int | None) -> set:
+        """Subset of ``hashes`` that already have a vector in the organization."""
+        if not hashes:
+            return set()
+        q = select(DocumentChunk.content_hash).where(
+            DocumentChunk.content_hash.in_(list(hashes)),
+            DocumentChunk.is_duplicate.is_(False),
+        )
+        if organization_id is None:
+            q = q.where(DocumentChunk.organization_id.is_(None))
+        else:
+            q = q.where(DocumentChunk.organization_id == organization_id)
+        return set(db.execute(q.distinct()).scalars())
+
+    def _mark_duplicates(self, db, batch: List[tuple], seen: set, organization_id: int | None) -> List[tuple]:
+        """Flag chunk items whose text is already indexed (in the DB or ``seen``)."""
+        if settings.INGEST_DEDUP_MODE == "off":
+            return batch
+        hashes = {it[4] for it in batch if it[2] is not None and it[4] not in seen}
+        indexed = self._indexed_hashes(db, hashes, organization_id)
+        db.rollback()  # don't hold a snapshot open between batches
+        out = []
+        for seq, doc, ci, chunk, h, _, span in batch:
+            dup = False
+            if ci is not None:
+                dup = h in seen or h in indexed
+                seen.add(h)
+            out.append((seq, doc, ci, chunk, h, dup, span))
+        return out
+
+    def _promote_duplicates(self, db, hashes, organization_id: int | None) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """Give orphaned duplicate chunks a vector after their original is gone.
+
+        For each hash in ``hashes`` that no longer has an indexed chunk in the
+        organization, the oldest remaining duplicate row becomes the indexed
+        one.  Returns ``(texts, meta)`` to be embedded once the caller commits.
+        """
+        hashes = set(hashes) - self._indexed_hashes(db, hashes, organization_id)
+        if not hashes:
+            return [], []
+        q = (
+            select(DocumentChunk.id, DocumentChunk.content_hash, DocumentChunk.document_id,
+                   DocumentChunk.chunk_index, DocumentChunk.content)
+            .where(DocumentChunk.content_hash.in_(list(hashes)), DocumentChunk.is_duplicate.is_(True))
+            .order_by(DocumentChunk.id)
+        )
+        if organization_id is None:
+            q = q.where(DocumentChunk.organization_id.is_(None))
+        else:
+            q = q.where(DocumentChunk.organization_id == organization_id)
+        promoted = {}
+        for row in db.execute(q):
+            promoted.setdefault(row.content_hash, row)
+        if not promoted:
+            return [], []
+        db.execute(
+            text("UPDATE document_chunks SET is_duplicate = false WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": [r.id for r in promoted.values()]},
+        )
+        rows = list(promoted.values())
+        return [r.content for r in rows], [(r.document_id, r.chunk_index) for r in rows]
+
+    def _indexed_chunk_hashes(self, db, doc_id: int) -> List[str]:
+        return list(
+            db.execute(
+                text(
+                    "SELECT DISTINCT content_hash FROM document_chunks "
+                    "WHERE document_id = :d AND NOT is_duplicate AND content_hash IS NOT NULL"
+                ),
+                {"d": doc_id},
+            ).scalars()
+        )
+
+    @staticmethod
+    def _insert_documents(db, docs: List[dict], organization_id: int | None) -> List[int]:
+        """Insert document records in one statement; ids come back in input order."""
+        if not docs:
+            return []
+        rows = [
+            {"content": d.get("text", ""), "name": d.get("source"), "organization_id": organization_id}
+            for d in docs
+        ]
+        stmt = insert(Document).returning(Document.id, sort_by_parameter_order=True)
+        return list(db.execute(stmt, rows).scalars())
+
+    @staticmethod
+    def _chunk_rows(
+        doc_id: int,
+        body: str,
+        spans: List[Tuple[int, int]],
+        source: str | None,
+        filename: str | None,
+        page: int | None,
+        organization_id: int | None,
+    ) -> List[dict]:
+        return [
+            {
+                "document_id": doc_id,
+                "chunk_index": ci,
+                "content": body[a:b],
+                "source": source,
+                "filename": filename,
+                "page": page,
+                "organization_id": organization_id,
+                "content_hash": content_hash(body[a:b]),
+                "is_duplicate": False,
+                "char_start": a,
+                "char_end": b,
+            }
+            for ci, (a, b) in enumerate(spans)
+        ]
+
+    def _insert_chunk_rows(self, db, rows: List[dict]):
+        """Bulk insert ``document_chunks`` rows.
+
+        On psycopg2 the rows are streamed with ``COPY ... FROM STDIN``; other
+        drivers fall back to an ``executemany`` insert.
+        """
+        if not rows:
+            return
+        if settings.INGEST_USE_COPY and db.get_bind().dialect.driver == "psycopg2":
+            self._copy_chunk_rows(db, rows)
+        else:
+            db.execute(insert(DocumentChunk), rows)
+
+    @staticmethod
+    def _copy_chunk_rows(db, rows: List[dict]):
+        # COPY text format: tab-separated, \N for NULL, backslash escapes
+        buf = io.StringIO()
+        for r in rows:
+            buf.write("\t".join(_copy_value(r[c]) for c in _CHUNK_COPY_COLUMNS))
+            buf.write("\n")
+        buf.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY document_chunks ({', '.join(_CHUNK_COPY_COLUMNS)}) FROM STDIN", buf)
+        finally:
+            cursor.close()
+
+    def delete_document(self, doc_id: int, organization_id: int | None = None) -> int:
+        """Remove a document, its chunks and their vectors.
+
+        ``organization_id`` must be the document's own organization so the
+        right FAISS partition is tombstoned.  Changes FAISS, so it runs in
+        the writer process: the admin route queues a ``delete`` ingest job.
+        Returns the number of chunks deleted.
+        """
+        db = SessionLocal()
+        try:
+            hashes = self._indexed_chunk_hashes(db, doc_id)
+            res = db.execute(text("DELETE FROM document_chunks WHERE document_id = :d"), {"d": doc_id})
+            db.execute(text("DELETE FROM documents WHERE id = :d"), {"d": doc_id})
+            # duplicates elsewhere in the org lost their vector with this document
+            texts, meta = self._promote_duplicates(db, hashes, organization_id)
+            versions = corpus_version.bump(db, organization_id)
+            db.commit()
+            # tombstone only once the rows are gone for good; searches that
+            # hit the vectors meanwhile just find no row for them
+            removed = self.rag.vs.remove_documents([doc_id], organization_id=organization_id)
+            if meta:
+                self.rag.add_documents(texts, meta, organization_id=organization_id)
+            self.rag.vs.stamp_corpus_version(organization_id, *versions)
+            self.logger.info(
+                f"deleted document {doc_id} ({res.rowcount} chunks, {removed} vectors, {len(meta)} duplicates promoted)"
+            )
+            return res.rowcount
+        finally:
+            db.close()
+
+    def replace_document(
+        self,
+        doc_id: int,
+        text_content: str,
+        organization_id: int | None = None,
+        source: str | None = None,
+    ) -> int:
+        """Re-ingest an existing document with new content, keeping its id.
+
+        Old chunks and vectors are dropped and the new text is chunked and
+        embedded as on first ingest.  Like :meth:`delete_document` this runs
+        in the FAISS writer (a ``replace`` ingest job).  Raises
+        ``ValueError`` if the document no longer exists.  Returns the new
+        chunk count.
+        """
         db = SessionLocal()
         try:
-            chunk_texts: List[str] = []
-            chunk_meta: List[Tuple[int, int]] = []  # (doc_id, chunk_index)
-            for doc in docs:
-                text_content = doc.get("text", "")
-                source = doc.get("source")
-                filename = doc.get("filename")
-                page = doc.get("page")
-                # insert document record; store original full text and source
-                res = db.execute(
-                    text("INSERT INTO documents (content, name, organization_id) VALUES (:c, :n, :org) RETURNING id"),
-                    {"c": text_content, "n": source, "org": organization_id},
-                )
-                doc_id = res.fetchone()[0]
-                self.logger.info(f"persisted document {doc_id}", extra={"source": source, "filename": filename, "page": page})
-                # chunk the text
-                chunks = chunk_text(text_content)
-                for ci, chunk in enumerate(chunks):
-                    db.execute(
-                        text(
-                            "INSERT INTO document_chunks "
-                            "(document_id, chunk_index, content, source, filename, page, organization_id) "
-                            "VALUES (:d, :ci, :c, :s, :f, :p, :org)"
-                        ),
-                        {"d": doc_id, "ci": ci, "c": chunk, "s": source, "f": filename, "p": page, "org": organization_id},
-                    )
-                    chunk_texts.append(chunk)
-                    chunk_meta.append((doc_id, ci))
+            if db.execute(text("SELECT 1 FROM documents WHERE id = :d"), {"d": doc_id}).first() is None:
+                raise ValueError(f"document {doc_id} no longer exists")
+            old_hashes = self._indexed_chunk_hashes(db, doc_id)
+            db.execute(text("DELETE FROM document_chunks WHERE document_id = :d"), {"d": doc_id})
+            db.execute(
+                text("UPDATE documents SET content = :c, name = COALESCE(:n, name) WHERE id = :d"),
+                {"c": text_content, "n": source, "d": doc_id},
+            )
+            rows = self._chunk_rows(doc_id, text_content, chunk_spans(text_content), source, source, None, organization_id)
+            if settings.INGEST_DEDUP_MODE != "off":
+                indexed = self._indexed_hashes(db, {r["content_hash"] for r in rows}, organization_id)
+                seen: set = set()
+                for r in rows:
+                    r["is_duplicate"] = r["content_hash"] in indexed or r["content_hash"] in seen
+                    seen.add(r["content_hash"])
+                if settings.INGEST_DEDUP_MODE == "skip":
+                    rows = [r for r in rows if not r["is_duplicate"]]
+            self._insert_chunk_rows(db, rows)
+            texts, meta = self._promote_duplicates(db, old_hashes, organization_id)
+            fresh = [r for r in rows if not r["is_duplicate"]]
+            texts += [r["content"] for r in fresh]
+            meta += [(doc_id, r["chunk_index"]) for r in fresh]
+            versions = corpus_version.bump(db, organization_id)
             db.commit()
-            # now embed chunks in vector store; measure time
-            if chunk_texts:
-                self.logger.info(f"embedding {len(chunk_texts)} chunks")
-                start = time.time()
-                self.rag.add_documents(chunk_texts, chunk_meta)
-                elapsed = time.time() - start
-                self.logger.info(f"embeddings generated in {elapsed:.2f}s")
+            self.rag.vs.remove_documents([doc_id], organization_id=organization_id)
+            if meta:
+                self.rag.add_documents(texts, meta, organization_id=organization_id)
+            self.rag.vs.stamp_corpus_version(organization_id, *versions)
+            self.logger.info(f"replaced document {doc_id} with {len(rows)} chunks")
+            return len(rows)
         finally:
             db.close()
-            self.logger.info("finished ingestion")
@@ -0,0 +1,214 @@
+"""Run the sentence-transformers model with ONNX Runtime.
+
+Selected with ``EMBEDDING_BACKEND=onnx``.  The transformer of
+``settings.EMBEDDING_MODEL`` is exported once with ``torch.onnx`` into a
+directory under ``settings.EMBEDDING_ONNX_DIR`` together with its tokenizer
+and pooling config, and optionally int8-quantized with ONNX Runtime's
+dynamic quantization.  :class:`OnnxEmbedder` implements the part of the
+``SentenceTransformer`` API the app uses (``encode``, ``tokenizer``,
+``max_seq_length``), so ``OpenAIService`` and the chunker work unchanged
+with either backend.
+
+Export ahead of time (e.g. while building the image) so that the first
+request does not pay for it::
+
+    python -m app.services.onnx_embedder --quantize
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model.int8.onnx"
+CONFIG_FILE = "embedder.json"
+
+
+def model_dir(model_name: str | None = None) -> str:
+    """Directory holding the exported ``model_name`` (default: the configured model)."""
+    name = (model_name or settings.EMBEDDING_MODEL).replace("/", "__")
+    return os.path.join(settings.EMBEDDING_ONNX_DIR, name)
+
+
+def export_model(model_name: str, out_dir: str):
+    """Export ``model_name``'s transformer, tokenizer and pooling config to ``out_dir``.
+
+    The export is written to a temporary sibling directory and renamed into
+    place, so processes racing on first use never see a partial model.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0], st[1]
+    sample = transformer.tokenizer(["export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+    axes = {n: {0: "batch", 1: "sequence"} for n in names + ["last_hidden_state"]}
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".export-", dir=parent)
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                _Encoder(transformer.auto_model).eval(),
+                tuple(sample[n] for n in names),
+                os.path.join(tmp, MODEL_FILE),
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=axes,
+                opset_version=14,
+                do_constant_folding=True,
+            )
+        transformer.tokenizer.save_pretrained(tmp)
+        config = {
+            "model": model_name,
+            "pooling": pooling.get_pooling_mode_str(),
+            "normalize": any(type(m).__name__ == "Normalize" for m in st),
+            "max_seq_length": st.max_seq_length,
+            "dim": st.get_sentence_embedding_dimension(),
+        }
+        with open(os.path.join(tmp, CONFIG_FILE), "w") as fh:
+            json.dump(config, fh)
+        os.rename(tmp, out_dir)
+        logger.info(f"exported {model_name} to {out_dir}")
+    except OSError:
+        # another process finished the same export first
+        if not os.path.exists(os.path.join(out_dir, CONFIG_FILE)):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def quantize_model(out_dir: str):
+    """Write an int8 dynamically quantized copy of the exported model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    dst = os.path.join(out_dir, QUANTIZED_FILE)
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        quantize_dynamic(os.path.join(out_dir, MODEL_FILE), tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    logger.info(f"quantized {out_dir} to int8")
+
+
+def load_embedder(model_name: str | None = None, quantize: bool | None = None) -> "OnnxEmbedder":
+    """Return an :class:`OnnxEmbedder`, exporting/quantizing the model if needed."""
+    model_name = model_name or settings.EMBEDDING_MODEL
+    quantize = settings.EMBEDDING_ONNX_QUANTIZE if quantize is None else quantize
+    path = model_dir(model_name)
+    if not os.path.exists(os.path.join(path, CONFIG_FILE)):
+        export_model(model_name, path)
+    if quantize and not os.path.exists(os.path.join(path, QUANTIZED_FILE)):
+        quantize_model(path)
+    return OnnxEmbedder(path, quantized=quantize, threads=settings.EMBEDDING_ONNX_THREADS)
+
+
+class OnnxEmbedder:
+    """ONNX Runtime stand-in for ``SentenceTransformer`` on an exported model."""
+
+    def __init__(self, path: str, quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(path, CONFIG_FILE)) as fh:
+            self.config = json.load(fh)
+        if self.config["pooling"] not in ("mean", "cls", "max"):
+            raise ValueError(f"unsupported pooling mode {self.config['pooling']!r}")
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.max_seq_length = self.config["max_seq_length"]
+        self.quantized = quantized
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(path, QUANTIZED_FILE if quantized else MODEL_FILE),
+            sess_options=opts,
+            providers=["CPUExecutionProvider"],
+        )
+        self._inputs = [i.name for i in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dim"]
+
+    def encode(
+        self,
+        sentences: str | List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False,
+        **_,
+    ) -> np.ndarray:
+        """Embed ``sentences`` as float32, like ``SentenceTransformer.encode``.
+
+        Always returns numpy; ``convert_to_numpy`` and ``show_progress_bar``
+        are accepted for signature compatibility only.
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        out = np.empty((len(sentences), self.config["dim"]), dtype=np.float32)
+        batch_size = max(batch_size, 1)
+        for i in range(0, len(sentences), batch_size):
+            batch = sentences[i : i + batch_size]
+            enc = self.tokenizer(
+                batch, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+            )
+            feeds = {
+                n: (enc[n] if n in enc else np.zeros_like(enc["input_ids"])).astype(np.int64)
+                for n in self._inputs
+            }
+            hidden = self.session.run(None, feeds)[0]
+            out[i : i + len(batch)] = self._pool(hidden, enc["attention_mask"])
+        if normalize_embeddings or self.config["normalize"]:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        mode = self.config["pooling"]
+        if mode == "cls":
+            return hidden[:, 0]
+        mask = mask[:, :, None].astype(np.float32)
+        if mode == "max":
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX.")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--quantize", action="store_true", help="also write the int8 model")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    path = model_dir(args.model)
+    if not os.path.exists(os.path.join(path, CONFIG_FILE)):
+        export_model(args.model, path)
+    if args.quantize:
+        quantize_model(path)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,152 @@
 import os
-from typing import List, Iterator
+from typing import AsyncIterator, List, Iterator, Optional, Tuple
 from app.core.config import settings
+from app.services import registry
+from app.services.embedding_cache import content_hash
+import numpy as np
 
-from sentence_transformers import SentenceTransformer
-import httpx
 import json
 
 
 class OpenAIService:
     """Embedding/chat service using local SentenceTransformer and Groq API
     via raw HTTP (no OpenAI SDK).
+
+    Construction is cheap: the embedder and HTTP clients come from the
+    process-wide :mod:`app.services.registry`.  Every chat method has an
+    ``a``-prefixed async twin for use from async routes.
     """
 
     def __init__(self):
-        # local embedder
-        self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        # shared local embedder and httpx clients for Groq
+        self.embedder = registry.get_embedder()
+        self.cache = registry.get_embedding_cache()
         self.chat_model = "llama-3.1-8b-instant"
-        # httpx client for Groq
-        self.client = httpx.Client(
-            base_url="https://api.groq.com/openai/v1",
-            headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}"},
-            timeout=30.0,
-        )
+        self.client = registry.get_http_client()
+        self.aclient = registry.get_async_http_client()
+
+    def get_embeddings(self, texts: List[str], persist: bool = False) -> np.ndarray:
+        """Embed ``texts`` as a float32 ``(len(texts), dim)`` array.
 
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        Each distinct uncached text is encoded once; results are looked up
+        in (and added to) the shared content-hash cache, so repeated chunks
+        and questions skip the transformer.  Only with ``persist`` (ingested
+        chunks) are new vectors also written to the ``embedding_cache``
+        table; query embeddings stay in the in-process tier.  Vectors are
+        unit-normalized when ``settings.EMBEDDING_NORMALIZE`` is set.
+        """
         if not texts:
-            return []
-        embs = self.embedder.encode(texts)
-        try:
-            return embs.tolist()
-        except Exception:
-            # work around numpy types
-            return [list(map(float, e)) for e in embs]
+            return np.empty((0, settings.EMBEDDING_DIM), dtype=np.float32)
+        keys = [content_hash(t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+        if missing:
+            embs = self._encode(list(missing.values()))
+            computed = dict(zip(missing.keys(), embs))
+            self.cache.put_many(computed, persist=persist)
+            found.update(computed)
+        return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Run the model over ``texts`` in length-sorted batches.
+
+        Sorting by length first means each batch holds similarly sized
+        inputs, so little compute is spent on padding; rows are written
+        back in input order.
+        """
+        batch_size = max(settings.EMBEDDING_BATCH_SIZE, 1)
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        out = None
+        for i in range(0, len(order), batch_size):
+            idx = order[i : i + batch_size]
+            embs = self.embedder.encode(
+                [texts[j] for j in idx],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=settings.EMBEDDING_NORMALIZE,
+                show_progress_bar=False,
+            )
+            if out is None:
+                out = np.empty((len(texts), embs.shape[1]), dtype=np.float32)
+            out[idx] = embs
+        return out
 
     def chat_with_context(self, message: str, contexts: List[str]):
         """Return tuple of (content, tokens_used_or_None)"""
-        prompt = self._build_prompt(message, contexts)
+        resp = self.client.post("/chat/completions", json=self._chat_payload(message, contexts))
+        resp.raise_for_status()
+        return self._parse_completion(resp.json())
+
+    async def achat_with_context(self, message: str, contexts: List[str]):
+        """Async variant of :meth:`chat_with_context` on the shared AsyncClient."""
+        resp = await self.aclient.post("/chat/completions", json=self._chat_payload(message, contexts))
+        resp.raise_for_status()
+        return self._parse_completion(resp.json())
+
+    def stream_chat_with_context(
+        self, message: str, contexts: List[str], usage: Optional[dict] = None
+    ) -> Iterator[str]:
+        """Yield completion tokens as they arrive.
+
+        If ``usage`` is given it is filled with ``total_tokens`` once the
+        stream ends, taken from the provider's final usage chunk when present
+        and otherwise estimated locally via :meth:`count_tokens`.
+        """
+        payload = self._chat_payload(message, contexts, stream=True)
+        reported = None
+        parts: List[str] = []
+        with self.client.stream("POST", "/chat/completions", json=payload) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                done, content, chunk_usage = self._parse_stream_line(line)
+                if done:
+                    break
+                if chunk_usage is not None:
+                    reported = chunk_usage
+                if content:
+                    parts.append(content)
+                    yield content
+        self._fill_usage(usage, reported, payload, parts)
+
+    async def astream_chat_with_context(
+        self, message: str, contexts: List[str], usage: Optional[dict] = None
+    ) -> AsyncIterator[str]:
+        """Async variant of :meth:`stream_chat_with_context`.
+
+        Nothing blocks the event loop while waiting on Groq, so one worker
+        can hold many concurrent streams.
+        """
+        payload = self._chat_payload(message, contexts, stream=True)
+        reported = None
+        parts: List[str] = []
+        async with self.aclient.stream("POST", "/chat/completions", json=payload) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                done, content, chunk_usage = self._parse_stream_line(line)
+                if done:
+                    break
+                if chunk_usage is not None:
+                    reported = chunk_usage
+                if content:
+                    parts.append(content)
+                    yield content
+        self._fill_usage(usage, reported, payload, parts)
+
+    def _chat_payload(self, message: str, contexts: List[str], stream: bool = False) -> dict:
         payload = {
             "model": self.chat_model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": [{"role": "user", "content": self._build_prompt(message, contexts)}],
         }
-        resp = self.client.post("/chat/completions", json=payload)
-        resp.raise_for_status()
-        data = resp.json()
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    @staticmethod
+    def _parse_completion(data: dict):
         # safe traversal
         try:
             content = data["choices"][0]["message"]["content"]
@@ -51,43 +155,93 @@ class OpenAIService:
         # try to get token usage if available
         usage = None
         try:
-            usage = data.get("usage", {}).get("total_tokens") or data.get("usage", {}).get("total_tokens")
+            usage = data.get("usage", {}).get("total_tokens")
             if usage is not None:
                 usage = int(usage)
         except Exception:
             usage = None
         return content, usage
 
-    def stream_chat_with_context(self, message: str, contexts: List[str]) -> Iterator[str]:
-        prompt = self._build_prompt(message, contexts)
-        payload = {
-            "model": self.chat_model,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": True,
-        }
-        with self.client.stream("POST", "/chat/completions", json=payload) as r:
-            r.raise_for_status()
-            for line in r.iter_lines():
-                if not line:
-                    continue
-                # handle bytes or str
-                if isinstance(line, bytes):
-                    try:
-                        text = line.decode("utf-8")
-                    except Exception:
-                        continue
-                else:
-                    text = line
-                # Groq uses data: prefix similar to OpenAI
-                if text.startswith("data: "):
-                    try:
-                        chunk = json.loads(text[len("data: "):])
-                        delta = chunk.get("choices", [])[0].get("delta", {})
-                        content = delta.get("content")
-                        if content:
-                            yield content
-                    except Exception:
-                        continue
+    @staticmethod
+    def _parse_stream_line(line) -> Tuple[bool, Optional[str], Optional[int]]:
+        """Decode one SSE line into ``(done, content, total_tokens)``."""
+        if not line:
+            return False, None, None
+        # handle bytes or str
+        if isinstance(line, bytes):
+            try:
+                text = line.decode("utf-8")
+            except Exception:
+                return False, None, None
+        else:
+            text = line
+        # Groq uses data: prefix similar to OpenAI
+        if not text.startswith("data: "):
+            return False, None, None
+        body = text[len("data: "):]
+        if body.strip() == "[DONE]":
+            return True, None, None
+        try:
+            chunk = json.loads(body)
+        except Exception:
+            return False, None, None
+        # usage arrives on the last chunk, either OpenAI-style or under
+        # Groq's ``x_groq`` extension
+        total = None
+        chunk_usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+        if chunk_usage and chunk_usage.get("total_tokens") is not None:
+            total = chunk_usage["total_tokens"]
+        content = None
+        choices = chunk.get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+        return False, content, total
+
+    def _fill_usage(self, usage: Optional[dict], reported, payload: dict, parts: List[str]):
+        if usage is None:
+            return
+        try:
+            usage["total_tokens"] = int(reported)
+            usage["estimated"] = False
+        except (TypeError, ValueError):
+            prompt = payload["messages"][0]["content"]
+            usage["total_tokens"] = self.count_tokens(prompt) + self.count_tokens("".join(parts))
+            usage["estimated"] = True
+
+    def count_tokens(self, text: str) -> int:
+        """Approximate token count using the local embedder's tokenizer.
+
+        This is not the chat model's tokenizer, but it is close enough for
+        billing fallbacks and budgeting without a network round trip.
+        """
+        if not text:
+            return 0
+        return len(self.embedder.tokenizer.encode(text, add_special_tokens=False))
+
+    def count_tokens_many(self, texts: List[str]) -> List[int]:
+        """:meth:`count_tokens` for several texts in one tokenizer call."""
+        if not texts:
+            return []
+        enc = self.embedder.tokenizer(
+            texts, add_special_tokens=False, return_attention_mask=False, return_token_type_ids=False, verbose=False
+        )
+        return [len(ids) for ids in enc["input_ids"]]
+
+    def truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """The longest prefix of ``text`` with at most ``max_tokens`` tokens."""
+        if max_tokens <= 0:
+            return ""
+        enc = self.embedder.tokenizer(
+            text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+        )
+        offsets = enc["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[: offsets[max_tokens - 1][1]]
+
+    def prompt_tokens(self, message: str, contexts: List[str]) -> int:
+        """Local estimate of the size of the prompt sent for ``message``."""
+        return self.count_tokens(self._build_prompt(message, contexts))
 
     def _build_prompt(self, message: str, contexts: List[str]) -> str:
         context_block = "\n---\n".join(contexts) if contexts else ""
@@ -0,0 +1,127 @@
+"""Cross-request micro-batching of query embeddings.
+
+Every chat request embeds one short query.  Encoding them one by one wastes
+the transformer's batch efficiency exactly when many arrive together, so
+:class:`QueryBatcher` queues them and a single background thread encodes
+whatever arrived within ``settings.QUERY_BATCH_MAX_WAIT_MS`` of the first
+(at most ``QUERY_BATCH_MAX_SIZE``) in one call, then resolves each caller's
+future.  Sync callers block on :meth:`QueryBatcher.embed`; async callers
+await ``asyncio.wrap_future(batcher.submit(query))`` and hold no thread
+meanwhile.  One instance per process comes from
+:func:`app.services.registry.get_query_batcher`.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+from prometheus_client import Histogram
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_SIZE = Histogram(
+    "app_query_embedding_batch_size",
+    "Queries encoded together by the query micro-batcher",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUERY_QUEUE_SECONDS = Histogram(
+    "app_query_embedding_queue_seconds",
+    "Time a query waited in the micro-batcher before its batch was encoded",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+_STOP = object()
+
+
+class QueryBatcher:
+    """Coalesce concurrent ``embed_fn([text])`` calls into batched calls.
+
+    ``embed_fn`` takes a list of texts and returns one vector per text (e.g.
+    ``OpenAIService.get_embeddings``).  With ``max_batch <= 1`` every call
+    goes straight to ``embed_fn`` in the caller's thread.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], np.ndarray], max_batch: int, max_wait: float):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max(max_wait, 0.0)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, text: str) -> Future:
+        """Queue ``text``; the returned future resolves to its vector."""
+        if self.max_batch <= 1:
+            fut = Future()
+            try:
+                fut.set_result(self.embed_fn([text])[0])
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def embed(self, text: str) -> np.ndarray:
+        """Blocking form of :meth:`submit`."""
+        return self.submit(text).result()
+
+    def close(self, timeout: float = 5.0):
+        """Encode what is already queued, then stop the batching thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    # past the deadline, still take whatever is already queued
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._encode(batch)
+
+    def _encode(self, batch):
+        start = time.perf_counter()
+        QUERY_BATCH_SIZE.observe(len(batch))
+        live = []
+        for text, fut, queued_at in batch:
+            QUERY_QUEUE_SECONDS.observe(start - queued_at)
+            if fut.set_running_or_notify_cancel():
+                live.append((text, fut))
+        if not live:
+            return
+        try:
+            embs = self.embed_fn([text for text, _ in live])
+        except Exception as e:
+            logger.exception("query embedding batch failed")
+            for _, fut in live:
+                fut.set_exception(e)
+            return
+        for (_, fut), emb in zip(live, embs):
+            fut.set_result(emb)
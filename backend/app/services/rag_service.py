@@ -1,37 +1,105 @@
 from app.rag.vector_store import FaissVectorStore
+import asyncio
+import functools
 import time
 import logging
 from app.services.openai_service import OpenAIService
-from typing import List, Tuple
+from app.services import corpus_version, registry
+from typing import Dict, List, Tuple
 from app.db.session import SessionLocal
 from app.db.base import Base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, tuple_
 from app.core.config import settings
-from sqlalchemy.orm import sessionmaker
-from app import models
+from sqlalchemy.orm import Session, sessionmaker
+from app.models.document import DocumentChunk
+from app.rag import hybrid
+from prometheus_client import Histogram
+
+RETRIEVAL_LEG_SECONDS = Histogram(
+    "app_retrieval_leg_seconds", "Latency of one retrieval leg of a search", ["leg"]
+)
 
 
 class RAGService:
-    def __init__(self):
-        self.vs = FaissVectorStore()
-        self.openai = OpenAIService()
+    def __init__(self, openai: OpenAIService | None = None):
+        self.vs = registry.get_vector_store()
+        self.openai = openai or OpenAIService()
         self.logger = logging.getLogger(__name__)
 
-    def add_documents(self, texts: List[str], meta: List[Tuple[int, int]]):
+    def add_documents(
+        self, texts: List[str], meta: List[Tuple[int, int]], organization_id: int | None = None
+    ):
         """`meta` is a list of tuples (document_id, chunk_index) corresponding to each text.
 
-        Embeddings are generated via the OpenAIService and added to the FAISS store.
+        Embeddings are generated via the OpenAIService and added to the
+        FAISS partition of ``organization_id``.
         This method logs how long the embedding step took and how many vectors were
         added.
         """
         start = time.time()
-        embs = self.openai.get_embeddings(texts)
-        self.vs.add(embs, meta)
+        embs = self.openai.get_embeddings(texts, persist=True)
+        self.vs.add(embs, meta, organization_id=organization_id)
         elapsed = time.time() - start
         self.logger.info(f"generated {len(texts)} embeddings in {elapsed:.2f}s")
 
+    async def asearch(
+        self,
+        query: str,
+        top_k: int = 5,
+        org_id: int | None = None,
+        db: Session | None = None,
+        emb=None,
+    ) -> List[dict]:
+        """Async :meth:`search`; pass ``emb`` if the query is already embedded.
+
+        The query is embedded by the shared micro-batcher without holding a
+        thread.  Meanwhile the full-text leg runs on the bounded retrieval
+        executor, as do the FAISS leg and the chunk lookup, so none of the
+        CPU or DB work blocks the event loop.
+        """
+        cache = registry.get_result_cache()
+        if cache is None:
+            return await self._asearch(query, top_k, org_id, db, emb)
+        key = cache.key(org_id, query, top_k)
+        version = corpus_version.peek(org_id)
+        if version is None:
+            loop = asyncio.get_running_loop()
+            version = await loop.run_in_executor(registry.get_executor(), corpus_version.current, org_id)
+        if version is not None:
+            hits = cache.get(key, version)
+            if hits is not None:
+                return hits
+        cacheable = self._snapshot_current(org_id, version)
+        results = await self._asearch(query, top_k, org_id, db, emb)
+        if cacheable:
+            cache.put(key, version, results)
+        return results
+
+    async def _asearch(
+        self, query: str, top_k: int, org_id: int | None, db: Session | None, emb
+    ) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        executor = registry.get_executor()
+        n = self._candidates(top_k)
+        lexical = None
+        if settings.HYBRID_SEARCH:
+            # the request session is free meanwhile: nothing else uses it
+            # until the chunk lookup, which waits for this leg
+            lexical = loop.run_in_executor(executor, self._lexical_leg, query, n, org_id, db)
+        try:
+            if emb is None:
+                emb = await asyncio.wrap_future(registry.get_query_batcher().submit(query))
+            vector_hits = await loop.run_in_executor(executor, self._vector_leg, emb, n, org_id)
+        finally:
+            # never return (or raise) with the leg still using the session
+            lexical_hits = await lexical if lexical is not None else []
+        return await loop.run_in_executor(
+            executor,
+            functools.partial(self._finish, query, vector_hits, lexical_hits, top_k, org_id, db),
+        )
+
     def search(
-        self, query: str, top_k: int = 5, org_id: int | None = None
+        self, query: str, top_k: int = 5, org_id: int | None = None, db: Session | None = None
     ) -> List[dict]:
         """Return list of results with content, metadata and score.
 
@@ -43,45 +111,185 @@ class RAGService:
             - source (str|None)
             - filename (str|None)
             - page (int|None)
+
+        With ``settings.HYBRID_SEARCH`` the FAISS hits are fused with a
+        PostgreSQL full-text search (see :mod:`app.rag.hybrid`); ``score`` is
+        then the reciprocal-rank-fusion score (higher is better) and
+        ``vector_score`` / ``lexical_score`` hold each leg's own value, or
+        None if the chunk came from the other leg only.  Otherwise ``score``
+        is the FAISS distance (lower is better).
+
+        With ``settings.RERANK_ENABLED`` more candidates are retrieved and a
+        cross-encoder keeps the best ``min(top_k, RERANK_TOP_N)``, ordered by
+        their added ``rerank_score`` (see :mod:`app.services.reranker`).
+
+        Pass the request's ``db`` session to avoid opening a new one.  The
+        query is embedded through the process-wide micro-batcher, so
+        concurrent searches share one encoder call.  Results are cached per
+        ``(org_id, normalized query, top_k)`` until the organization's
+        corpus changes (see :mod:`app.services.result_cache`), provided this
+        process's FAISS snapshot had caught up with that corpus version.
+        """
+        cache = registry.get_result_cache()
+        version = corpus_version.current(org_id) if cache is not None else None
+        if version is not None:
+            key = cache.key(org_id, query, top_k)
+            hits = cache.get(key, version)
+            if hits is not None:
+                return hits
+        cacheable = self._snapshot_current(org_id, version)
+        emb = registry.get_query_batcher().embed(query)
+        results = self.search_embedding(emb, top_k=top_k, org_id=org_id, db=db, query=query)
+        if cacheable:
+            cache.put(key, version, results)
+        return results
+
+    def _snapshot_current(self, org_id: int | None, version: int | None) -> bool:
+        """Whether the vectors about to be searched reflect corpus ``version``.
+
+        A web worker reloads the writer's snapshots only periodically, so
+        right after a change its FAISS copy may still be older than the
+        database; results found then must not be cached under the new
+        version.  Checked before searching: a reload can only move the
+        snapshot forward.
+        """
+        return version is not None and self.vs.snapshot_version(org_id) == version
+
+    def search_embedding(
+        self,
+        emb,
+        top_k: int = 5,
+        org_id: int | None = None,
+        db: Session | None = None,
+        query: str | None = None,
+    ) -> List[dict]:
+        """:meth:`search` for an already embedded query.
+
+        The full-text leg and re-ranking need the query text and are
+        skipped without it.
         """
-        emb = self.openai.get_embeddings([query])[0]
-        hits = self.vs.search(emb, top_k=top_k)
-        results: List[dict] = []
-        from app.db.session import SessionLocal
+        n = self._candidates(top_k)
+        vector_hits = self._vector_leg(emb, n, org_id)
+        lexical_hits = []
+        if settings.HYBRID_SEARCH and query:
+            lexical_hits = self._lexical_leg(query, n, org_id, db)
+        return self._finish(query, vector_hits, lexical_hits, top_k, org_id, db)
 
-        db = SessionLocal()
-        from sqlalchemy import text
+    @staticmethod
+    def _candidates(top_k: int) -> int:
+        """Hits to request from each retrieval leg."""
+        n = top_k
+        if settings.HYBRID_SEARCH:
+            n = max(n, settings.HYBRID_CANDIDATES)
+        if settings.RERANK_ENABLED:
+            n = max(n, settings.RERANK_CANDIDATES)
+        return n
+
+    def _finish(
+        self,
+        query: str | None,
+        vector_hits: List[Tuple[int, int, float]],
+        lexical_hits: List[Tuple[int, int, float]],
+        top_k: int,
+        org_id: int | None,
+        db: Session | None,
+    ) -> List[dict]:
+        """Load the results and, when enabled, re-rank them down to the best few."""
+        reranker = registry.get_reranker() if query else None
+        if reranker is None:
+            return self._load_results(vector_hits, lexical_hits, top_k, org_id, db)
+        candidates = self._load_results(
+            vector_hits, lexical_hits, max(settings.RERANK_CANDIDATES, top_k), org_id, db
+        )
+        return reranker.rerank(query, candidates, max(min(top_k, settings.RERANK_TOP_N), 1))
+
+    def _vector_leg(self, emb, n: int, org_id: int | None) -> List[Tuple[int, int, float]]:
+        with RETRIEVAL_LEG_SECONDS.labels("vector").time():
+            return self.vs.search(emb, top_k=n, organization_id=org_id)
+
+    def _lexical_leg(
+        self, query: str, n: int, org_id: int | None, db: Session | None = None
+    ) -> List[Tuple[int, int, float]]:
+        """Full-text hits, or [] where unavailable: lexical search is best effort."""
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            if not hybrid.fulltext_available(db):
+                return []
+            with RETRIEVAL_LEG_SECONDS.labels("lexical").time():
+                return hybrid.fulltext_search(db, query, n, org_id)
+        except Exception as e:
+            db.rollback()
+            self.logger.warning(f"full-text search failed, using vector results only: {e}")
+            return []
+        finally:
+            if own_session:
+                db.close()
+
+    def _load_results(
+        self,
+        vector_hits: List[Tuple[int, int, float]],
+        lexical_hits: List[Tuple[int, int, float]],
+        top_k: int,
+        org_id: int | None,
+        db: Session | None,
+    ) -> List[dict]:
+        """Fuse the legs (when hybrid) and load the chunk rows of the best ``top_k``."""
+        if settings.HYBRID_SEARCH:
+            vector_scores = {(d, ci): s for d, ci, s in vector_hits}
+            lexical_scores = {(d, ci): s for d, ci, s in lexical_hits}
+            fused = hybrid.reciprocal_rank_fusion([vector_hits, lexical_hits], k=settings.HYBRID_RRF_K)
+            ranked = fused[:top_k]
+        else:
+            ranked = [((d, ci), s) for d, ci, s in vector_hits[:top_k]]
+        if not ranked:
+            return []
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
         try:
             start = time.time()
-            for doc_id, chunk_idx, score in hits:
-                if org_id is not None:
-                    stmt = text(
-                        "SELECT content, source, filename, page "
-                        "FROM document_chunks "
-                        "WHERE document_id = :d AND chunk_index = :ci "
-                        "AND organization_id = :org"
-                    )
-                    row = db.execute(stmt, {"d": doc_id, "ci": chunk_idx, "org": org_id}).fetchone()
-                else:
-                    stmt = text(
-                        "SELECT content, source, filename, page "
-                        "FROM document_chunks "
-                        "WHERE document_id = :d AND chunk_index = :ci"
-                    )
-                    row = db.execute(stmt, {"d": doc_id, "ci": chunk_idx}).fetchone()
-                if row:
-                    content, source, filename, page = row
-                    results.append({
-                        "content": content,
-                        "document_id": doc_id,
-                        "chunk_index": chunk_idx,
-                        "score": score,
-                        "source": source,
-                        "filename": filename,
-                        "page": page,
-                    })
+            rows = self._fetch_chunks(db, [key for key, _ in ranked], org_id)
+            results: List[dict] = []
+            # iterate in ranked order so the ranking is preserved
+            for (doc_id, chunk_idx), score in ranked:
+                row = rows.get((doc_id, chunk_idx))
+                if row is None:
+                    continue
+                result = {
+                    "content": row.content,
+                    "document_id": doc_id,
+                    "chunk_index": chunk_idx,
+                    "score": score,
+                    "source": row.source,
+                    "filename": row.filename,
+                    "page": row.page,
+                }
+                if settings.HYBRID_SEARCH:
+                    result["vector_score"] = vector_scores.get((doc_id, chunk_idx))
+                    result["lexical_score"] = lexical_scores.get((doc_id, chunk_idx))
+                results.append(result)
             elapsed = time.time() - start
             self.logger.info(f"retrieved {len(results)} chunks in {elapsed:.3f}s")
         finally:
-            db.close()
+            if own_session:
+                db.close()
         return results
+
+    @staticmethod
+    def _fetch_chunks(
+        db: Session, keys: List[Tuple[int, int]], org_id: int | None
+    ) -> Dict[Tuple[int, int], object]:
+        """Load all ``(document_id, chunk_index)`` rows in one round trip."""
+        stmt = select(
+            DocumentChunk.document_id,
+            DocumentChunk.chunk_index,
+            DocumentChunk.content,
+            DocumentChunk.source,
+            DocumentChunk.filename,
+            DocumentChunk.page,
+        ).where(tuple_(DocumentChunk.document_id, DocumentChunk.chunk_index).in_(keys))
+        if org_id is not None:
+            stmt = stmt.where(DocumentChunk.organization_id == org_id)
+        return {(r.document_id, r.chunk_index): r for r in db.execute(stmt)}
@@ -0,0 +1,289 @@
+"""Process-wide registry for expensive, shareable resources.
+
+Loading ``SentenceTransformer`` reads the model weights from disk and takes
+seconds, every ``httpx.Client`` owns its own connection pool, and opening
+``FaissVectorStore`` reads the whole index.  All of them are safe to share
+between requests, so we build them once per process (lazily, or eagerly via
+:func:`warmup` from ``main.on_startup``) and hand the same instances to
+``OpenAIService``, ``RAGService`` and ``IngestionService``.
+"""
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import httpx
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.rag.vector_store import FaissVectorStore
+from app.services.answer_cache import AnswerCache
+from app.services.embedding_cache import EmbeddingCache
+from app.services.onnx_embedder import OnnxEmbedder, load_embedder
+from app.services.query_batcher import QueryBatcher
+from app.services.reranker import Reranker
+from app.services.result_cache import ResultCache
+
+_lock = threading.Lock()
+_embedder: SentenceTransformer | OnnxEmbedder | None = None
+_http_client: httpx.Client | None = None
+_async_http_client: httpx.AsyncClient | None = None
+_executor: ThreadPoolExecutor | None = None
+_vector_store: FaissVectorStore | None = None
+_process_pool: ProcessPoolExecutor | None = None
+_embedding_cache: EmbeddingCache | None = None
+_query_batcher: QueryBatcher | None = None
+_reranker: Reranker | None = None
+_answer_cache: AnswerCache | None = None
+_result_cache: ResultCache | None = None
+
+
+def get_embedder() -> SentenceTransformer | OnnxEmbedder:
+    """Return the shared embedding model, loading it on first use.
+
+    ``settings.EMBEDDING_BACKEND`` picks sentence-transformers on torch or
+    the ONNX Runtime export (see :mod:`app.services.onnx_embedder`).
+    """
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            # re-check under the lock so concurrent first callers load once
+            if _embedder is None:
+                if settings.EMBEDDING_BACKEND == "onnx":
+                    _embedder = load_embedder()
+                elif settings.EMBEDDING_BACKEND == "torch":
+                    if settings.EMBEDDING_TORCH_THREADS > 0:
+                        import torch
+
+                        torch.set_num_threads(settings.EMBEDDING_TORCH_THREADS)
+                    _embedder = SentenceTransformer(settings.EMBEDDING_MODEL)
+                else:
+                    raise ValueError(f"unknown EMBEDDING_BACKEND {settings.EMBEDDING_BACKEND!r}")
+    return _embedder
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache (see ``embedding_cache``)."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    settings.EMBEDDING_CACHE_SIZE,
+                    embedding_model_key(),
+                    persist=settings.EMBEDDING_CACHE_PERSIST,
+                )
+    return _embedding_cache
+
+
+def embedding_model_key() -> str:
+    """Cache namespace for the vectors the configured embedder produces.
+
+    Normalized and raw vectors must not mix, nor may int8-quantized ones
+    mix with full precision; the fp32 ONNX export matches torch to within
+    float rounding, so the two share entries.
+    """
+    key = settings.EMBEDDING_MODEL
+    if settings.EMBEDDING_BACKEND == "onnx" and settings.EMBEDDING_ONNX_QUANTIZE:
+        key += "/onnx-int8"
+    if settings.EMBEDDING_NORMALIZE:
+        key += "/normalized"
+    return key
+
+
+def get_query_batcher() -> QueryBatcher:
+    """Return the process-wide micro-batcher for query embeddings."""
+    global _query_batcher
+    if _query_batcher is None:
+        from app.services.openai_service import OpenAIService
+
+        # built before taking the lock: OpenAIService itself uses the registry
+        openai = OpenAIService()
+        with _lock:
+            if _query_batcher is None:
+                _query_batcher = QueryBatcher(
+                    openai.get_embeddings,
+                    max_batch=settings.QUERY_BATCH_MAX_SIZE,
+                    max_wait=settings.QUERY_BATCH_MAX_WAIT_MS / 1000.0,
+                )
+    return _query_batcher
+
+
+def get_reranker() -> Reranker | None:
+    """Return the shared cross-encoder re-ranker, or None if disabled."""
+    global _reranker
+    if not settings.RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+
+                _reranker = Reranker(
+                    CrossEncoder(settings.RERANK_MODEL, max_length=settings.RERANK_MAX_LENGTH, device="cpu"),
+                    budget_seconds=settings.RERANK_BUDGET_MS / 1000.0,
+                )
+    return _reranker
+
+
+def get_answer_cache() -> AnswerCache | None:
+    """Return the process-wide semantic answer cache, or None if disabled."""
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    settings.EMBEDDING_DIM,
+                    threshold=settings.ANSWER_CACHE_THRESHOLD,
+                    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+                    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+                )
+    return _answer_cache
+
+
+def get_result_cache() -> ResultCache | None:
+    """Return the process-wide retrieval result cache, or None if disabled."""
+    global _result_cache
+    if settings.RESULT_CACHE_SIZE <= 0:
+        return None
+    if _result_cache is None:
+        with _lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTL_SECONDS)
+    return _result_cache
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared HTTP client used to talk to the Groq API."""
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    base_url=settings.GROQ_BASE_URL,
+                    headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}"},
+                    timeout=30.0,
+                )
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the shared async client used by the streaming chat path.
+
+    One pooled client per process keeps TLS sessions to Groq alive across
+    requests; HTTP/2 lets many concurrent streams share a few connections.
+    """
+    global _async_http_client
+    if _async_http_client is None:
+        with _lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(
+                    base_url=settings.GROQ_BASE_URL,
+                    headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}"},
+                    timeout=httpx.Timeout(30.0, connect=5.0),
+                    limits=httpx.Limits(
+                        max_connections=settings.GROQ_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.GROQ_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=settings.GROQ_KEEPALIVE_EXPIRY_SECONDS,
+                    ),
+                    http2=True,
+                )
+    return _async_http_client
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the bounded pool used for embedding and FAISS work.
+
+    Async routes offload CPU-bound retrieval here so it neither blocks the
+    event loop nor competes for the (larger) default threadpool.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.RETRIEVAL_EXECUTOR_WORKERS,
+                    thread_name_prefix="retrieval",
+                )
+    return _executor
+
+
+def get_process_pool() -> ProcessPoolExecutor | None:
+    """Return the pool used for CPU-bound PDF extraction, or None if disabled.
+
+    Processes are spawned (not forked) and only import
+    ``app.services.extraction``, so they stay small.
+    """
+    global _process_pool
+    if settings.PDF_EXTRACT_WORKERS <= 0:
+        return None
+    if _process_pool is None:
+        with _lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=settings.PDF_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _process_pool
+
+
+def get_vector_store() -> FaissVectorStore:
+    """Return the process-wide FAISS store, opening it on first use."""
+    global _vector_store
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                _vector_store = FaissVectorStore()
+    return _vector_store
+
+
+def warmup() -> float:
+    """Eagerly build all shared resources; return elapsed seconds.
+
+    A dummy encode is run so that lazy torch initialisation also happens
+    here instead of on the first user request.
+    """
+    start = time.time()
+    embedder = get_embedder()
+    embedder.encode(["warmup"])
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.model.predict([("warmup", "warmup")], show_progress_bar=False)
+    get_http_client()
+    get_async_http_client()
+    get_executor()
+    return time.time() - start
+
+
+def close(wait: bool = False):
+    """Release pooled connections and threads; called from the shutdown hook.
+
+    With ``wait`` the executors are joined, which processes that exit
+    without running atexit hooks (ingest workers) need so that no PDF pool
+    process outlives them.
+    """
+    global _http_client, _executor, _process_pool, _query_batcher
+    with _lock:
+        batcher, _query_batcher = _query_batcher, None
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=wait, cancel_futures=True)
+            _process_pool = None
+    if batcher is not None:
+        batcher.close()
+
+
+async def aclose():
+    """Close the async client; must run on the event loop that used it."""
+    global _async_http_client
+    client = _async_http_client
+    _async_http_client = None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,73 @@
+"""Cross-encoder re-ranking of retrieved chunks.
+
+A cross-encoder reads the query and a chunk together, so it orders
+candidates far better than the bi-encoder distance, at a per-pair cost.
+:class:`Reranker` scores the candidates in one batched CPU pass and keeps
+the best few, letting the prompt carry fewer, better chunks.  To bound
+latency it tracks the running cost per pair and, when
+``settings.RERANK_BUDGET_MS`` would be exceeded, scores only as many of the
+top-ranked candidates as fit.  One instance per process comes from
+:func:`app.services.registry.get_reranker`.
+"""
+import threading
+import time
+from typing import List
+
+import numpy as np
+from prometheus_client import Histogram
+
+RERANK_SECONDS = Histogram("app_rerank_seconds", "Time spent scoring candidates with the cross-encoder")
+RERANK_CANDIDATES = Histogram(
+    "app_rerank_candidates", "Candidates scored per re-ranked search", buckets=(1, 2, 5, 10, 20, 30, 50, 100)
+)
+
+
+class Reranker:
+    """Re-order retrieval results with ``model.predict`` on (query, content) pairs."""
+
+    def __init__(self, model, budget_seconds: float = 0.0):
+        self.model = model
+        self.budget_seconds = budget_seconds
+        # exponentially weighted seconds per scored pair; None until measured
+        self._pair_seconds: float | None = None
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, results: List[dict], top_n: int) -> List[dict]:
+        """Return the best ``top_n`` of ``results`` by cross-encoder score.
+
+        Scored results gain a ``rerank_score`` (higher is better).  If only a
+        prefix of ``results`` fits the budget, the rest keep their retrieval
+        order behind it.
+        """
+        if len(results) <= 1:
+            return results[:top_n]
+        n = self._affordable(len(results), top_n)
+        head, tail = results[:n], results[n:]
+        start = time.perf_counter()
+        scores = self.model.predict(
+            [(query, r["content"]) for r in head],
+            batch_size=len(head),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        elapsed = time.perf_counter() - start
+        RERANK_SECONDS.observe(elapsed)
+        RERANK_CANDIDATES.observe(n)
+        self._record(elapsed / n)
+        order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+        ranked = [dict(head[i], rerank_score=float(scores[i])) for i in order]
+        return (ranked + tail)[:top_n]
+
+    def _affordable(self, n: int, top_n: int) -> int:
+        """How many candidates fit the budget (never fewer than ``top_n``)."""
+        per_pair = self._pair_seconds
+        if self.budget_seconds <= 0 or per_pair is None or per_pair <= 0:
+            return n
+        return min(n, max(int(self.budget_seconds / per_pair), top_n, 1))
+
+    def _record(self, per_pair: float):
+        with self._lock:
+            if self._pair_seconds is None:
+                self._pair_seconds = per_pair
+            else:
+                self._pair_seconds = 0.8 * self._pair_seconds + 0.2 * per_pair
@@ -0,0 +1,73 @@
+"""LRU/TTL cache of retrieval results.
+
+Identical searches within a tenant (the same question asked again, retries,
+several users on one FAQ) would redo query embedding, both retrieval legs,
+re-ranking and chunk hydration.  :class:`ResultCache` maps
+``(org_id, normalized query, top_k)`` to the final hits together with the
+organization's corpus version (:mod:`app.services.corpus_version`) they
+were computed at; an entry is only served while that version is current,
+so ingests and deletions invalidate it without any explicit purge.  Hits
+are only stored if the process's FAISS snapshot had reached that version
+when they were searched, so a lagging web worker cannot pin stale results.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+from prometheus_client import Counter
+
+RETRIEVAL_CACHE_LOOKUPS = Counter("app_retrieval_cache_lookups_total", "Retrieval result cache lookups", ["result"])
+
+Key = Tuple[int | None, str, int]
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of ``query`` used in cache keys."""
+    return " ".join(query.split()).lower()
+
+
+class ResultCache:
+    """Thread-safe LRU of search results, one per process via the registry."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Key, Tuple[int, float, List[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @staticmethod
+    def key(org_id: int | None, query: str, top_k: int) -> Key:
+        return (org_id, normalize_query(query), top_k)
+
+    def get(self, key: Key, version: int) -> List[dict] | None:
+        """Cached hits for ``key`` computed at ``version``, or None."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[0] != version or item[1] < time.monotonic()):
+                del self._data[key]
+                item = None
+            if item is not None:
+                self._data.move_to_end(key)
+        if item is None:
+            RETRIEVAL_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        RETRIEVAL_CACHE_LOOKUPS.labels("hit").inc()
+        # callers may annotate their results; keep the cached ones intact
+        return [dict(h) for h in item[2]]
+
+    def put(self, key: Key, version: int, hits: List[dict]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (version, time.monotonic() + self.ttl_seconds, [dict(h) for h in hits])
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
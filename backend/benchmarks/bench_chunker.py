@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Compare the legacy word chunker with the token-aware chunker.
+
+Reports throughput and, using the embedder's tokenizer, how many chunks
+exceed the model's sequence limit (i.e. get truncated when embedded).
+
+    python -m benchmarks.bench_chunker --mb 20
+    python -m benchmarks.bench_chunker --files docs/*.txt
+"""
+
+import argparse
+import random
+import time
+
+from app.services import registry
+from app.services.chunking import chunk_spans
+
+
+def _legacy(text: str, chunk_size: int = 700, overlap: int = 100):
+    """The original implementation, kept verbatim for comparison."""
+    tokens = text.split()
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = min(start + chunk_size, len(tokens))
+        chunks.append(" ".join(tokens[start:end]))
+        start += chunk_size - overlap
+    return chunks
+
+
+def _synthetic_corpus(megabytes: float, seed: int = 0) -> list[str]:
+    rnd = random.Random(seed)
+    vocab = [
+        "retrieval", "embedding", "organization", "the", "of", "and", "a", "vector", "index",
+        "chapter", "dharma", "kingdom", "quantization", "tokenizer", "paragraph", "is", "in",
+    ]
+    docs, size = [], 0
+    while size < megabytes * 1_000_000:
+        paras = []
+        for _ in range(rnd.randint(3, 12)):
+            sentences = [
+                " ".join(rnd.choice(vocab) for _ in range(rnd.randint(6, 30))).capitalize() + "."
+                for _ in range(rnd.randint(2, 8))
+            ]
+            paras.append(" ".join(sentences))
+        doc = "\n\n".join(paras)
+        docs.append(doc)
+        size += len(doc)
+    return docs
+
+
+def _over_limit(chunks: list[str], tokenizer, limit: int) -> int:
+    enc = tokenizer(chunks, add_special_tokens=True, return_attention_mask=False, verbose=False)
+    return sum(len(ids) > limit for ids in enc["input_ids"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, default=10.0, help="size of the synthetic corpus")
+    parser.add_argument("--files", nargs="*", help="chunk these text files instead")
+    args = parser.parse_args()
+
+    if args.files:
+        docs = [open(p, encoding="utf-8", errors="ignore").read() for p in args.files]
+    else:
+        docs = _synthetic_corpus(args.mb)
+    total_mb = sum(len(d) for d in docs) / 1_000_000
+    embedder = registry.get_embedder()
+    tokenizer = embedder.tokenizer
+    limit = embedder.max_seq_length
+
+    start = time.perf_counter()
+    legacy = [c for d in docs for c in _legacy(d)]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    token = [d[a:b] for d in docs for a, b in chunk_spans(d, strategy="tokens")]
+    token_s = time.perf_counter() - start
+
+    for name, chunks, secs in (("words", legacy, legacy_s), ("tokens", token, token_s)):
+        over = _over_limit(chunks, tokenizer, limit)
+        print(
+            f"{name:>7}: {len(chunks)} chunks, {total_mb / secs:.2f} MB/s, "
+            f"{over} ({100 * over / max(len(chunks), 1):.1f}%) over the {limit}-token limit"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Compare embedding throughput of the torch and ONNX Runtime backends.
+
+Encodes the same synthetic chunks with sentence-transformers, the fp32
+ONNX export and its int8 quantization (exporting under
+``EMBEDDING_ONNX_DIR`` if needed) and reports texts/s and the minimum
+cosine similarity to the torch vectors.
+
+    python -m benchmarks.bench_embedding --n 2000 --batch-size 64
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.services import onnx_embedder
+from app.services.chunking import chunk_text
+from benchmarks.bench_chunker import _synthetic_corpus
+
+
+def _time(embedder, texts, batch_size: int, repeat: int):
+    embedder.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+    best, embs = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embs = embedder.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        best = min(best, time.perf_counter() - start)
+    return best, np.asarray(embs, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=1000, help="number of chunks to embed")
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_ONNX_THREADS)
+    args = parser.parse_args()
+
+    texts = []
+    for doc in _synthetic_corpus(1.0):
+        texts.extend(chunk_text(doc, strategy="words", chunk_size=150, overlap=0))
+        if len(texts) >= args.n:
+            break
+    texts = sorted(texts[: args.n], key=len)
+
+    if args.threads > 0:
+        import torch
+
+        torch.set_num_threads(args.threads)
+    path = onnx_embedder.model_dir()
+    onnx_embedder.load_embedder(quantize=True)  # export and quantize once
+    backends = [
+        ("torch", SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")),
+        ("onnx", onnx_embedder.OnnxEmbedder(path, threads=args.threads)),
+        ("onnx-int8", onnx_embedder.OnnxEmbedder(path, quantized=True, threads=args.threads)),
+    ]
+    reference = None
+    for name, embedder in backends:
+        secs, embs = _time(embedder, texts, args.batch_size, args.repeat)
+        if reference is None:
+            reference = embs
+        cos = np.sum(embs * reference, axis=1).min()
+        print(f"{name:>9}: {len(texts) / secs:8.1f} texts/s, min cosine vs torch {cos:.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Measure document/chunk insert throughput: row-by-row vs. bulk.
+
+Runs against ``DATABASE_URL`` and rolls every run back, so it is safe on a
+development database.  Embedding is skipped and the word chunker is used
+(no tokenizer needed); only the SQL path is timed.
+
+    python -m benchmarks.bench_ingest --docs 2000 --chunks-per-doc 3
+"""
+
+import argparse
+import time
+
+from sqlalchemy import text
+
+import app.models.organization  # noqa: F401  (register FK targets)
+import app.models.user  # noqa: F401
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.ingestion_service import IngestionService
+
+
+def _make_docs(n_docs: int, chunks_per_doc: int):
+    # ~700 words per chunk with the default chunker
+    body = " ".join(["lorem"] * 600 * chunks_per_doc)
+    return [{"text": body, "source": f"bench-{i}", "filename": None, "page": i} for i in range(n_docs)]
+
+
+def _rowwise(db, docs):
+    """The pre-bulk ingestion path: one round trip per document and per chunk."""
+    from app.services.ingestion_service import chunk_text
+
+    rows = 0
+    for doc in docs:
+        doc_id = db.execute(
+            text("INSERT INTO documents (content, name, organization_id) VALUES (:c, :n, :org) RETURNING id"),
+            {"c": doc["text"], "n": doc["source"], "org": None},
+        ).fetchone()[0]
+        rows += 1
+        for ci, chunk in enumerate(chunk_text(doc["text"], strategy="words")):
+            db.execute(
+                text(
+                    "INSERT INTO document_chunks "
+                    "(document_id, chunk_index, content, source, filename, page, organization_id) "
+                    "VALUES (:d, :ci, :c, :s, :f, :p, :org)"
+                ),
+                {"d": doc_id, "ci": ci, "c": chunk, "s": doc["source"], "f": None, "p": doc["page"], "org": None},
+            )
+            rows += 1
+    return rows
+
+
+def _bulk(db, docs):
+    from app.services.ingestion_service import chunk_spans
+
+    service = IngestionService.__new__(IngestionService)  # no models needed for the SQL path
+    rows = 0
+    batch_size = max(settings.INGEST_BATCH_SIZE, 1)
+    for i in range(0, len(docs), batch_size):
+        batch = docs[i : i + batch_size]
+        doc_ids = IngestionService._insert_documents(db, batch, None)
+        chunk_rows = []
+        for doc, doc_id in zip(batch, doc_ids):
+            chunk_rows.extend(
+                IngestionService._chunk_rows(
+                    doc_id, doc["text"], chunk_spans(doc["text"], strategy="words"), doc["source"], None, doc["page"], None
+                )
+            )
+        service._insert_chunk_rows(db, chunk_rows)
+        rows += len(batch) + len(chunk_rows)
+    return rows
+
+
+def _run(name, fn, docs):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        rows = fn(db, docs)
+        db.flush()
+        elapsed = time.perf_counter() - start
+    finally:
+        db.rollback()
+        db.close()
+    print(f"{name:>8}: {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--chunks-per-doc", type=int, default=3)
+    args = parser.parse_args()
+    docs = _make_docs(args.docs, args.chunks_per_doc)
+    _run("rowwise", _rowwise, docs)
+    _run("bulk", _bulk, docs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.security import decode_access_token
+from app.db.session import SessionLocal
+from app.main import app
+from app.models.document import Document, DocumentChunk
+from app.models.ingest_job import IngestJob
+from app.models.user import User
+from app.services import ingest_jobs, registry
+from app.services.ingestion_service import IngestionService
+from app.services.openai_service import OpenAIService
+
+client = TestClient(app)
+
+
+def _admin(org):
+    """Register an admin of ``org``; returns (auth headers, organization id)."""
+    email = f"admin+{uuid.uuid4()}@example.com"
+    r = client.post("/api/auth/register", json={"email": email, "password": "pw", "organization": org})
+    assert r.status_code == 200
+    claims = decode_access_token(r.json()["access_token"])
+    db = SessionLocal()
+    try:
+        user = db.get(User, int(claims["sub"]))
+        user.is_admin = True
+        db.commit()
+    finally:
+        db.close()
+    # a fresh token carries the admin role
+    r = client.post("/api/auth/login", json={"email": email, "password": "pw"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}, claims["org_id"]
+
+
+def _ingest(org_id, text):
+    IngestionService().ingest_texts([text], organization_id=org_id)
+    db = SessionLocal()
+    try:
+        return (
+            db.query(Document.id)
+            .filter(Document.organization_id == org_id)
+            .order_by(Document.id.desc())
+            .first()[0]
+        )
+    finally:
+        db.close()
+
+
+def _hits(org_id, query):
+    """Document ids of every live vector in the partition of ``org_id``."""
+    emb = OpenAIService().get_embeddings([query])[0]
+    return [doc_id for doc_id, _, _ in registry.get_vector_store().search(emb, top_k=1000, organization_id=org_id)]
+
+
+def _run(job_id):
+    ingest_jobs.run_job(job_id)
+    db = SessionLocal()
+    try:
+        job = db.get(IngestJob, job_id)
+        assert job.status == "succeeded", job.error
+        return job
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def release_faiss_writer():
+    yield
+    registry.get_vector_store().stop_persister()
+
+
+@pytest.fixture
+def orgs():
+    return _admin(f"DocsA-{uuid.uuid4().hex[:8]}"), _admin(f"DocsB-{uuid.uuid4().hex[:8]}")
+
+
+def test_missing_document_is_404(orgs):
+    (headers, _), _ = orgs
+    assert client.delete("/api/admin/documents/987654321", headers=headers).status_code == 404
+    r = client.put("/api/admin/documents/987654321", data={"text": "new"}, headers=headers)
+    assert r.status_code == 404
+
+
+def test_other_organization_is_403(orgs):
+    (headers_a, _), (_, org_b) = orgs
+    doc_b = _ingest(org_b, "Invoices of org B are due in thirty days.")
+    assert client.delete(f"/api/admin/documents/{doc_b}", headers=headers_a).status_code == 403
+    r = client.put(f"/api/admin/documents/{doc_b}", data={"text": "hijacked"}, headers=headers_a)
+    assert r.status_code == 403
+    # nothing was queued and the document is still searchable
+    assert doc_b in _hits(org_b, "invoices")
+
+
+def test_delete_removes_vectors(orgs):
+    (headers, org_a), _ = orgs
+    keep = _ingest(org_a, "The office opens at nine in the morning.")
+    doc = _ingest(org_a, "Travel expenses are reimbursed within two weeks.")
+    assert doc in _hits(org_a, "travel expenses")
+
+    r = client.delete(f"/api/admin/documents/{doc}", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["status"] == "queued"
+    job = _run(r.json()["job_id"])
+    assert job.kind == "delete" and job.chunks_done >= 1
+
+    hits = _hits(org_a, "travel expenses")
+    assert doc not in hits
+    assert keep in hits
+    db = SessionLocal()
+    try:
+        assert db.get(Document, doc) is None
+        assert db.query(DocumentChunk).filter(DocumentChunk.document_id == doc).count() == 0
+    finally:
+        db.close()
+
+
+def test_replace_swaps_vectors(orgs):
+    (headers, org_a), _ = orgs
+    doc = _ingest(org_a, "Old policy: laptops are replaced every five years.")
+
+    r = client.put(
+        f"/api/admin/documents/{doc}",
+        data={"text": "New policy: laptops are replaced every three years."},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    job = _run(r.json()["job_id"])
+    assert job.kind == "replace"
+
+    db = SessionLocal()
+    try:
+        chunks = db.query(DocumentChunk).filter(DocumentChunk.document_id == doc).all()
+    finally:
+        db.close()
+    assert chunks and all("three years" in c.content for c in chunks)
+    # exactly the new chunks are indexed, none of the old ones
+    assert _hits(org_a, "laptop policy").count(doc) == len(chunks)
+
+
+def test_replace_requires_content(orgs):
+    (headers, org_a), _ = orgs
+    doc = _ingest(org_a, "Parking spaces are assigned yearly.")
+    assert client.put(f"/api/admin/documents/{doc}", headers=headers).status_code == 400
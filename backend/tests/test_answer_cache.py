@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from app.services.answer_cache import AnswerCache, CachedAnswer
+
+DIM = 4
+
+
+def _cache(**kw):
+    opts = dict(threshold=0.9, ttl_seconds=60.0, max_entries=10)
+    opts.update(kw)
+    return AnswerCache(DIM, **opts)
+
+
+def _entry(answer, **kw):
+    return CachedAnswer(f"question for {answer}", answer, [answer], [], [], **kw)
+
+
+def _vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_similar_question_hits():
+    cache = _cache()
+    cache.store(1, _vec(1, 0, 0, 0), 3, _entry("a"))
+    # cosine ~0.995 after normalization; magnitude does not matter
+    assert cache.lookup(1, _vec(2, 0.2, 0, 0), 3).answer == "a"
+
+
+def test_below_threshold_misses():
+    cache = _cache()
+    cache.store(1, _vec(1, 0, 0, 0), 3, _entry("a"))
+    # cosine ~0.71
+    assert cache.lookup(1, _vec(1, 1, 0, 0), 3) is None
+
+
+def test_organizations_are_separate():
+    cache = _cache()
+    cache.store(1, _vec(1, 0, 0, 0), 3, _entry("a"))
+    assert cache.lookup(2, _vec(1, 0, 0, 0), 3) is None
+    assert cache.lookup(None, _vec(1, 0, 0, 0), 3) is None
+
+
+def test_expired_entry_misses_and_is_dropped():
+    cache = _cache(ttl_seconds=60.0)
+    cache.store(1, _vec(1, 0, 0, 0), 3, _entry("old", created_at=time.time() - 120))
+    cache.store(1, _vec(0, 1, 0, 0), 3, _entry("new"))
+    assert cache.lookup(1, _vec(1, 0, 0, 0), 3) is None
+    assert cache.lookup(1, _vec(0, 1, 0, 0), 3).answer == "new"
+    assert len(cache._orgs[1].entries) == 1
+
+
+def test_new_corpus_version_empties_the_organization():
+    cache = _cache()
+    cache.store(1, _vec(1, 0, 0, 0), 3, _entry("a"))
+    cache.store(2, _vec(1, 0, 0, 0), 7, _entry("b"))
+    assert cache.lookup(1, _vec(1, 0, 0, 0), 4) is None
+    # and stays empty when asked for the old version again
+    assert cache.lookup(1, _vec(1, 0, 0, 0), 3) is None
+    assert cache.lookup(2, _vec(1, 0, 0, 0), 7).answer == "b"
+
+
+def test_answer_built_on_older_version_is_not_stored():
+    cache = _cache()
+    cache.lookup(1, _vec(1, 0, 0, 0), 5)
+    cache.store(1, _vec(1, 0, 0, 0), 4, _entry("stale"))
+    assert cache.lookup(1, _vec(1, 0, 0, 0), 5) is None
+
+
+def test_oldest_entry_evicted_at_capacity():
+    cache = _cache(max_entries=2)
+    for i, answer in enumerate("abc"):
+        vec = np.zeros(DIM, dtype=np.float32)
+        vec[i] = 1
+        cache.store(1, vec, 3, _entry(answer))
+    assert cache.lookup(1, _vec(1, 0, 0, 0), 3) is None
+    assert cache.lookup(1, _vec(0, 0, 1, 0), 3).answer == "c"
@@ -0,0 +1,24 @@
+from app.api.routes.chat import ChatIn, _save_assistant_message, _start_turn
+from app.db.session import SessionLocal
+from app.models.chat import Message
+
+
+def test_start_turn_returns_earlier_messages_only():
+    db = SessionLocal()
+    try:
+        conv_id, history = _start_turn(db, ChatIn(message="first question"), None, None)
+        assert history == []
+        _save_assistant_message(db, conv_id, "first answer")
+
+        # messages stored within the same second must keep their order too
+        _, history = _start_turn(db, ChatIn(message="follow-up", conversation_id=conv_id), None, None)
+        assert history == ["first question", "first answer"]
+        stored = db.query(Message).filter(Message.conversation_id == conv_id).order_by(Message.id).all()
+        assert [m.content for m in stored] == ["first question", "first answer", "follow-up"]
+
+        for i in range(12):
+            _start_turn(db, ChatIn(message=f"q{i}", conversation_id=conv_id), None, None)
+        _, history = _start_turn(db, ChatIn(message="latest", conversation_id=conv_id), None, None)
+        assert history == [f"q{i}" for i in range(2, 12)]
+    finally:
+        db.close()
@@ -0,0 +1,89 @@
+import uuid
+
+import app.models.user  # noqa: F401  (register FK targets)
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document, DocumentChunk
+from app.models.organization import Organization
+from app.services import registry
+from app.services.chunking import chunk_spans, chunk_text
+from app.services.ingestion_service import IngestionService
+
+SENTENCE = "The quarterly report lists revenue, costs and the outlook for each region."
+PARAGRAPH = " ".join([SENTENCE] * 3)
+
+
+def _n_tokens(s):
+    return len(registry.get_embedder().tokenizer(s, add_special_tokens=False)["input_ids"])
+
+
+def _document(n_paragraphs=12):
+    return "\n\n".join(f"Section {i}. {PARAGRAPH}" for i in range(n_paragraphs))
+
+
+def test_windows_fit_the_token_limit():
+    text = _document(40)
+    chunks = chunk_text(text, strategy="tokens")
+    assert len(chunks) > 1
+    assert all(_n_tokens(c) <= settings.CHUNK_MAX_TOKENS for c in chunks)
+
+
+def test_spans_slice_back_to_chunks():
+    text = _document()
+    spans = chunk_spans(text, chunk_size=40, overlap=10, strategy="tokens")
+    assert [text[s:e] for s, e in spans] == chunk_text(text, chunk_size=40, overlap=10, strategy="tokens")
+    # windows advance and together cover the text
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    assert all(a[0] < b[0] and b[0] <= a[1] for a, b in zip(spans, spans[1:]))
+
+
+def test_ingested_offsets_slice_document():
+    db = SessionLocal()
+    try:
+        org = Organization(name=f"Chunks-{uuid.uuid4().hex[:8]}")
+        db.add(org)
+        db.commit()
+        org_id = org.id
+    finally:
+        db.close()
+    IngestionService().ingest_texts([_document(20)], organization_id=org_id)
+    registry.get_vector_store().stop_persister()
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter(Document.organization_id == org_id).one()
+        chunks = db.query(DocumentChunk).filter(DocumentChunk.document_id == doc.id).all()
+        assert len(chunks) > 1
+        for c in chunks:
+            assert doc.content[c.char_start:c.char_end] == c.content
+    finally:
+        db.close()
+
+
+def test_windows_end_on_paragraphs_then_sentences():
+    # the first paragraph ends in the back half of the first window, ahead
+    # of later sentence ends, and is preferred to them
+    first = "Intro. " + PARAGRAPH
+    text = first + "\n\n" + " ".join([SENTENCE] * 10)
+    size = _n_tokens(first) + 10
+    spans = chunk_spans(text, chunk_size=size, overlap=5, strategy="tokens")
+    assert text[slice(*spans[0])] == first
+    # with no paragraph break in reach, windows stop after a sentence
+    for s, e in spans[1:-1]:
+        assert text[s:e].endswith(".")
+
+
+def test_windows_end_on_words_without_sentences():
+    text = " ".join(f"item{i} alpha beta gamma" for i in range(200))
+    spans = chunk_spans(text, chunk_size=30, overlap=5, strategy="tokens")
+    assert len(spans) > 1
+    for s, e in spans:
+        assert e == len(text) or text[e].isspace()
+        assert s == 0 or text[s - 1].isspace()
+
+
+def test_text_without_boundaries_terminates():
+    text = "-" * 2000
+    spans = chunk_spans(text, chunk_size=50, overlap=10, strategy="tokens")
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    assert all(_n_tokens(text[s:e]) <= 50 for s, e in spans)
+    assert all(a[0] < b[0] for a, b in zip(spans, spans[1:]))
@@ -0,0 +1,95 @@
+import pytest
+
+from app.core.config import settings
+from app.services.context_budget import pack_context
+
+MESSAGE = "question"
+
+
+class _Words:
+    """Stand-in for OpenAIService that counts whitespace words as tokens."""
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+    def count_tokens_many(self, texts):
+        return [self.count_tokens(t) for t in texts]
+
+    def truncate_tokens(self, text, max_tokens):
+        return " ".join(text.split()[:max_tokens])
+
+    def prompt_tokens(self, message, contexts):
+        # the separator "\n---\n" counts as one token per context
+        return self.count_tokens(message) + sum(self.count_tokens(c) + 1 for c in contexts)
+
+
+def _texts(n, words=10, tag="w"):
+    return [" ".join(f"{tag}{i}_{j}" for j in range(words)) for i in range(n)]
+
+
+def _pack(history, chunks, available, share=0.3):
+    # ``available`` is what is left once the question is counted
+    return pack_context(_Words(), MESSAGE, history, chunks, budget=available + 1, history_share=share)
+
+
+@pytest.fixture(autouse=True)
+def min_item_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "CONTEXT_MIN_ITEM_TOKENS", 3)
+
+
+def test_stays_within_budget():
+    packed = _pack(_texts(6, tag="h"), _texts(12), available=100)
+    assert packed.prompt_tokens <= 101
+    assert packed.history_tokens + packed.chunk_tokens <= 100
+    assert packed.dropped > 0
+
+
+def test_everything_fits():
+    history, chunks = _texts(2, tag="h"), _texts(3)
+    packed = _pack(history, chunks, available=1000)
+    assert packed.history == history and packed.chunks == chunks
+    assert packed.chunk_indexes == [0, 1, 2]
+    assert packed.dropped == packed.truncated == 0
+
+
+def test_first_overflowing_chunk_truncated_rest_dropped():
+    chunks = _texts(4)
+    # 11 tokens per kept chunk (10 words + separator): two fit, five words of the third
+    packed = _pack([], chunks, available=28)
+    assert packed.chunks[:2] == chunks[:2]
+    assert packed.chunks[2] == " ".join(chunks[2].split()[:5])
+    assert packed.chunk_indexes == [0, 1, 2]
+    assert packed.truncated == 1 and packed.dropped == 1
+    assert packed.chunk_tokens == 28
+
+
+def test_overflow_below_min_tokens_is_dropped():
+    chunks = _texts(3)
+    # two words would be left for the third chunk, under the minimum of 3
+    packed = _pack([], chunks, available=25)
+    assert packed.chunks == chunks[:2]
+    assert packed.truncated == 0 and packed.dropped == 1
+
+
+def test_newest_history_kept_in_order():
+    history = _texts(5, tag="h")
+    packed = _pack(history, [], available=33, share=1.0)
+    assert packed.history == history[-3:]
+
+
+def test_history_leaves_its_unused_share_to_chunks():
+    history = _texts(1, words=5, tag="h")
+    packed = _pack(history, _texts(10), available=100, share=0.3)
+    assert packed.history == history
+    # chunks get all but the 6 tokens history used, not just 70
+    assert packed.chunk_tokens == 94
+    assert packed.history_tokens + packed.chunk_tokens == 100
+
+
+def test_chunks_leave_their_unused_space_to_history():
+    history = _texts(9, tag="h")
+    packed = _pack(history, _texts(1), available=100, share=0.3)
+    assert packed.chunk_tokens == 11
+    # far beyond the 30 token history share: eight of the 89 left fit
+    assert packed.history_tokens == 88
+    assert packed.history == history[1:]
@@ -0,0 +1,94 @@
+import uuid
+
+import pytest
+
+import app.models.user  # noqa: F401  (register FK targets)
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document, DocumentChunk
+from app.models.organization import Organization
+from app.services import registry
+from app.services.ingestion_service import IngestionService
+from app.services.openai_service import OpenAIService
+
+TEXT = "Refunds are issued to the original payment method within ten days."
+
+
+@pytest.fixture(autouse=True)
+def release_faiss_writer():
+    yield
+    registry.get_vector_store().stop_persister()
+
+
+@pytest.fixture(params=["link", "skip", "off"])
+def mode(request, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_DEDUP_MODE", request.param)
+    return request.param
+
+
+@pytest.fixture
+def org():
+    db = SessionLocal()
+    try:
+        org = Organization(name=f"Dedup-{uuid.uuid4().hex[:8]}")
+        db.add(org)
+        db.commit()
+        return org.id
+    finally:
+        db.close()
+
+
+def _state(org):
+    """(document ids, {document_id: [is_duplicate, ...]}, indexed (document_id, chunk_index))."""
+    db = SessionLocal()
+    try:
+        docs = [d.id for d in db.query(Document).filter(Document.organization_id == org).order_by(Document.id)]
+        rows = {d: [] for d in docs}
+        for c in db.query(DocumentChunk).filter(DocumentChunk.organization_id == org):
+            rows[c.document_id].append(c.is_duplicate)
+    finally:
+        db.close()
+    emb = OpenAIService().get_embeddings([TEXT])[0]
+    hits = registry.get_vector_store().search(emb, top_k=100, organization_id=org)
+    return docs, rows, {(doc_id, ci) for doc_id, ci, _ in hits}
+
+
+def _expect_one_indexed(mode, docs, rows, indexed):
+    first, second = docs
+    if mode == "off":
+        assert rows == {first: [False], second: [False]}
+        assert indexed == {(first, 0), (second, 0)}
+        return
+    assert rows[first] == [False]
+    # link keeps the duplicate row without a vector, skip drops it
+    assert rows[second] == ([True] if mode == "link" else [])
+    assert indexed == {(first, 0)}
+
+
+def test_duplicate_within_one_run(mode, org):
+    IngestionService().ingest_texts([TEXT, TEXT], organization_id=org)
+    _expect_one_indexed(mode, *_state(org))
+
+
+def test_duplicate_of_indexed_chunk(mode, org):
+    IngestionService().ingest_texts([TEXT], organization_id=org)
+    IngestionService().ingest_texts([TEXT], organization_id=org)
+    _expect_one_indexed(mode, *_state(org))
+
+
+def test_duplicate_promoted_after_delete(mode, org):
+    service = IngestionService()
+    service.ingest_texts([TEXT], organization_id=org)
+    service.ingest_texts([TEXT], organization_id=org)
+    first, second = _state(org)[0]
+
+    service.delete_document(first, organization_id=org)
+    docs, rows, indexed = _state(org)
+    assert docs == [second]
+    if mode == "skip":
+        # the second copy was never stored, so nothing is left to promote
+        assert rows == {second: []}
+        assert indexed == set()
+    else:
+        assert rows == {second: [False]}
+        assert indexed == {(second, 0)}
@@ -0,0 +1,72 @@
+import uuid
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from app.db.session import SessionLocal
+from app.services.embedding_cache import EmbeddingCache, content_hash
+from app.services.openai_service import OpenAIService
+
+
+def _stored(model_name, keys):
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text("SELECT content_hash FROM embedding_cache WHERE model_name = :m"), {"m": model_name}
+        )
+        return {h for (h,) in rows} & set(keys)
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    openai = OpenAIService()
+    cache = EmbeddingCache(100, f"test-{uuid.uuid4().hex[:8]}")
+    monkeypatch.setattr(openai, "cache", cache)
+    return openai
+
+
+def test_query_embeddings_stay_in_memory(service):
+    question = f"how long do refunds take {uuid.uuid4().hex}"
+    service.get_embeddings([question])
+    key = content_hash(question)
+    assert key in service.cache._data
+    assert not _stored(service.cache.model_name, [key])
+
+
+def test_chunk_embeddings_persisted(service):
+    chunk = f"Refunds take ten days. {uuid.uuid4().hex}"
+    emb = service.get_embeddings([chunk], persist=True)[0]
+    key = content_hash(chunk)
+    assert _stored(service.cache.model_name, [key]) == {key}
+    # a new process finds it in the table
+    fresh = EmbeddingCache(100, service.cache.model_name)
+    np.testing.assert_array_equal(fresh.get_many([key])[key], emb)
+
+
+def test_prune_keeps_newest_rows():
+    cache = EmbeddingCache(0, f"test-{uuid.uuid4().hex[:8]}")
+    keys = [content_hash(f"chunk {i}") for i in range(5)]
+    db = SessionLocal()
+    try:
+        db.execute(text("DELETE FROM embedding_cache"))
+        db.commit()
+        cache.put_many({k: np.full(4, i, dtype=np.float32) for i, k in enumerate(keys)})
+        for i, k in enumerate(keys):
+            db.execute(
+                text("UPDATE embedding_cache SET created_at = :t WHERE content_hash = :h"),
+                {"t": f"2026-01-0{i + 1} 00:00:00", "h": k},
+            )
+        db.commit()
+    finally:
+        db.close()
+    assert cache.prune(0) == 0
+    assert cache.prune(10) == 0
+    assert cache.prune(2) == 3
+    assert _stored(cache.model_name, keys) == set(keys[3:])
+
+
+def test_prune_disabled_without_persistence():
+    assert EmbeddingCache(10, "unused", persist=False).prune(1) == 0
@@ -0,0 +1,36 @@
+import pytest
+
+from app.rag.hybrid import reciprocal_rank_fusion
+
+
+def test_chunks_in_both_rankings_come_first():
+    vector = [(1, 0, 0.1), (2, 0, 0.2), (3, 0, 0.3)]
+    lexical = [(3, 0, 9.0), (4, 0, 5.0)]
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+    assert [key for key, _ in fused] == [(3, 0), (1, 0), (2, 0), (4, 0)]
+    scores = dict(fused)
+    assert scores[(3, 0)] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores[(1, 0)] == pytest.approx(1 / 61)
+    assert scores[(4, 0)] == pytest.approx(1 / 62)
+
+
+def test_only_ranks_matter():
+    # wildly different raw scores in the two legs fuse the same way
+    a = reciprocal_rank_fusion([[(1, 0, 0.001), (2, 0, 0.002)], [(2, 0, 1e6), (1, 0, 1.0)]])
+    b = reciprocal_rank_fusion([[(1, 0, 5.0), (2, 0, 6.0)], [(2, 0, 0.3), (1, 0, 0.2)]])
+    assert a == b
+
+
+def test_ties_keep_first_seen_order():
+    fused = reciprocal_rank_fusion([[(1, 0, 0.0), (2, 0, 0.0)], [(2, 0, 0.0), (1, 0, 0.0)]])
+    assert [key for key, _ in fused] == [(1, 0), (2, 0)]
+    assert fused[0][1] == fused[1][1]
+    # equal ranks in different lists tie too
+    fused = reciprocal_rank_fusion([[(5, 1, 0.0)], [(7, 2, 0.0)]])
+    assert [key for key, _ in fused] == [(5, 1), (7, 2)]
+
+
+def test_single_ranking_keeps_its_order():
+    hits = [(4, 2, 0.9), (1, 0, 0.5), (8, 3, 0.1)]
+    assert [key for key, _ in reciprocal_rank_fusion([hits, []])] == [(4, 2), (1, 0), (8, 3)]
+    assert reciprocal_rank_fusion([[], []]) == []
@@ -0,0 +1,250 @@
+import io
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import app.models.organization  # noqa: F401  (register FK targets)
+import app.models.user  # noqa: F401
+from app.db.session import SessionLocal
+from app.models.document import DocumentChunk
+from app.models.ingest_job import IngestJob
+from app.rag.vector_store import FaissVectorStore
+from app.services import ingest_jobs, registry
+from app.services.extraction import iter_upload_documents
+
+
+def _queue(texts=(), files=()):
+    db = SessionLocal()
+    try:
+        return ingest_jobs.enqueue_job(db, list(texts), list(files)).id
+    finally:
+        db.close()
+
+
+def _pdf_bytes(pages):
+    """A minimal PDF with one line of Helvetica text per page."""
+    objs = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>"
+        )
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def _queue_pdf(n_pages):
+    pytest.importorskip("PyPDF2")
+    filename = f"manual-{uuid.uuid4().hex[:8]}.pdf"
+    pdf = _pdf_bytes([f"Page {i} explains topic {i}" for i in range(1, n_pages + 1)])
+    return _queue(files=[(filename, io.BytesIO(pdf))]), filename
+
+
+def _job(job_id):
+    db = SessionLocal()
+    try:
+        return db.get(IngestJob, job_id)
+    finally:
+        db.close()
+
+
+def _chunks(filename):
+    db = SessionLocal()
+    try:
+        return db.query(DocumentChunk).filter(DocumentChunk.filename == filename).all()
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def release_faiss_writer():
+    yield
+    # let worker processes (or later tests) become the FAISS writer
+    registry.get_vector_store().stop_persister()
+
+
+def test_text_job_through_run_job():
+    filename = f"notes-{uuid.uuid4().hex[:8]}.txt"
+    job_id = _queue(["Inline text about shipping."], [(filename, io.BytesIO(b"Uploaded text about returns."))])
+    ingest_jobs.run_job(job_id)
+    job = _job(job_id)
+    assert job.status == "succeeded", job.error
+    assert job.stage == "done" and job.documents_done == 2
+    assert [c.content for c in _chunks(filename)] == ["Uploaded text about returns."]
+    # the uploads are removed once the job is done
+    assert not os.path.exists(ingest_jobs._job_dir(job_id))
+    status = ingest_jobs.job_status(job)
+    assert status["chunks_done"] == job.chunks_done and status["finished_at"]
+
+
+def test_each_job_claimed_once():
+    ids = {_queue(["first"]), _queue(["second"])}
+    db = SessionLocal()
+    try:
+        claimed = []
+        while (job_id := ingest_jobs.claim_next_job(db, "test")) is not None:
+            claimed.append(job_id)
+    finally:
+        db.close()
+    assert ids <= set(claimed) and len(claimed) == len(set(claimed))
+    assert all(_job(i).status == "running" and _job(i).worker == "test" for i in ids)
+
+
+def test_stale_running_job_failed(monkeypatch):
+    job_id = _queue(["stuck"])
+    db = SessionLocal()
+    try:
+        ingest_jobs._update_job(db, job_id, status="running")
+        monkeypatch.setattr(ingest_jobs.settings, "INGEST_JOB_STALE_SECONDS", -1)
+        assert ingest_jobs.fail_stale_jobs(db) >= 1
+    finally:
+        db.close()
+    job = _job(job_id)
+    assert job.status == "failed" and job.error == "worker stopped responding"
+
+
+def test_missing_job_skipped():
+    job_id = _queue(["gone before it ran"])
+    db = SessionLocal()
+    try:
+        db.delete(db.get(IngestJob, job_id))
+        db.commit()
+    finally:
+        db.close()
+    ingest_jobs.run_job(job_id)
+    assert _job(job_id) is None
+    assert not os.path.exists(ingest_jobs._job_dir(job_id))
+
+
+def test_unreadable_manifest_fails_job():
+    job_id = _queue(["text"])
+    db = SessionLocal()
+    try:
+        ingest_jobs._update_job(db, job_id, status="running", files="{not json")
+    finally:
+        db.close()
+    ingest_jobs.run_job(job_id)
+    job = _job(job_id)
+    assert job.status == "failed" and job.stage == "failed" and job.error
+    assert job.finished_at is not None
+
+
+def test_heartbeat_while_no_batch_commits(monkeypatch):
+    monkeypatch.setattr(ingest_jobs.settings, "INGEST_JOB_HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(ingest_jobs.settings, "INGEST_JOB_STALE_SECONDS", 0.5)
+    job_id = _queue(["slow to extract"])
+    stale = []
+
+    def ingest_documents(docs, organization_id=None, progress=None):
+        # a long extraction: nothing is committed for longer than the timeout
+        deadline = time.time() + 1.0
+        while time.time() < deadline:
+            time.sleep(0.1)
+            db = SessionLocal()
+            try:
+                stale.append(ingest_jobs.fail_stale_jobs(db))
+            finally:
+                db.close()
+
+    service = SimpleNamespace(ingest_documents=ingest_documents, rag=SimpleNamespace(vs=SimpleNamespace(flush=lambda: None)))
+    db = SessionLocal()
+    try:
+        ingest_jobs._update_job(db, job_id, status="running")
+    finally:
+        db.close()
+    ingest_jobs.run_job(job_id, service=service)
+    assert _job(job_id).status == "succeeded", _job(job_id).error
+    assert not any(stale)
+    assert not any(t.name == f"ingest-heartbeat-{job_id}" for t in threading.enumerate())
+
+
+def test_only_the_faiss_writer_runs_jobs():
+    registry.get_vector_store().stop_persister()
+    # another process (here: another store) holds the writer lock
+    other = FaissVectorStore()
+    assert other.acquire_writer()
+    job_id = _queue(["Written by whichever worker holds the lock."])
+    stop = threading.Event()
+    worker = threading.Thread(target=ingest_jobs.worker_loop, args=("standby", stop))
+    worker.start()
+    try:
+        time.sleep(1.0)
+        assert _job(job_id).status == "queued"
+        # once the lock is free the standby takes over and runs the job
+        other.release_writer()
+        deadline = time.time() + 30
+        while _job(job_id).status in ("queued", "running") and time.time() < deadline:
+            time.sleep(0.2)
+        assert _job(job_id).status == "succeeded", _job(job_id).error
+    finally:
+        stop.set()
+        worker.join(30)
+        other.release_writer()
+
+
+def test_pdf_job_through_run_job():
+    job_id, filename = _queue_pdf(12)
+    ingest_jobs.run_job(job_id)
+    job, chunks = _job(job_id), _chunks(filename)
+    assert job.status == "succeeded", job.error
+    assert job.documents_done == 12
+    assert sorted(c.page for c in chunks) == list(range(1, 13))
+    assert "topic 7" in next(c.content for c in chunks if c.page == 7)
+
+
+def test_pdf_job_in_worker_process():
+    # the worker extracts pages in its own process pool, which a daemonic
+    # worker process is not allowed to start
+    registry.get_vector_store().stop_persister()
+    job_id, filename = _queue_pdf(3)
+    assert ingest_jobs.start_workers(1) == 1
+    try:
+        deadline = time.time() + 120
+        while _job(job_id).status not in ("succeeded", "failed") and time.time() < deadline:
+            time.sleep(0.5)
+    finally:
+        ingest_jobs.stop_workers(timeout=30)
+    job = _job(job_id)
+    assert job.status == "succeeded", job.error
+    assert len(_chunks(filename)) == 3
+
+
+def _open_files():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_text_upload_opened_only_while_iterated(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_jobs.settings, "INGEST_TEXT_SEGMENT_CHARS", 20)
+    path = tmp_path / "notes.txt"
+    path.write_text("word " * 40)
+    before = _open_files()
+    docs = iter_upload_documents(str(path), "notes.txt")
+    assert _open_files() == before
+    first = next(docs)
+    assert first["page"] == 1 and _open_files() == before + 1
+    # abandoning the iterator half way closes the file
+    docs.close()
+    assert _open_files() == before
+    assert "".join(d["text"] for d in iter_upload_documents(str(path), "notes.txt")) == ("word " * 40).rstrip()
+    assert _open_files() == before
@@ -0,0 +1,158 @@
+import queue
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import app.models.organization  # noqa: F401  (register FK targets)
+import app.models.user  # noqa: F401
+from app.core.config import settings
+from app.services import registry
+from app.services.ingestion_service import _CHUNK_COPY_COLUMNS, _DONE, IngestionService, _copy_value, _drain, _put
+
+_UNESCAPE = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+
+
+def _decode(field):
+    """Read a field back the way COPY's text format does."""
+    if field == "\\N":
+        return None
+    return re.sub(r"\\(.)", lambda m: _UNESCAPE[m[1]], field)
+
+
+@pytest.mark.parametrize(
+    "value, encoded",
+    [
+        ("plain text", "plain text"),
+        ("a\tb", "a\\tb"),
+        ("line one\nline two\r\n", "line one\\nline two\\r\\n"),
+        ("C:\\path\\n", "C:\\\\path\\\\n"),
+        ("nul\x00byte", "nulbyte"),
+        (None, "\\N"),
+        ("\\N", "\\\\N"),
+        (7, "7"),
+        (False, "False"),
+    ],
+)
+def test_copy_value(value, encoded):
+    assert _copy_value(value) == encoded
+
+
+def test_copy_value_round_trips():
+    text = "tab\there\\back\\slash\nnew line\r\\t literal"
+    encoded = _copy_value(text)
+    assert "\t" not in encoded and "\n" not in encoded and "\r" not in encoded
+    assert _decode(encoded) == text
+
+
+class _Cursor:
+    def copy_expert(self, sql, buf):
+        self.sql, self.data = sql, buf.read()
+
+    def close(self):
+        pass
+
+
+def test_copy_chunk_rows_one_line_per_row():
+    cursor = _Cursor()
+    # just enough of a Session to hand out the raw DB-API cursor
+    db = SimpleNamespace(connection=lambda: SimpleNamespace(connection=SimpleNamespace(cursor=lambda: cursor)))
+    empty = dict.fromkeys(_CHUNK_COPY_COLUMNS)
+    rows = [
+        empty | {"document_id": 1, "chunk_index": 0, "content": "a\tb\nc"},
+        empty | {"document_id": 1, "chunk_index": 1, "content": "d", "is_duplicate": True},
+    ]
+    IngestionService._copy_chunk_rows(db, rows)
+    assert cursor.sql == f"COPY document_chunks ({', '.join(_CHUNK_COPY_COLUMNS)}) FROM STDIN"
+    lines = cursor.data.split("\n")
+    assert len(lines) == 3 and lines[-1] == ""
+    decoded = [dict(zip(_CHUNK_COPY_COLUMNS, map(_decode, line.split("\t")))) for line in lines[:2]]
+    assert all(len(row) == len(_CHUNK_COPY_COLUMNS) for row in decoded)
+    assert [row["content"] for row in decoded] == ["a\tb\nc", "d"]
+    assert decoded[0]["page"] is None and decoded[1]["is_duplicate"] == "True"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_BATCH_SIZE", 1)
+    monkeypatch.setattr(settings, "INGEST_QUEUE_SIZE", 1)
+    yield IngestionService()
+    registry.get_vector_store().stop_persister()
+
+
+def _ingest(service, docs):
+    """Run ingest_documents in a thread; fail instead of hanging on a deadlock."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = service.ingest_documents(docs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(30)
+    assert not worker.is_alive(), "ingest_documents did not return"
+    return outcome
+
+
+def _docs(n, fail_at=None):
+    for i in range(n):
+        if i == fail_at:
+            raise ValueError("unreadable upload")
+        yield {"text": f"Pipeline document {uuid.uuid4().hex} number {i}."}
+
+
+def test_put_gives_up_once_stopped():
+    q, stop = queue.Queue(maxsize=1), threading.Event()
+    assert _put(q, 1, stop)
+    stop.set()
+    assert not _put(q, 2, stop)
+    # the end marker still gets through, displacing an item nobody will read
+    assert _put(q, _DONE, stop, force=True)
+    assert q.get_nowait() is _DONE and q.empty()
+
+
+def test_drain_stops_at_end_marker_or_stop():
+    q, stop = queue.Queue(), threading.Event()
+    for item in (1, 2, _DONE, 3):
+        q.put(item)
+    assert list(_drain(q, stop)) == [1, 2]
+    stop.set()
+    assert list(_drain(q, stop)) == []
+
+
+def test_pipeline_ingests_every_document(service):
+    outcome = _ingest(service, _docs(12))
+    assert outcome == {"result": 12}
+
+
+def test_producer_error_reaches_caller(service):
+    outcome = _ingest(service, _docs(50, fail_at=5))
+    assert isinstance(outcome.get("error"), ValueError)
+
+
+def test_embed_error_reaches_caller(service, monkeypatch):
+    def get_embeddings(texts, persist=False):
+        raise RuntimeError("embedder crashed")
+
+    monkeypatch.setattr(service.openai, "get_embeddings", get_embeddings)
+    outcome = _ingest(service, _docs(50))
+    assert str(outcome.get("error")) == "embedder crashed"
+
+
+def test_persist_error_stops_the_stages(service, monkeypatch):
+    # both queues are full when the consumer fails, so the stages must not
+    # block on them forever
+    def persist(*args):
+        time.sleep(0.2)
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(service, "_persist_batch", persist)
+    outcome = _ingest(service, _docs(50))
+    assert str(outcome.get("error")) == "database went away"
+    assert not any(t.name.startswith("ingest-") for t in threading.enumerate())
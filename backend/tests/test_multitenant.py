@@ -1,5 +1,10 @@
+import os
+import pickle
 import sys
 import uuid
+
+import faiss
+import numpy as np
 # ensure the project root is on the path when tests run inside container
 sys.path.insert(0, "/app")
 from fastapi.testclient import TestClient
@@ -10,6 +15,12 @@ from app.models.chat import Conversation
 from app.models.user import User
 from app.models.organization import Organization
 from app.models.usage_log import UsageLog
+from app.models.document import Document
+from app.core.config import settings
+from app.rag.vector_store import FaissVectorStore, partition_key
+from app.services import registry
+from app.services.ingestion_service import IngestionService
+from app.services.openai_service import OpenAIService
 
 client = TestClient(app)
 
@@ -133,3 +144,68 @@ def test_admin_scoping():
     # our org-specific count should not exceed global count
     assert summary["total_requests_24h"] <= global_summary["total_requests_24h"]
     assert summary["total_requests_24h"] >= 1
+
+
+def _organization(prefix):
+    db = SessionLocal()
+    try:
+        org = Organization(name=f"{prefix}-{uuid.uuid4().hex[:8]}")
+        db.add(org)
+        db.commit()
+        return org.id
+    finally:
+        db.close()
+
+
+def test_search_stays_in_partition():
+    org_a, org_b = _organization("SearchA"), _organization("SearchB")
+    # B holds many more (and closer) chunks, which used to crowd A's hits
+    # out of a shared index before the organization filter applied
+    query = "How many vacation days do employees get?"
+    IngestionService().ingest_texts([f"Policy {i}. {query}" for i in range(40)], organization_id=org_b)
+    IngestionService().ingest_texts([f"Handbook section {i} on leave." for i in range(8)], organization_id=org_a)
+    db = SessionLocal()
+    try:
+        docs_a = {d.id for d in db.query(Document).filter(Document.organization_id == org_a)}
+    finally:
+        db.close()
+    try:
+        emb = OpenAIService().get_embeddings([query])[0]
+        hits = registry.get_vector_store().search(emb, top_k=5, organization_id=org_a)
+        assert len(hits) == 5
+        assert {doc_id for doc_id, _, _ in hits} <= docs_a
+    finally:
+        registry.get_vector_store().stop_persister()
+
+
+def test_migrate_legacy_splits_by_organization(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_DIR", str(tmp_path))
+    vectors = np.random.default_rng(0).standard_normal((6, settings.EMBEDDING_DIM)).astype(np.float32)
+    legacy = faiss.IndexFlatL2(settings.EMBEDDING_DIM)
+    legacy.add(vectors)
+    faiss.write_index(legacy, str(tmp_path / "index.faiss"))
+    # position -> (document_id, chunk_index); document 99 no longer exists
+    mapping = {0: (1, 0), 1: (1, 1), 2: (2, 0), 3: (3, 0), 4: (3, 1), 5: (99, 0)}
+    with open(tmp_path / "mapping.pkl", "wb") as f:
+        pickle.dump(mapping, f)
+    document_orgs = {1: 10, 2: 20, 3: None}
+
+    store = FaissVectorStore()
+    try:
+        store.migrate_legacy(document_orgs)
+        assert sorted(store.partition_keys) == sorted(partition_key(o) for o in (10, 20, None))
+        assert store.ntotal == 5
+        assert not os.path.exists(tmp_path / "index.faiss")
+        assert not os.path.exists(tmp_path / "mapping.pkl")
+        for org in (10, 20):
+            for pos in range(5):
+                doc_id, chunk_index = mapping[pos]
+                if document_orgs[doc_id] != org:
+                    continue
+                hits = store.search(vectors[pos], top_k=10, organization_id=org)
+                assert hits[0][:2] == (doc_id, chunk_index)
+                assert {h[0] for h in hits} == {d for d, o in document_orgs.items() if o == org}
+    finally:
+        store.release_writer()
+    # the split was flushed, so a fresh process reads the same partitions
+    assert FaissVectorStore().ntotal == 5
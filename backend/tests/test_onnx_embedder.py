@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+SentenceTransformer = pytest.importorskip("sentence_transformers").SentenceTransformer
+
+from app.core import config
+from app.services import onnx_embedder
+
+TEXTS = [
+    "What is the refund policy for annual plans?",
+    "Aadya indexes each organization's documents separately.",
+    "short",
+    " ".join(["a long passage that will be truncated to the model limit"] * 60),
+]
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    out = tmp_path_factory.mktemp("onnx") / "model"
+    onnx_embedder.export_model(config.settings.EMBEDDING_MODEL, str(out))
+    onnx_embedder.quantize_model(str(out))
+    return str(out)
+
+
+@pytest.fixture(scope="module")
+def reference():
+    model = SentenceTransformer(config.settings.EMBEDDING_MODEL, device="cpu")
+    return model.encode(TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def _cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def test_onnx_matches_torch(exported, reference):
+    emb = onnx_embedder.OnnxEmbedder(exported).encode(TEXTS, batch_size=2, normalize_embeddings=True)
+    assert emb.dtype == np.float32 and emb.shape == reference.shape
+    assert np.allclose(emb, reference, atol=1e-4)
+
+
+def test_int8_stays_close_to_torch(exported, reference):
+    emb = onnx_embedder.OnnxEmbedder(exported, quantized=True).encode(TEXTS, normalize_embeddings=True)
+    assert _cosine(emb, reference).min() > 0.98
+
+
+def test_single_sentence_and_tokenizer(exported):
+    embedder = onnx_embedder.OnnxEmbedder(exported)
+    assert embedder.encode("hello").shape == (embedder.get_sentence_embedding_dimension(),)
+    enc = embedder.tokenizer(["hello world"], add_special_tokens=False, return_offsets_mapping=True)
+    assert enc["offset_mapping"][0][-1][1] == len("hello world")
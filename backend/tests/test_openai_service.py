@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache, content_hash
+from app.services.openai_service import OpenAIService
+
+
+def _vector(text):
+    """Distinct, recognizable embedding per text."""
+    return np.array([len(text), sum(map(ord, text)) % 997, 1.0], dtype=np.float32)
+
+
+class _Embedder:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        assert len(texts) <= batch_size
+        self.batches.append(list(texts))
+        return np.stack([_vector(t) for t in texts])
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_SIZE", 2)
+    openai = OpenAIService()
+    monkeypatch.setattr(openai, "embedder", _Embedder())
+    monkeypatch.setattr(openai, "cache", EmbeddingCache(100, "order-test", persist=False))
+    return openai
+
+
+def test_encode_restores_input_order(service):
+    texts = ["a much longer sentence than the rest", "hi", "medium text", "x", "four words in here"]
+    out = service._encode(texts)
+    np.testing.assert_array_equal(out, np.stack([_vector(t) for t in texts]))
+    # batches were cut from the length-sorted texts
+    assert service.embedder.batches == [
+        ["x", "hi"], ["medium text", "four words in here"], ["a much longer sentence than the rest"],
+    ]
+    assert out.dtype == np.float32
+
+
+def test_cache_hits_and_duplicates_keep_order(service):
+    service.cache.put_many({content_hash("cached one"): _vector("cached one")})
+    texts = ["zz", "cached one", "a longer uncached text", "zz", "q"]
+    out = service.get_embeddings(texts)
+    np.testing.assert_array_equal(out, np.stack([_vector(t) for t in texts]))
+    # the cached text and the repeated one are encoded not at all / once
+    encoded = [t for batch in service.embedder.batches for t in batch]
+    assert sorted(encoded) == ["a longer uncached text", "q", "zz"]
+
+
+def test_no_texts(service):
+    out = service.get_embeddings([])
+    assert out.shape == (0, settings.EMBEDDING_DIM) and not service.embedder.batches
@@ -0,0 +1,64 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.query_batcher import QueryBatcher
+
+
+class _Recorder:
+    """``embed_fn`` that maps the text "i" to the vector [i] and logs each call."""
+
+    def __init__(self):
+        self.calls = []
+        self.threads = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        self.threads.append(threading.current_thread())
+        return np.array([[float(t)] for t in texts], dtype=np.float32)
+
+
+def test_batches_split_at_max_size_in_order():
+    embed = _Recorder()
+    batcher = QueryBatcher(embed, max_batch=4, max_wait=0.2)
+    try:
+        futures = [batcher.submit(str(i)) for i in range(10)]
+        vectors = [f.result(timeout=5) for f in futures]
+    finally:
+        batcher.close()
+    # every caller gets its own text's vector back
+    assert [float(v[0]) for v in vectors] == list(range(10))
+    assert [len(c) for c in embed.calls] == [4, 4, 2]
+    assert sum(embed.calls, []) == [str(i) for i in range(10)]
+
+
+def test_unbatched_calls_run_in_caller_thread():
+    embed = _Recorder()
+    batcher = QueryBatcher(embed, max_batch=1, max_wait=0.2)
+    assert float(batcher.embed("3")[0]) == 3.0
+    assert embed.calls == [["3"]]
+    assert embed.threads == [threading.current_thread()]
+
+
+def test_failure_reaches_every_caller_in_the_batch():
+    def embed(texts):
+        raise RuntimeError("encoder down")
+
+    batcher = QueryBatcher(embed, max_batch=8, max_wait=0.1)
+    try:
+        futures = [batcher.submit(str(i)) for i in range(3)]
+        for f in futures:
+            with pytest.raises(RuntimeError, match="encoder down"):
+                f.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_close_encodes_queued_queries():
+    embed = _Recorder()
+    batcher = QueryBatcher(embed, max_batch=16, max_wait=10.0)
+    futures = [batcher.submit(str(i)) for i in range(3)]
+    batcher.close()
+    assert all(f.done() for f in futures)
+    assert sum(embed.calls, []) == ["0", "1", "2"]
@@ -0,0 +1,73 @@
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import DocumentChunk
+from app.models.organization import Organization
+from app.services.rag_service import RAGService
+
+
+def _organization():
+    db = SessionLocal()
+    try:
+        org = Organization(name=f"Rag-{uuid.uuid4().hex[:8]}")
+        db.add(org)
+        db.commit()
+        return org.id
+    finally:
+        db.close()
+
+
+def _add_chunks(org_id, document_id, n):
+    db = SessionLocal()
+    try:
+        db.add_all(
+            DocumentChunk(
+                document_id=document_id,
+                chunk_index=i,
+                content=f"doc {document_id} chunk {i}",
+                source="test",
+                page=i + 1,
+                organization_id=org_id,
+            )
+            for i in range(n)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def two_orgs():
+    base = uuid.uuid4().int % 10**8 + 10**8
+    own, other = _organization(), _organization()
+    _add_chunks(own, base, 4)
+    _add_chunks(other, base + 1, 2)
+    return own, other, base
+
+
+def test_fetch_chunks_filters_by_organization(two_orgs):
+    own, other, doc = two_orgs
+    keys = [(doc, 2), (doc + 1, 0), (doc, 0), (doc + 99, 0)]
+    db = SessionLocal()
+    try:
+        rows = RAGService._fetch_chunks(db, keys, own)
+        assert set(rows) == {(doc, 2), (doc, 0)}
+        assert rows[(doc, 2)].content == f"doc {doc} chunk 2" and rows[(doc, 2)].page == 3
+        # without an organization every matching row is returned
+        assert set(RAGService._fetch_chunks(db, keys, None)) == {(doc, 2), (doc + 1, 0), (doc, 0)}
+    finally:
+        db.close()
+
+
+def test_results_keep_ranked_order(two_orgs, monkeypatch):
+    monkeypatch.setattr(settings, "HYBRID_SEARCH", False)
+    own, other, doc = two_orgs
+    hits = [(doc, 3, 0.1), (doc + 1, 1, 0.2), (doc, 0, 0.3), (doc, 2, 0.4), (doc, 1, 0.5)]
+    results = RAGService()._load_results(hits, [], 4, own, None)
+    # the other organization's chunk is dropped, not replaced by a fifth hit
+    assert [(r["document_id"], r["chunk_index"]) for r in results] == [(doc, 3), (doc, 0), (doc, 2)]
+    assert [r["score"] for r in results] == [0.1, 0.3, 0.4]
+    assert results[0]["content"] == f"doc {doc} chunk 3"
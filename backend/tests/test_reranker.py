@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import reranker as reranker_module
+from app.services.reranker import Reranker
+
+PAIR_SECONDS = 0.01
+
+
+class _CrossEncoder:
+    """Scores by the number in the content; each pair costs PAIR_SECONDS on the fake clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.scored = []
+
+    def predict(self, pairs, **kwargs):
+        self.scored.append(len(pairs))
+        self.clock.now += PAIR_SECONDS * len(pairs)
+        return [float(content.split()[-1]) for _, content in pairs]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    clock.perf_counter = lambda: clock.now
+    monkeypatch.setattr(reranker_module, "time", clock)
+    return clock
+
+
+def _results(scores):
+    return [{"document_id": i, "content": f"chunk {s}"} for i, s in enumerate(scores)]
+
+
+def test_scores_everything_until_cost_is_known(clock):
+    model = _CrossEncoder(clock)
+    rr = Reranker(model, budget_seconds=0.05)
+    out = rr.rerank("q", _results([1, 9, 3, 7]), top_n=2)
+    assert [r["document_id"] for r in out] == [1, 3]
+    assert out[0]["rerank_score"] == 9.0
+    assert model.scored == [4]
+    assert rr._pair_seconds == pytest.approx(PAIR_SECONDS)
+
+
+def test_budget_limits_scored_candidates(clock):
+    model = _CrossEncoder(clock)
+    rr = Reranker(model, budget_seconds=0.05)
+    rr._record(PAIR_SECONDS)
+    assert rr._affordable(30, 3) == 5
+    # never fewer than top_n, however tight the budget
+    assert rr._affordable(30, 8) == 8
+    assert rr._affordable(4, 3) == 4
+
+    # candidates past the affordable prefix are never scored, however good
+    out = rr.rerank("q", _results([2, 5, 1, 4, 3, 99, 98, 97]), top_n=3)
+    assert model.scored == [5]
+    assert [r["document_id"] for r in out] == [1, 3, 4]
+
+
+def test_no_budget_scores_everything(clock):
+    model = _CrossEncoder(clock)
+    rr = Reranker(model, budget_seconds=0)
+    rr._record(PAIR_SECONDS)
+    assert rr._affordable(30, 3) == 30
+
+
+def test_cost_estimate_follows_measurements(clock):
+    rr = Reranker(_CrossEncoder(clock), budget_seconds=0.05)
+    rr._record(0.01)
+    rr._record(0.02)
+    assert rr._pair_seconds == pytest.approx(0.012)
+
+
+def test_single_result_not_scored(clock):
+    model = _CrossEncoder(clock)
+    results = _results([4])
+    assert Reranker(model).rerank("q", results, top_n=3) == results
+    assert model.scored == []
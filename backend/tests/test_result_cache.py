@@ -0,0 +1,132 @@
+import time
+import uuid
+
+import pytest
+
+import app.models.user  # noqa: F401  (register FK targets)
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.organization import Organization
+from app.rag.vector_store import FaissVectorStore
+from app.services import corpus_version, registry
+from app.services.ingestion_service import IngestionService
+from app.services.rag_service import RAGService
+from app.services.result_cache import ResultCache
+
+HITS = [{"document_id": 1, "chunk_index": 0, "content": "Refunds take ten days.", "score": 0.2}]
+
+
+def _organization():
+    db = SessionLocal()
+    try:
+        org = Organization(name=f"Cache-{uuid.uuid4().hex[:8]}")
+        db.add(org)
+        db.commit()
+        return org.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def release_faiss_writer():
+    yield
+    registry.get_vector_store().stop_persister()
+
+
+def test_hit_at_same_version():
+    cache = ResultCache(max_entries=8, ttl_seconds=60)
+    key = cache.key(1, "refund time", 5)
+    assert cache.get(key, 3) is None
+    cache.put(key, 3, HITS)
+    assert cache.get(key, 3) == HITS
+
+
+def test_key_ignores_case_and_whitespace_only():
+    cache = ResultCache(max_entries=8, ttl_seconds=60)
+    cache.put(cache.key(1, "Refund  time", 5), 3, HITS)
+    assert cache.get(cache.key(1, " refund time ", 5), 3) == HITS
+    assert cache.get(cache.key(2, "refund time", 5), 3) is None
+    assert cache.get(cache.key(1, "refund time", 3), 3) is None
+
+
+def test_other_version_misses_and_evicts():
+    cache = ResultCache(max_entries=8, ttl_seconds=60)
+    key = cache.key(1, "refund time", 5)
+    cache.put(key, 3, HITS)
+    assert cache.get(key, 4) is None
+    assert len(cache) == 0
+
+
+def test_expired_entry_misses(monkeypatch):
+    cache = ResultCache(max_entries=8, ttl_seconds=60)
+    key = cache.key(1, "refund time", 5)
+    cache.put(key, 3, HITS)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get(key, 3) is None
+    assert len(cache) == 0
+
+
+def test_callers_cannot_change_cached_hits():
+    cache = ResultCache(max_entries=8, ttl_seconds=60)
+    key = cache.key(1, "refund time", 5)
+    cache.put(key, 3, HITS)
+    cache.get(key, 3)[0]["score"] = 99
+    assert cache.get(key, 3) == HITS
+
+
+def test_least_recently_used_evicted():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    a, b, c = (cache.key(1, q, 5) for q in ("a", "b", "c"))
+    cache.put(a, 1, HITS)
+    cache.put(b, 1, HITS)
+    cache.get(a, 1)
+    cache.put(c, 1, HITS)
+    assert cache.get(b, 1) is None
+    assert cache.get(a, 1) == HITS and cache.get(c, 1) == HITS
+
+
+def test_zero_size_disables():
+    cache = ResultCache(max_entries=0, ttl_seconds=60)
+    key = cache.key(1, "refund time", 5)
+    cache.put(key, 3, HITS)
+    assert cache.get(key, 3) is None
+
+
+def test_snapshot_carries_corpus_version(release_faiss_writer):
+    org = _organization()
+    IngestionService().ingest_texts(["Expense reports are due on Fridays."], organization_id=org)
+    writer = registry.get_vector_store()
+    assert writer.snapshot_version(org) == corpus_version.current(org)
+    assert writer.snapshot_version(None) == corpus_version.current(None)
+
+    reader = FaissVectorStore()
+    assert not reader.is_writer
+    writer.flush()
+    reader.refresh()
+    assert reader.snapshot_version(org) == corpus_version.current(org)
+    assert reader.snapshot_version(None) == corpus_version.current(None)
+
+
+def test_results_cached_only_once_snapshot_caught_up(monkeypatch, release_faiss_writer):
+    monkeypatch.setattr(settings, "FAISS_RELOAD_CHECK_SECONDS", 0)
+    org = _organization()
+    writer = registry.get_vector_store()
+    reader = FaissVectorStore()
+    IngestionService().ingest_texts(["Expense reports are due on Fridays."], organization_id=org)
+    version = corpus_version.current(org)
+    rag = RAGService()
+    rag.vs = reader
+    cache = registry.get_result_cache()
+    key = cache.key(org, "expense reports", 5)
+
+    # the reader has not seen the ingest yet: its hits must not be cached
+    assert reader.snapshot_version(org) < version
+    rag.search("expense reports", top_k=5, org_id=org)
+    assert cache.get(key, version) is None
+
+    writer.flush()
+    reader.refresh()
+    hits = rag.search("expense reports", top_k=5, org_id=org)
+    assert hits
+    assert cache.get(key, version) == hits
@@ -0,0 +1,438 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.rag import rebuild_index, vector_store
+from app.rag.vector_store import FaissVectorStore, IdMap, _RWLock, build_index, index_kind, is_ivf
+
+DIM = 8
+
+
+def _vectors(n, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, DIM)).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def faiss_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def stores(faiss_dir):
+    """Build stores on ``faiss_dir``; every one releases the writer lock afterwards."""
+    made = []
+
+    def make():
+        store = FaissVectorStore(dim=DIM)
+        made.append(store)
+        return store
+
+    yield make
+    for store in made:
+        store.stop_persister()
+
+
+def test_second_writer_refused(stores):
+    first, second = stores(), stores()
+    assert first.acquire_writer()
+    assert not second.acquire_writer()
+    assert first.is_writer and not second.is_writer
+    first.release_writer()
+    assert second.acquire_writer()
+
+
+def test_mutations_without_the_lock_raise(stores):
+    writer, other = stores(), stores()
+    writer.add(_vectors(2), [(1, 0), (1, 1)], organization_id=1)
+    assert writer.is_writer
+    for change in (
+        lambda: other.add(_vectors(1), [(2, 0)], organization_id=1),
+        lambda: other.remove_documents([1], organization_id=1),
+        lambda: other.stamp_corpus_version(1, 2, 2),
+        lambda: other.rebuild("org_1", "flat"),
+        other.clear,
+    ):
+        with pytest.raises(RuntimeError, match="writer lock"):
+            change()
+    assert other.ntotal == 0 and writer.ntotal == 2
+
+
+def test_compact_is_a_no_op_for_readers(stores):
+    writer, reader = stores(), stores()
+    writer.add(_vectors(1), [(1, 0)])
+    assert reader.compact() == []
+
+
+def test_persister_flushes_on_stop(stores):
+    writer = stores()
+    writer.start_persister(interval=3600)
+    writer.add(_vectors(3), [(7, 0), (7, 1), (7, 2)], organization_id=4)
+    writer.stamp_corpus_version(4, 5, 9)
+    assert writer.dirty
+    writer.stop_persister()
+    assert not writer.dirty and not writer.is_writer
+
+    reader = stores()
+    assert reader.ntotal == 3
+    assert reader.snapshot_version(4) == 5 and reader.snapshot_version(None) == 9
+    # the lock was handed back, so the next process can write
+    assert reader.acquire_writer()
+
+
+def test_persister_flushes_on_interval(stores):
+    writer = stores()
+    writer.add(_vectors(1), [(1, 0)])
+    writer.start_persister(interval=0.05)
+    deadline = time.time() + 5
+    while writer.dirty and time.time() < deadline:
+        time.sleep(0.05)
+    assert not writer.dirty
+    assert stores().ntotal == 1
+
+
+def test_rwlock_readers_share():
+    lock = _RWLock()
+    entered = threading.Event()
+
+    def read():
+        with lock.read():
+            entered.set()
+
+    with lock.read():
+        threading.Thread(target=read).start()
+        assert entered.wait(1)
+
+
+def test_rwlock_waiting_writer_blocks_new_readers():
+    lock = _RWLock()
+    order = []
+
+    def write():
+        with lock.write():
+            order.append("write")
+
+    def read():
+        with lock.read():
+            order.append("read")
+
+    with lock.read():
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not lock._writers_waiting:
+            time.sleep(0.01)
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(0.2)
+        # neither may run while the first reader holds the lock
+        assert reader.is_alive() and order == []
+    writer.join(1)
+    reader.join(1)
+    assert order == ["write", "read"]
+
+
+def _meta(n, first_doc=1):
+    return [(first_doc + i // 10, i % 10) for i in range(n)]
+
+
+def _part(store, key):
+    return store._partitions[key]
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivfflat", "ivfpq", "hnswflat"])
+def test_build_index_kinds(kind, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_PQ_M", 4)
+    index = build_index(kind, DIM, 1000)
+    assert index_kind(index) == kind and index.d == DIM
+    assert is_ivf(index) == (kind in ("ivfflat", "ivfpq"))
+
+
+def test_ivf_list_count(monkeypatch):
+    def nlist(n):
+        return faiss.extract_index_ivf(build_index("ivfflat", DIM, n)).nlist
+
+    assert nlist(10**6) == 4000  # 4 * sqrt(n)
+    # ... but at least 39 training points per list
+    assert nlist(10000) == 256 and nlist(100) == 2 and nlist(0) == 1
+    monkeypatch.setattr(settings, "FAISS_IVF_NLIST", 64)
+    assert nlist(10**6) == 64 and nlist(100) == 2
+
+
+@pytest.mark.parametrize("kind", ["ivfflat", "ivfpq", "hnswflat"])
+def test_rebuild_keeps_labels_and_ids(kind, stores, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_PQ_M", 4)
+    monkeypatch.setattr(settings, "FAISS_PQ_NBITS", 4)
+    monkeypatch.setattr(settings, "FAISS_NPROBE", 64)
+    store = stores()
+    vectors = _vectors(600)
+    store.add(vectors, _meta(600), organization_id=1)
+    before = _part(store, "org_1").ids.array.copy()
+    store.rebuild("org_1", kind)
+
+    part = _part(store, "org_1")
+    assert index_kind(part.index) == kind and part.index.ntotal == 600
+    np.testing.assert_array_equal(part.ids.array, before)
+    hits = store.search(vectors[123], top_k=10, organization_id=1)
+    if kind == "ivfpq":
+        # PQ codes are lossy, so only expect the vector among the neighbours
+        assert (13, 3) in [(d, c) for d, c, _ in hits]
+    else:
+        assert hits[0][:2] == (13, 3) and hits[0][2] == pytest.approx(0, abs=1e-4)
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivfflat", "hnswflat"])
+def test_rebuild_drops_tombstones(kind, stores):
+    store = stores()
+    vectors = _vectors(600)
+    store.add(vectors, _meta(600), organization_id=1)
+    assert store.remove_documents([2, 3], organization_id=1) == 20
+    store.rebuild("org_1", kind)
+
+    part = _part(store, "org_1")
+    assert len(part.ids) == 580 and part.dead == 0 and store.ntotal == 580
+    assert not np.isin(part.ids.array[:, 0], [2, 3]).any()
+    # survivors are renumbered densely, in their old order
+    assert part.ids.array[10].tolist() == [4, 0]
+    assert store.search(vectors[30], top_k=1, organization_id=1)[0][:2] == (4, 0)
+    assert all(d not in (2, 3) for d, _, _ in store.search(vectors[15], top_k=20, organization_id=1))
+
+
+def test_partition_upgraded_at_threshold(stores, monkeypatch):
+    monkeypatch.setattr(settings, "FAISS_INDEX_TYPE", "ivfflat")
+    monkeypatch.setattr(settings, "FAISS_TRAIN_MIN_VECTORS", 400)
+    store = stores()
+    store.add(_vectors(399), _meta(399), organization_id=1)
+    assert index_kind(_part(store, "org_1").index) == "flat"
+    store.add(_vectors(1, seed=1), [(99, 0)], organization_id=1)
+    part = _part(store, "org_1")
+    assert index_kind(part.index) == "ivfflat" and part.index.ntotal == 400
+    # later adds go into the upgraded index with explicit labels
+    store.add(_vectors(5, seed=2), _meta(5, first_doc=200), organization_id=1)
+    assert part.index.ntotal == 405 and len(part.ids) == 405
+    assert store.search(_vectors(5, seed=2)[4], top_k=1, organization_id=1, nprobe=64)[0][:2] == (200, 4)
+
+
+def test_vectors_added_during_training_are_copied(stores, monkeypatch):
+    store = stores()
+    store.add(_vectors(500), _meta(500), organization_id=1)
+    late = _vectors(3, seed=7)
+    original = vector_store.build_index
+
+    def build_after_add(*args, **kwargs):
+        # runs while rebuild trains without the write lock
+        store.add(late, [(900, 0), (900, 1), (900, 2)], organization_id=1)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(vector_store, "build_index", build_after_add)
+    store.rebuild("org_1", "ivfflat")
+
+    part = _part(store, "org_1")
+    assert part.index.ntotal == 503 and len(part.ids) == 503
+    assert part.ids.array[-3:].tolist() == [[900, 0], [900, 1], [900, 2]]
+    assert store.search(late[1], top_k=1, organization_id=1, nprobe=64)[0][:2] == (900, 1)
+
+
+def test_rebuild_unknown_kind(stores):
+    with pytest.raises(ValueError, match="unknown faiss index type"):
+        stores().rebuild("org_1", "annoy")
+
+
+def test_rebuild_index_cli(stores, monkeypatch, capsys):
+    monkeypatch.setattr(settings, "EMBEDDING_DIM", DIM)
+    writer = stores()
+    writer.add(_vectors(500), _meta(500), organization_id=1)
+    writer.add(_vectors(20, seed=1), _meta(20, first_doc=700), organization_id=2)
+    writer.stop_persister()
+
+    monkeypatch.setattr(sys, "argv", ["rebuild_index", "--type", "hnswflat", "--org", "1"])
+    rebuild_index.main()
+    assert capsys.readouterr().out.strip() == "rebuilt org_1 as hnswflat"
+
+    reader = stores()
+    assert index_kind(_part(reader, "org_1").index) == "hnswflat"
+    assert index_kind(_part(reader, "org_2").index) == "flat"
+    assert reader.ntotal == 520
+    assert reader.search(_vectors(500)[42], top_k=1, organization_id=1)[0][:2] == (5, 2)
+    # the CLI released the writer lock
+    assert reader.acquire_writer()
+
+
+def test_rebuild_index_cli_refuses_while_locked(stores, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIM", DIM)
+    assert stores().acquire_writer()
+    monkeypatch.setattr(sys, "argv", ["rebuild_index", "--type", "ivfflat"])
+    with pytest.raises(SystemExit, match="holds the faiss writer lock"):
+        rebuild_index.main()
+
+
+def test_idmap_append_grows():
+    ids = IdMap()
+    ids.append([(1, 0), (1, 1)])
+    assert len(ids) == 2 and len(ids._data) == 1024
+    ids.append(_meta(2000, first_doc=5))
+    assert len(ids) == 2002 and len(ids._data) == 2048
+    assert ids.array[:3].tolist() == [[1, 0], [1, 1], [5, 0]]
+    assert ids.array[-1].tolist() == [5 + 1999 // 10, 9]
+
+
+def test_idmap_tombstones():
+    ids = IdMap()
+    ids.append(_meta(30))
+    ids.clear(np.array([10, 12]))
+    assert ids.dead_labels().tolist() == [10, 12]
+    assert ids.array[10].tolist() == [-1, -1] and ids.array[11].tolist() == [2, 1]
+
+
+def test_idmap_lookup_skips_unmapped_labels():
+    ids = IdMap()
+    ids.append(_meta(30))
+    ids.clear(np.array([4]))
+    # FAISS pads missing results with -1; labels past the map and
+    # tombstoned labels never resolve either
+    valid, rows = ids.lookup(np.array([3, -1, 4, 29, 30, 0]))
+    assert valid.tolist() == [True, False, False, True, False, True]
+    assert rows.tolist() == [[1, 3], [3, 9], [1, 0]]
+    valid, rows = ids.lookup(np.array([-1, -1]))
+    assert not valid.any() and rows.shape == (0, 2)
+
+
+def test_idmap_reload_from_mmap(tmp_path):
+    ids = IdMap()
+    ids.append(_meta(50))
+    ids.clear(np.array([7]))
+    path = str(tmp_path / "ids.npy")
+    np.save(path, ids.array)
+
+    loaded = IdMap.load(path)
+    assert isinstance(loaded._data, np.memmap) and not loaded._data.flags.writeable
+    np.testing.assert_array_equal(loaded.array, ids.array)
+    assert loaded.dead_labels().tolist() == [7]
+    # changes copy out of the read-only mapping instead of failing
+    loaded.append([(99, 0)])
+    loaded.clear(np.array([0]))
+    assert len(loaded) == 51 and loaded.array[-1].tolist() == [99, 0]
+    assert loaded.dead_labels().tolist() == [0, 7]
+    assert np.load(path)[0].tolist() == [1, 0]
+
+
+def test_idmap_from_legacy_dict():
+    ids = IdMap.from_dict({0: (3, 0), 2: (3, 1), 9: (4, 0)}, 3)
+    assert len(ids) == 3
+    assert ids.array.tolist() == [[3, 0], [-1, -1], [3, 1]]
+    valid, rows = ids.lookup(np.array([0, 1, 2]))
+    assert valid.tolist() == [True, False, True] and rows.tolist() == [[3, 0], [3, 1]]
+
+
+def _snapshot_files(faiss_dir):
+    return sorted(p.name for p in (faiss_dir / "partitions").iterdir() if p.name != "manifest.json")
+
+
+def test_reader_maps_ivf_snapshots(stores, faiss_dir, monkeypatch):
+    writer = stores()
+    writer.add(_vectors(500), _meta(500), organization_id=1)
+    writer.rebuild("org_1", "ivfflat")
+    writer.add(_vectors(5, seed=1), _meta(5, first_doc=300), organization_id=2)
+    writer.flush()
+
+    reads = []
+    read_index = faiss.read_index
+
+    def spy(path, *flags):
+        reads.append((os.path.basename(path), flags))
+        return read_index(path, *flags)
+
+    monkeypatch.setattr(faiss, "read_index", spy)
+    reader = stores()
+    assert sorted(reads) == [("org_1.1.faiss", (faiss.IO_FLAG_MMAP,)), ("org_2.1.faiss", (faiss.IO_FLAG_MMAP,))]
+    assert isinstance(_part(reader, "org_1").ids._data, np.memmap)
+    assert reader.search(_vectors(500)[77], top_k=1, organization_id=1, nprobe=64)[0][:2] == (8, 7)
+
+    # becoming the writer rereads the partitions unmapped, since they change
+    reads.clear()
+    writer.release_writer()
+    assert reader.acquire_writer()
+    assert sorted(reads) == [("org_1.1.faiss", ()), ("org_2.1.faiss", ())]
+
+
+def test_reader_follows_generations(stores, faiss_dir):
+    writer, reader = stores(), stores()
+    writer.add(_vectors(3), _meta(3), organization_id=1)
+    writer.add(_vectors(3, seed=1), _meta(3, first_doc=50), organization_id=2)
+    writer.stamp_corpus_version(1, 1, 2)
+    writer.flush()
+    assert reader.refresh() == 2
+    assert reader._generation == 1 and reader.ntotal == 6 and reader.snapshot_version(1) == 1
+
+    # only the changed partition gets a new generation and is reread
+    writer.add(_vectors(1, seed=2), [(1, 3)], organization_id=1)
+    writer.stamp_corpus_version(1, 2, 3)
+    kept = _part(reader, "org_2")
+    assert reader.refresh() == 0 and reader.ntotal == 6
+    writer.flush()
+    with open(faiss_dir / "partitions" / "manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["generation"] == 2
+    assert manifest["partitions"] == {"org_1": {"generation": 2}, "org_2": {"generation": 1}}
+    assert reader.refresh() == 1
+    assert reader._generation == 2 and reader.ntotal == 7 and reader.snapshot_version(1) == 2
+    assert _part(reader, "org_2") is kept
+    assert reader.search(_vectors(1, seed=2)[0], top_k=1, organization_id=1)[0][:2] == (1, 3)
+
+    # the writer never reloads its own snapshots
+    assert writer.refresh() == 0
+
+    # clearing publishes an empty manifest, so readers drop everything
+    writer.clear()
+    assert reader.refresh() == 0 and reader.ntotal == 0 and reader.partition_keys == []
+
+
+def test_previous_generation_kept_for_readers(stores, faiss_dir):
+    writer, reader = stores(), stores()
+    vectors = _vectors(500)
+    writer.add(vectors, _meta(500), organization_id=1)
+    writer.rebuild("org_1", "ivfflat")
+    writer.flush()
+    reader.refresh()
+
+    writer.add(_vectors(1, seed=1), [(900, 0)], organization_id=1)
+    writer.flush()
+    # a reader may still be opening generation 1 from the old manifest
+    assert _snapshot_files(faiss_dir) == [
+        "org_1.1.faiss", "org_1.1.ids.npy", "org_1.2.faiss", "org_1.2.ids.npy",
+    ]
+    writer.add(_vectors(1, seed=2), [(901, 0)], organization_id=1)
+    writer.flush()
+    assert _snapshot_files(faiss_dir) == [
+        "org_1.2.faiss", "org_1.2.ids.npy", "org_1.3.faiss", "org_1.3.ids.npy",
+    ]
+    # the reader's mapped generation 1 stays usable until it reloads
+    assert _part(reader, "org_1").generation == 1
+    assert reader.search(vectors[5], top_k=1, organization_id=1, nprobe=64)[0][:2] == (1, 5)
+    reader.refresh()
+    assert _part(reader, "org_1").generation == 3 and reader.ntotal == 502
+
+
+def test_reader_retries_when_generation_removed(stores, faiss_dir, monkeypatch):
+    writer, reader = stores(), stores()
+    writer.add(_vectors(2), _meta(2), organization_id=1)
+    writer.flush()
+    with open(faiss_dir / "partitions" / "manifest.json") as f:
+        stale = json.load(f)
+    for seed in (1, 2):
+        writer.add(_vectors(1, seed=seed), [(5, seed)], organization_id=1)
+        writer.flush()
+
+    # the first read sees the manifest of a generation already removed
+    manifests = [stale]
+    read_manifest = reader._read_manifest
+    monkeypatch.setattr(reader, "_read_manifest", lambda: manifests.pop() if manifests else read_manifest())
+    assert reader.refresh() == 1
+    assert _part(reader, "org_1").generation == 3 and reader.ntotal == 4